@@ -1,15 +1,39 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Header, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
+from typing import List, Optional
+import codecs
+import json
+import math
 import time
-from app.utils.chunker import chunk_text
+from app.utils.chunker import StreamingChunker
 from app.embeddings import get_embeddings
-from app.vectorstore import search, add_embeddings, get_existing_sources, deduplicate_index
+from app.vectorstore import (
+    search, get_existing_sources, deduplicate_index, get_vectors, save_index, reload_index,
+    apply_changes, content_hash, get_doc_chunks,
+)
 from app.reranker import rerank
-from app.pipeline import build_rag_prompt
+from app.pipeline import build_rag_prompt, mmr_select, merge_adjacent_chunks
+from app.retrieval import retrieve_batch, iter_retrieve_batch
+from app.ingest import ingest_documents, ANONYMOUS_SOURCE, INGEST_CHUNKS
+from app.jobs import submit_job, get_job_store
 from app.llm import generate_local, generate_openai
-from app.config import TOP_K, LLM_CONTEXT_DOCS
+from app.llm_scheduler import GenerationRejected, PRIORITY_INTERACTIVE, scheduler_stats
+from app.budget import LatencyBudget, observe_cost
+from app import metrics, profiling, startup
+from app.metrics import STAGE_SECONDS
+from app.config import (
+    TOP_K, LLM_CONTEXT_DOCS, LLM_CONTEXT_TOKEN_BUDGET, LLM_QUEUE_TIMEOUT,
+    MMR_POOL_SIZE, MMR_LAMBDA, QUERY_TIMEOUT_MS, BUDGET_GENERATION_RESERVE,
+    LLM_MAX_TOKENS, LLM_MIN_TOKENS, LLM_TOKENS_PER_SECOND, SEARCH_BATCH_STREAM_THRESHOLD,
+    EMBED_BATCH_SIZE, INGEST_BATCH_DOCS, PROFILING_ENABLED,
+)
 from app.crawler.api import router as crawler_router
 
+# Answer when no generation fits in the latency budget; the sources are still returned
+NO_ANSWER_IN_BUDGET = "在时间预算内无法生成回答，请参考检索到的相关片段。"
+
 router = APIRouter()
 router.include_router(crawler_router, prefix="/crawler", tags=["crawler"])
 
@@ -19,47 +43,327 @@ class IngestRequest(BaseModel):
     source: str = "local"
     sync: bool = False  # New field to control sync/async execution
 
+class IngestDocument(BaseModel):
+    text: str
+    source: str = "local"
+
+class BatchIngestRequest(BaseModel):
+    documents: List[IngestDocument]
+    sync: bool = True  # Per-document results are only available when waiting for completion
+
 class QueryRequest(BaseModel):
     query: str
     top_k: int = TOP_K
+    timeout_ms: Optional[int] = None  # End-to-end latency budget; overrides X-Request-Timeout-Ms
+
+class ProfileArmRequest(BaseModel):
+    target: str = "request"  # request, crawler, ingest
+    kind: str = "cprofile"   # cprofile, pyinstrument, torch
+    count: int = 1
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    top_k: int = TOP_K
+    top_n: int = LLM_CONTEXT_DOCS
+    rerank: bool = True
+    stream: Optional[bool] = None  # NDJSON output; default: only above SEARCH_BATCH_STREAM_THRESHOLD queries
 
 @router.get("/status")
 async def status():
     return {"status": "ok"}
 
+@router.get("/ready")
+async def ready():
+    """Readiness probe: 503 until the index and preloaded models are loaded and warmed up."""
+    state = startup.readiness()
+    return JSONResponse(status_code=200 if state["ready"] else 503, content=state)
+
+@router.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus text format: stage latency histograms, ingest/crawler counters, index and memory gauges."""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@router.get("/llm/stats")
+async def llm_stats():
+    return {"schedulers": scheduler_stats()}
+
 @router.get("/sources")
 async def list_sources():
     sources = get_existing_sources()
     return {"count": len(sources), "sources": list(sources)}
 
+@router.post("/admin/reload-index")
+async def admin_reload_index():
+    """Hot-load the index files from disk, e.g. after `python -m app.build_index`."""
+    ntotal = await run_in_threadpool(reload_index)
+    return {"status": "reloaded", "ntotal": ntotal}
+
 @router.post("/admin/deduplicate")
 async def admin_deduplicate():
-    removed = deduplicate_index()
+    # may re-embed the whole corpus (quantized index); keep the event loop free
+    removed = await run_in_threadpool(deduplicate_index)
     return {"status": "completed", "removed_duplicates": removed}
 
-def _background_ingest(chunks, source):
-    embeddings = get_embeddings(chunks)
-    metas = [{"source": source, "id": idx, "text": c} for idx, c in enumerate(chunks)]
-    add_embeddings(embeddings, metas)
-    print(f"Background ingestion completed for source: {source}")
+def _require_profiling():
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=403, detail="Profiling is disabled (PROFILING_ENABLED)")
+
+@router.get("/admin/profiles")
+async def admin_list_profiles():
+    return {
+        "enabled": PROFILING_ENABLED,
+        "kinds": profiling.available_kinds(),
+        "armed": profiling.armed(),
+        "traces": profiling.list_traces(),
+    }
+
+@router.post("/admin/profiles/arm")
+async def admin_arm_profile(req: ProfileArmRequest):
+    """Profile the next `count` requests / crawler runs / ingest jobs."""
+    _require_profiling()
+    try:
+        return {"armed": profiling.arm(req.target, req.kind, req.count)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/admin/profiles/{name}")
+async def admin_get_profile(name: str, format: Optional[str] = None):
+    """Download a trace; format=text renders a cProfile trace as a pstats table."""
+    _require_profiling()
+    path = profiling.trace_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Unknown trace: {name}")
+    if format == "text" and name.endswith(".prof"):
+        return PlainTextResponse(await run_in_threadpool(profiling.cprofile_text, path))
+    return FileResponse(path, filename=name)
+
+@router.delete("/admin/profiles")
+async def admin_delete_profiles():
+    _require_profiling()
+    return {"deleted": profiling.delete_traces()}
 
 @router.post("/ingest")
-async def ingest(req: IngestRequest, background_tasks: BackgroundTasks):
-    chunks = chunk_text(req.text, chunk_size=512, overlap=64)
-    
+async def ingest(req: IngestRequest):
     if req.sync:
-        # Synchronous execution (blocking)
-        _background_ingest(chunks, req.source)
-        return {"status": "completed", "ingested_chunks_count": len(chunks), "message": "Ingestion completed synchronously"}
+        # Synchronous execution (blocking); re-ingesting a source only embeds its changed chunks
+        result = (await run_in_threadpool(ingest_documents, [{"text": req.text, "source": req.source}]))[0]
+        if result["status"] == "failed":
+            raise HTTPException(status_code=500, detail=f"Ingestion failed: {result.get('error')}")
+        return {
+            "status": "completed", "ingested_chunks_count": result["chunks"],
+            "embedded_chunks": result["embedded"], "removed_chunks": result["removed"],
+            "message": "Ingestion completed synchronously",
+        }
     else:
-        # Asynchronous execution (background task)
-        background_tasks.add_task(_background_ingest, chunks, req.source)
-        return {"status": "processing", "ingested_chunks_count": len(chunks), "message": "Ingestion started in background"}
+        # Asynchronous execution (durable job queue, see GET /ingest/jobs/{job_id})
+        job_id = submit_job([{"text": req.text, "source": req.source}])
+        return {"status": "processing", "job_id": job_id, "message": "Ingestion queued"}
+
+def _ingest_chunk_batch(chunks, source, start_id, stored):
+    """Embed and add one batch of a streamed document; chunks found in stored keep their vectors."""
+    texts, metas, updates = [], [], {}
+    for idx, c in enumerate(chunks):
+        h = content_hash(c)
+        meta = {"source": source, "id": start_id + idx, "text": c, "hash": h}
+        kept = stored.get(h)
+        if kept:
+            updates[kept.pop(0)] = meta
+        else:
+            texts.append(c)
+            metas.append(meta)
+    embeddings = get_embeddings(texts, batch_size=EMBED_BATCH_SIZE) if texts else None
+    apply_changes(embeddings, metas, updates, persist=False)
+    return len(texts)
+
+def _finish_stream(source, stored):
+    removed = []
+    if source != ANONYMOUS_SOURCE:
+        removed = [idx for ids in stored.values() for idx in ids]
+        apply_changes(None, [], tombstones=removed, persist=False)
+    save_index()
+    return len(removed)
+
+@router.post("/ingest/stream")
+async def ingest_stream(request: Request, source: str = "local"):
+    """
+    Ingest one large document from a streamed request body.
+    The body is either raw UTF-8 text (e.g. chunked transfer encoding) or, with an
+    NDJSON content type, one {"text": ...} object per line whose texts are
+    concatenated. Chunks are embedded in batches as they are produced, so memory
+    use does not grow with the document size. The index is persisted once at the end.
+    Re-streaming a source only embeds chunks whose content changed; its chunks that
+    are no longer present are tombstoned once the stream completes.
+    """
+    ndjson = any(t in request.headers.get("content-type", "") for t in ("ndjson", "jsonl"))
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    chunker = await run_in_threadpool(StreamingChunker)  # may load the tokenizer
+    stored = await run_in_threadpool(get_doc_chunks, source)
+    pending = []
+    ingested = embedded = 0
+    completed = False
+    line_buf = ""
+    line_no = 0
+
+    async def flush_pending():
+        nonlocal pending, ingested, embedded
+        if pending:
+            batch, pending = pending, []
+            embedded += await run_in_threadpool(_ingest_chunk_batch, batch, source, ingested, stored)
+            ingested += len(batch)
+
+    def parse_lines(lines):
+        nonlocal line_no
+        pieces = []
+        for line in lines:
+            line_no += 1
+            if not line.strip():
+                continue
+            try:
+                pieces.append(json.loads(line).get("text") or "")
+            except (ValueError, AttributeError):
+                raise HTTPException(status_code=400, detail=f"Invalid NDJSON at line {line_no}")
+        return pieces
+
+    try:
+        async for raw in request.stream():
+            text = decoder.decode(raw)
+            if ndjson:
+                line_buf += text
+                *lines, line_buf = line_buf.split("\n")
+                pieces = parse_lines(lines)
+            else:
+                pieces = [text]
+            for piece in pieces:
+                pending.extend(chunker.feed(piece))
+            if len(pending) >= EMBED_BATCH_SIZE:
+                await flush_pending()
+
+        tail = decoder.decode(b"", final=True)
+        pieces = parse_lines([line_buf + tail]) if ndjson else [tail]
+        for piece in pieces:
+            pending.extend(chunker.feed(piece))
+        pending.extend(chunker.flush())
+        await flush_pending()
+        completed = True
+    finally:
+        removed = 0
+        if completed and ingested:
+            removed = await run_in_threadpool(_finish_stream, source, stored)
+        elif ingested:
+            await run_in_threadpool(save_index)
+        INGEST_CHUNKS.inc(embedded, result="embedded")
+        INGEST_CHUNKS.inc(ingested - embedded, result="unchanged")
+        INGEST_CHUNKS.inc(removed, result="removed")
+
+    return {
+        "status": "completed", "source": source, "ingested_chunks_count": ingested,
+        "embedded_chunks": embedded, "removed_chunks": removed,
+    }
+
+def _ingest_in_groups(docs):
+    results = []
+    for i in range(0, len(docs), INGEST_BATCH_DOCS):
+        results.extend(ingest_documents(docs[i:i+INGEST_BATCH_DOCS]))
+    return results
+
+def _summarize(results):
+    return {
+        "documents": len(results),
+        "completed": sum(r["status"] == "completed" for r in results),
+        "failed": sum(r["status"] == "failed" for r in results),
+        "ingested_chunks_count": sum(r["chunks"] for r in results),
+        "embedded_chunks": sum(r.get("embedded", 0) for r in results),
+        "removed_chunks": sum(r.get("removed", 0) for r in results),
+    }
+
+@router.post("/ingest/batch")
+async def ingest_batch(request: Request):
+    """
+    Ingest many documents at once.
+    Body is either a BatchIngestRequest JSON object or an NDJSON stream of
+    {"text": ..., "source": ...} lines. Chunks of up to INGEST_BATCH_DOCS documents
+    are pooled into shared, length-sorted embedding batches and committed to the
+    vector store once per group. With sync=false the documents become a durable
+    ingest job instead. NDJSON bodies are always processed synchronously.
+    """
+    if any(t in request.headers.get("content-type", "") for t in ("ndjson", "jsonl")):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        results, group, line_buf, line_no = [], [], "", 0
+
+        def parse(line):
+            try:
+                return IngestDocument(**json.loads(line)).model_dump()
+            except Exception:
+                raise HTTPException(status_code=400, detail=f"Invalid document at line {line_no}")
+
+        async for raw in request.stream():
+            line_buf += decoder.decode(raw)
+            *lines, line_buf = line_buf.split("\n")
+            for line in lines:
+                line_no += 1
+                if line.strip():
+                    group.append(parse(line))
+                if len(group) >= INGEST_BATCH_DOCS:
+                    results.extend(await run_in_threadpool(ingest_documents, group))
+                    group = []
+        line_buf += decoder.decode(b"", final=True)
+        if line_buf.strip():
+            line_no += 1
+            group.append(parse(line_buf))
+        if group:
+            results.extend(await run_in_threadpool(ingest_documents, group))
+        return {"status": "completed", **_summarize(results), "results": results}
+
+    try:
+        req = BatchIngestRequest(**(await request.json()))
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Invalid batch ingest request: {e}")
+    docs = [d.model_dump() for d in req.documents]
+    if req.sync:
+        results = await run_in_threadpool(_ingest_in_groups, docs)
+        return {"status": "completed", **_summarize(results), "results": results}
+    job_id = submit_job(docs)
+    return {"status": "processing", "job_id": job_id, "documents": len(docs), "message": "Batch ingestion queued"}
+
+@router.get("/ingest/jobs")
+async def list_ingest_jobs(limit: int = 50):
+    return {"jobs": get_job_store().list(limit)}
+
+@router.get("/ingest/jobs/{job_id}")
+async def get_ingest_job(job_id: str, documents: bool = False):
+    job = get_job_store().get(job_id, include_docs=documents)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/search/batch")
+async def search_batch_endpoint(req: BatchSearchRequest):
+    """
+    Retrieval only (no generation) for many queries in one embedding/search/rerank pass.
+    """
+    stream = req.stream if req.stream is not None else len(req.queries) > SEARCH_BATCH_STREAM_THRESHOLD
+    if stream:
+        def lines():
+            for result in iter_retrieve_batch(req.queries, top_k=req.top_k, top_n=req.top_n, use_rerank=req.rerank):
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        # sync generator: Starlette iterates it in the threadpool
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    results = await run_in_threadpool(
+        retrieve_batch, req.queries, top_k=req.top_k, top_n=req.top_n, use_rerank=req.rerank
+    )
+    return {"count": len(results), "results": results}
+
+def _observe_timings(timings):
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
 
 @router.post("/query")
-async def query(req: QueryRequest):
+async def query(req: QueryRequest, x_request_timeout_ms: Optional[int] = Header(None)):
     t0 = time.time()
     timings = {}
+    timeout_ms = req.timeout_ms or x_request_timeout_ms or QUERY_TIMEOUT_MS
+    budget = LatencyBudget(timeout_ms / 1000.0 if timeout_ms else None)
     
     # 1. Embedding
     t_start = time.time()
@@ -68,12 +372,21 @@ async def query(req: QueryRequest):
     timings["embedding"] = time.time() - t_start
 
     # 2. Vector Search
+    # Only fetch as many candidates as we expect to be able to rerank in time
+    top_k = req.top_k
+    affordable = budget.affordable("rerank", reserve=BUDGET_GENERATION_RESERVE)
+    if affordable is not None and affordable < top_k:
+        top_k = max(LLM_CONTEXT_DOCS, affordable)
+        if top_k < req.top_k:
+            budget.degrade("search", "reduced_top_k", top_k=top_k, requested=req.top_k)
     t_start = time.time()
-    candidates = search(q_vec, top_k=req.top_k)
+    candidates = search(q_vec, top_k=top_k)
     timings["search"] = time.time() - t_start
 
     if not candidates:
-        return {"answer": "没有检索到相关内容。", "sources": [], "debug_info": {"timings": timings}}
+        _observe_timings(timings)
+        return {"answer": "没有检索到相关内容。", "sources": [], "degradations": budget.degradations,
+                "debug_info": {"timings": timings, "budget": budget.info()}}
 
     # Prepare initial candidates info for debug
     initial_candidates_info = []
@@ -89,12 +402,24 @@ async def query(req: QueryRequest):
     # 3. Rerank
     t_start = time.time()
     candidate_texts = [c["meta"].get("text","") for c in candidates]
-    # rerank now returns list of dicts: {'text': str, 'score': float, 'index': int}
-    reranked = rerank(q, candidate_texts, batch_size=8)
+    affordable = budget.affordable("rerank", reserve=BUDGET_GENERATION_RESERVE)
+    if affordable is not None and affordable == 0:
+        # No time to rerank: keep vector search order and scores
+        budget.degrade("rerank", "skipped", candidates=len(candidate_texts))
+        reranked = [{"text": t, "score": float(c["score"]), "index": i}
+                    for i, (t, c) in enumerate(zip(candidate_texts, candidates))]
+    else:
+        if affordable is not None and affordable < len(candidate_texts):
+            # Rerank the head of the vector ranking only; the tail is dropped
+            budget.degrade("rerank", "truncated", reranked=affordable, candidates=len(candidate_texts))
+            candidate_texts = candidate_texts[:affordable]
+        # rerank now returns list of dicts: {'text': str, 'score': float, 'index': int}
+        reranked = rerank(q, candidate_texts, batch_size=8)
+        observe_cost("rerank", time.time() - t_start, len(candidate_texts))
     timings["rerank"] = time.time() - t_start
-
-    top = reranked[:LLM_CONTEXT_DOCS]
-    top_for_context = []
+    # Keep a wider pool than LLM_CONTEXT_DOCS so the diversity stage has room to choose
+    top = reranked[:max(LLM_CONTEXT_DOCS, MMR_POOL_SIZE)]
+    pool = []
     
     # Correctly map back to metadata using 'index'
     for item in top:
@@ -105,34 +430,98 @@ async def query(req: QueryRequest):
         # Get original metadata
         if idx < len(candidates):
             meta = candidates[idx]["meta"]
+            vector_id = candidates[idx]["id"]
         else:
             meta = {"source": "unknown", "id": "unknown"}
+            vector_id = None
             
-        top_for_context.append({
+        pool.append({
             "id": meta.get("id"), 
             "source": meta.get("source"), 
+            "url": meta.get("url"),
+            "vector_id": vector_id,
             "text": text, 
             "score": score
         })
 
+    # 3b. Diversity: MMR over stored vectors, then merge adjacent chunks of one document
+    t_start = time.time()
+    if len(pool) > LLM_CONTEXT_DOCS and all(p["vector_id"] is not None for p in pool):
+        vectors = get_vectors([p["vector_id"] for p in pool])
+        top_for_context = mmr_select(q_vec, pool, vectors, k=LLM_CONTEXT_DOCS, lambda_=MMR_LAMBDA)
+    else:
+        top_for_context = pool[:LLM_CONTEXT_DOCS]
+    top_for_context = merge_adjacent_chunks(top_for_context)
+    timings["diversity"] = time.time() - t_start
+
     # 4. Generation
     t_start = time.time()
-    system_prompt, user_prompt = build_rag_prompt(q, top_for_context, max_snippets=LLM_CONTEXT_DOCS)
+    token_budget = LLM_CONTEXT_TOKEN_BUDGET
+    if token_budget > 0 and budget.remaining() < BUDGET_GENERATION_RESERVE:
+        # Sentence compression embeds every context sentence; fall back to truncation
+        budget.degrade("prompt", "compression_skipped")
+        token_budget = 0
+    system_prompt, user_prompt = build_rag_prompt(
+        q, top_for_context, max_snippets=LLM_CONTEXT_DOCS,
+        token_budget=token_budget, query_vec=q_vec
+    )
     print("DEBUG_PROMPT_SYSTEM:", system_prompt)
     print("DEBUG_PROMPT_USER:", user_prompt[:2000])
-    try:
-        answer = await generate_local(system_prompt, user_prompt)
-    except Exception:
-        answer = await generate_openai(system_prompt, user_prompt)
+
+    max_tokens = LLM_MAX_TOKENS
+    remaining = budget.remaining()
+    if not math.isinf(remaining):
+        # Size the answer to the time left
+        max_tokens = min(max_tokens, int(remaining * LLM_TOKENS_PER_SECOND))
+    deadline = budget.deadline or t0 + LLM_QUEUE_TIMEOUT
+    if max_tokens < LLM_MIN_TOKENS:
+        budget.degrade("generation", "skipped")
+        answer = NO_ANSWER_IN_BUDGET
+    else:
+        if max_tokens < LLM_MAX_TOKENS:
+            budget.degrade("generation", "reduced_max_tokens", max_tokens=max_tokens)
+        try:
+            answer = await generate_local(
+                system_prompt, user_prompt, priority=PRIORITY_INTERACTIVE, deadline=deadline,
+                max_tokens=max_tokens, timeout_at=budget.deadline
+            )
+        except Exception as primary_error:
+            fallback_error = primary_error
+            if budget.remaining() > 0:
+                # No fallback once the budget is spent: it would get the same expired deadline
+                try:
+                    answer = await generate_openai(
+                        system_prompt, user_prompt, priority=PRIORITY_INTERACTIVE, deadline=deadline,
+                        max_tokens=max_tokens if budget.deadline else None, timeout_at=budget.deadline
+                    )
+                    fallback_error = None
+                except Exception as e:
+                    fallback_error = e
+            if fallback_error is not None and budget.remaining() <= 0:
+                # Out of time: answer from retrieval alone, like the skipped-generation case
+                budget.degrade("generation", "timeout")
+                answer = NO_ANSWER_IN_BUDGET
+            elif fallback_error is not None:
+                # Surface admission control as 429/503 rather than a generic 500
+                rejected = next((e for e in (fallback_error, primary_error) if isinstance(e, GenerationRejected)), None)
+                if rejected is not None:
+                    raise HTTPException(
+                        status_code=rejected.status_code,
+                        detail=str(rejected),
+                        headers={"Retry-After": str(max(1, int(rejected.retry_after + 0.5)))}
+                    )
+                raise fallback_error
     timings["generation"] = time.time() - t_start
     
     timings["total"] = time.time() - t0
+    _observe_timings(timings)
 
     # Construct response
     sources = [{"text": t["text"], "score": t["score"], "source": t["source"], "id": t["id"]} for t in top_for_context]
     
     debug_info = {
         "timings": timings,
+        "budget": budget.info(),
         "retrieval": {
             "initial_candidates": initial_candidates_info,
             "reranked_candidates": [
@@ -146,4 +535,4 @@ async def query(req: QueryRequest):
         }
     }
 
-    return {"answer": answer, "sources": sources, "debug_info": debug_info}
+    return {"answer": answer, "sources": sources, "degradations": budget.degradations, "debug_info": debug_info}
@@ -0,0 +1,55 @@
+import math
+import time
+from typing import Dict, List, Optional
+
+# Per-unit stage costs learned from past requests (EWMA, seconds per unit).
+_stage_costs: Dict[str, float] = {}
+
+def observe_cost(stage: str, seconds: float, units: int = 1):
+    if units <= 0:
+        return
+    per_unit = seconds / units
+    prev = _stage_costs.get(stage)
+    _stage_costs[stage] = per_unit if prev is None else 0.8 * prev + 0.2 * per_unit
+
+def estimate_cost(stage: str, units: int = 1) -> float:
+    """Expected seconds for `units` of work in stage; 0.0 until the stage has been observed."""
+    return _stage_costs.get(stage, 0.0) * units
+
+
+class LatencyBudget:
+    """
+    End-to-end deadline for one request.
+    Stages ask remaining() before doing work and record any shortcut they take
+    with degrade(), so the response can say what was cut.
+    """
+    def __init__(self, timeout: Optional[float] = None):
+        self.start = time.time()
+        self.timeout = timeout if timeout and timeout > 0 else None
+        self.deadline = self.start + self.timeout if self.timeout else None
+        self.degradations: List[Dict] = []
+
+    def remaining(self) -> float:
+        if self.deadline is None:
+            return math.inf
+        return self.deadline - time.time()
+
+    def affordable(self, stage: str, reserve: float = 0.0) -> Optional[int]:
+        """
+        How many units of stage fit in the remaining time after keeping `reserve`
+        seconds for later stages. None means unlimited (no deadline or no estimate yet).
+        """
+        per_unit = _stage_costs.get(stage)
+        if self.deadline is None or not per_unit:
+            return None
+        return max(0, int((self.remaining() - reserve) / per_unit))
+
+    def degrade(self, stage: str, action: str, **detail):
+        self.degradations.append({"stage": stage, "action": action, **detail})
+
+    def info(self) -> Dict:
+        return {
+            "timeout": self.timeout,
+            "remaining": None if self.deadline is None else max(0.0, self.remaining()),
+            "degradations": self.degradations,
+        }
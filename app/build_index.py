@@ -0,0 +1,192 @@
+"""
+Offline index builder: scan a directory of JSON/text documents and write a FAISS
+index plus metadata in the serving format, without going through the HTTP API.
+
+    python -m app.build_index /path/to/docs [--out data/faiss_index.bin] [--workers 8]
+                              [--append] [--index-factory HNSW32] [--reload-url http://localhost:8001]
+
+Reading, text extraction and chunking run in a process pool (tokenizer only);
+embedding runs in the main process with torch using every core, and overlaps
+with chunking of the next files. A running server picks up the result via
+POST /admin/reload-index (--reload-url does that automatically).
+Vectors are collected in an exact index; with a non-flat --index-factory
+(default FAISS_INDEX_FACTORY) that index is converted at the end, training on
+all vectors.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from app.config import EMBED_BATCH_SIZE, NEAR_DUP_MODE, FAISS_INDEX_FACTORY
+from app.utils.simhash import simhash
+from app.vectorstore import (
+    INDEX_PATH, build_ann_index, content_hash, is_flat_factory, read_index_files, write_index_files,
+)
+
+TEXT_KEYS = ("text", "content")
+DOC_SUFFIXES = (".json", ".txt", ".md")
+
+
+def extract_text(obj) -> str:
+    """Text of a JSON document: a dict with text/content, or a list of such dicts."""
+    texts = []
+    items = obj if isinstance(obj, list) else [obj]
+    for item in items:
+        if isinstance(item, dict):
+            for k in TEXT_KEYS:
+                if item.get(k):
+                    texts.append(str(item[k]))
+                    break
+    return "\n\n".join(texts)
+
+
+def _read_document(path: Path) -> str:
+    if path.suffix == ".json":
+        with path.open("r", encoding="utf-8") as f:
+            return extract_text(json.load(f))
+    return path.read_text(encoding="utf-8", errors="replace")
+
+
+def _init_worker():
+    # one tokenizer per process; the pool already provides the parallelism
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    from app.embeddings import load_tokenizer
+    load_tokenizer()
+
+
+def _prepare(files: List[Tuple[str, str]]) -> List[Tuple[str, List[str], Optional[str]]]:
+    """Worker: read and chunk a group of (path, source) files. Returns (source, chunks, error) per file."""
+    from app.embeddings import load_tokenizer
+    from app.utils.chunker import chunk_documents
+    texts, out = [], []
+    for p, source in files:
+        try:
+            texts.append(_read_document(Path(p)))
+            out.append((source, None))
+        except Exception as e:
+            texts.append("")
+            out.append((source, str(e)))
+    chunk_lists = chunk_documents(texts, tokenizer=load_tokenizer())
+    return [(src, chunks, err) for (src, err), chunks in zip(out, chunk_lists)]
+
+
+def build(docs_dir: Path, out: str, workers: int, files_per_task: int = 16,
+          embed_group: int = 2048, batch_size: int = EMBED_BATCH_SIZE, append: bool = False,
+          index_factory: str = FAISS_INDEX_FACTORY) -> Dict:
+    # the source is the path below docs_dir: equal file names in different subdirectories stay apart
+    files = sorted((p, p.relative_to(docs_dir).as_posix())
+                   for p in docs_dir.rglob("*") if p.is_file() and p.suffix in DOC_SUFFIXES)
+    index, id_to_meta = read_index_files(out) if append else (None, {})
+    if append and id_to_meta:
+        done = {m.get("source") for m in id_to_meta.values()}
+        files = [(p, source) for p, source in files if source not in done]
+    print(f"[BUILD] {len(files)} files to index from {docs_dir} -> {out}")
+
+    tasks = [[(str(p), source) for p, source in files[i:i + files_per_task]]
+             for i in range(0, len(files), files_per_task)]
+    stats = {"files": len(files), "docs": 0, "empty": 0, "failed": 0, "chunks": 0}
+    t0 = time.time()
+
+    # spawn, not fork: this process runs torch with its own thread pools
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker) as pool:
+        import torch
+        from app.embeddings import get_embeddings
+        torch.set_num_threads(os.cpu_count() or 1)
+
+        pending_texts: List[str] = []
+        pending_metas: List[Dict] = []
+
+        def flush():
+            nonlocal index
+            if not pending_texts:
+                return
+            emb = np.ascontiguousarray(get_embeddings(pending_texts, batch_size=batch_size), dtype="float32")
+            if index is None:
+                index = faiss.IndexFlatIP(emb.shape[1])
+            base = index.ntotal
+            index.add(emb)
+            for i, meta in enumerate(pending_metas):
+                id_to_meta[base + i] = meta
+            stats["chunks"] += len(pending_texts)
+            elapsed = time.time() - t0
+            print(f"[BUILD] docs={stats['docs']}/{stats['files']} chunks={stats['chunks']} "
+                  f"({stats['docs'] / elapsed:.1f} docs/s, {stats['chunks'] / elapsed:.1f} chunks/s)")
+            pending_texts.clear()
+            pending_metas.clear()
+
+        for results in pool.map(_prepare, tasks):
+            for source, chunks, err in results:
+                if err:
+                    stats["failed"] += 1
+                    print(f"[SKIP] {source}: {err}")
+                    continue
+                if not chunks:
+                    stats["empty"] += 1
+                    continue
+                stats["docs"] += 1
+                for idx, c in enumerate(chunks):
+                    pending_texts.append(c)
+                    meta = {"source": source, "id": idx, "text": c, "hash": content_hash(c)}
+                    if NEAR_DUP_MODE != "off":
+                        # signatures let later API ingests detect near-duplicates of these chunks
+                        meta["simhash"] = simhash(c)
+                    pending_metas.append(meta)
+            if len(pending_texts) >= embed_group:
+                flush()
+        flush()
+
+    if index is not None and not is_flat_factory(index_factory) and isinstance(index, faiss.IndexFlat):
+        t_ann = time.time()
+        index = build_ann_index(index.reconstruct_n(0, index.ntotal), index_factory)
+        print(f"[BUILD] {index_factory} index built in {time.time() - t_ann:.1f}s")
+    if index is not None:
+        write_index_files(index, id_to_meta, out)
+    elapsed = time.time() - t0
+    stats.update(
+        elapsed=elapsed,
+        ntotal=index.ntotal if index is not None else 0,
+        docs_per_sec=stats["docs"] / elapsed if elapsed else 0.0,
+        chunks_per_sec=stats["chunks"] / elapsed if elapsed else 0.0,
+    )
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the FAISS index offline from a directory of documents.")
+    parser.add_argument("docs_dir", type=Path)
+    parser.add_argument("--out", default=INDEX_PATH, help="index path (metadata goes to <out>.meta.pkl)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="chunking processes")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="embedding batch size")
+    parser.add_argument("--append", action="store_true", help="extend the existing index, skipping known sources")
+    parser.add_argument("--index-factory", default=FAISS_INDEX_FACTORY,
+                        help="FAISS index_factory string, e.g. Flat, HNSW32, IVF1024,PQ32 (see benchmarks/ann_eval.py)")
+    parser.add_argument("--reload-url", help="server base URL to hot-load the new index, e.g. http://localhost:8001")
+    args = parser.parse_args(argv)
+
+    if not args.docs_dir.is_dir():
+        print(f"Error: directory {args.docs_dir} does not exist.")
+        sys.exit(1)
+
+    stats = build(args.docs_dir, os.path.expanduser(args.out), args.workers,
+                  batch_size=args.batch_size, append=args.append, index_factory=args.index_factory)
+    print(f"[DONE] {json.dumps(stats)}")
+
+    if args.reload_url:
+        import httpx
+        resp = httpx.post(f"{args.reload_url.rstrip('/')}/admin/reload-index", timeout=300)
+        resp.raise_for_status()
+        print(f"[RELOAD] {resp.json()}")
+
+
+if __name__ == "__main__":
+    main()
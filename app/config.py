@@ -19,7 +19,133 @@ RERANKER_MODEL = os.getenv("RERANKER_MODEL", "BAAI/bge-reranker-base")
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 TOP_K = int(os.getenv("TOP_K", "20"))
 LLM_CONTEXT_DOCS = int(os.getenv("LLM_CONTEXT_DOCS", "5"))
+# Token-aware chunker. 510 leaves room for [CLS]/[SEP] in the embedding model's
+# 512-token window, so chunks are never silently truncated.
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "510"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "0"))
+# Batch sizes for throughput-oriented paths (batch search, bulk ingest).
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+# /search/batch streams NDJSON above this many queries, in blocks of SEARCH_BATCH_BLOCK.
+SEARCH_BATCH_STREAM_THRESHOLD = int(os.getenv("SEARCH_BATCH_STREAM_THRESHOLD", "256"))
+SEARCH_BATCH_BLOCK = int(os.getenv("SEARCH_BATCH_BLOCK", "128"))
+# Searches fetch up to top_k * SEARCH_OVERFETCH candidates to make up for tombstoned
+# chunks, and widen the search only for queries left with fewer than top_k live hits.
+SEARCH_OVERFETCH = int(os.getenv("SEARCH_OVERFETCH", "4"))
+# Token budget for the whole prompt (system + question + context). 0 keeps the
+# legacy per-snippet character truncation.
+LLM_CONTEXT_TOKEN_BUDGET = int(os.getenv("LLM_CONTEXT_TOKEN_BUDGET", "0"))
+# Sentences whose embeddings are at least this similar are treated as duplicates.
+PROMPT_DEDUP_THRESHOLD = float(os.getenv("PROMPT_DEDUP_THRESHOLD", "0.92"))
+# MMR context selection: reranked pool size to pick LLM_CONTEXT_DOCS from
+# (<= LLM_CONTEXT_DOCS disables it) and relevance/diversity trade-off (1.0 = relevance only).
+MMR_POOL_SIZE = int(os.getenv("MMR_POOL_SIZE", "15"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.5"))
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+
+# Generation scheduler: concurrent upstream calls per provider, waiting requests
+# per provider, and the default queue-wait allowance for /query.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "4"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+
+# Latency budgets for /query. QUERY_TIMEOUT_MS is the default budget (0 = none);
+# requests override it with timeout_ms or the X-Request-Timeout-Ms header.
+QUERY_TIMEOUT_MS = int(os.getenv("QUERY_TIMEOUT_MS", "0"))
+# Seconds kept aside for generation while retrieval stages plan their work.
+BUDGET_GENERATION_RESERVE = float(os.getenv("BUDGET_GENERATION_RESERVE", "3.0"))
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "512"))
+LLM_MIN_TOKENS = int(os.getenv("LLM_MIN_TOKENS", "64"))
+# Rough decode speed used to size max_tokens to the time left.
+LLM_TOKENS_PER_SECOND = float(os.getenv("LLM_TOKENS_PER_SECOND", "40"))
+
+# Bulk ingestion: documents pooled per embedding/commit batch.
+INGEST_BATCH_DOCS = int(os.getenv("INGEST_BATCH_DOCS", "64"))
+
+# Durable ingest job queue (SQLite) and its dedicated worker threads.
+JOBS_DB_PATH = os.getenv(
+    "JOBS_DB_PATH", os.path.join(os.path.dirname(os.path.expanduser(FAISS_INDEX_PATH)), "ingest_jobs.db")
+)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# Ingest-time near-duplicate filter (SimHash + LSH over chunk text): "link" records
+# the chunk as an alias of the stored one instead of embedding it, "reject" drops
+# it, "off" disables the check. Chunks shorter than NEAR_DUP_MIN_CHARS are exempt.
+NEAR_DUP_MODE = os.getenv("NEAR_DUP_MODE", "link").lower()
+NEAR_DUP_MAX_DISTANCE = int(os.getenv("NEAR_DUP_MAX_DISTANCE", "3"))
+NEAR_DUP_MIN_CHARS = int(os.getenv("NEAR_DUP_MIN_CHARS", "50"))
+
+# Crawler pipeline: concurrent HTTP requests overall, list pages fetched ahead,
+# detail-fetch and parse workers, and articles per embedding/commit batch.
+CRAWLER_MAX_CONCURRENCY = int(os.getenv("CRAWLER_MAX_CONCURRENCY", "6"))
+CRAWLER_LIST_PREFETCH = int(os.getenv("CRAWLER_LIST_PREFETCH", "2"))
+CRAWLER_DETAIL_WORKERS = int(os.getenv("CRAWLER_DETAIL_WORKERS", "6"))
+CRAWLER_PARSE_WORKERS = int(os.getenv("CRAWLER_PARSE_WORKERS", "2"))
+CRAWLER_INGEST_BATCH = int(os.getenv("CRAWLER_INGEST_BATCH", "16"))
+# Processes for crawler HTML parsing, off the API event loop (0 = a thread instead).
+CRAWLER_PARSE_PROCESSES = int(os.getenv("CRAWLER_PARSE_PROCESSES", "2"))
+# Articles embedded between index persists during a crawl (always persisted at the end).
+CRAWLER_COMMIT_ARTICLES = int(os.getenv("CRAWLER_COMMIT_ARTICLES", "64"))
+# On-disk HTTP validator cache (ETag / Last-Modified / body hash) for crawler requests.
+CRAWLER_CACHE_PATH = os.getenv(
+    "CRAWLER_CACHE_PATH", os.path.join(os.path.dirname(os.path.expanduser(FAISS_INDEX_PATH)), "crawler_cache.db")
+)
+# Per-host adaptive politeness (AIMD): concurrent requests per host, and the
+# initial / minimum / maximum delay between request starts to one host.
+CRAWLER_HOST_MAX_CONCURRENCY = int(os.getenv("CRAWLER_HOST_MAX_CONCURRENCY", "4"))
+CRAWLER_HOST_START_DELAY = float(os.getenv("CRAWLER_HOST_START_DELAY", "0.5"))
+CRAWLER_HOST_MIN_DELAY = float(os.getenv("CRAWLER_HOST_MIN_DELAY", "0.1"))
+CRAWLER_HOST_MAX_DELAY = float(os.getenv("CRAWLER_HOST_MAX_DELAY", "30"))
+CRAWLER_RESPECT_ROBOTS = os.getenv("CRAWLER_RESPECT_ROBOTS", "1") == "1"
+# Optional JSON file with extra crawl sites (see app/crawler/sites.py).
+CRAWLER_SITES_FILE = os.getenv("CRAWLER_SITES_FILE")
+# Persistent crawl frontier (pending list pages / articles per run), for resuming
+# an interrupted or cancelled run.
+CRAWLER_FRONTIER_PATH = os.getenv(
+    "CRAWLER_FRONTIER_PATH", os.path.join(os.path.dirname(os.path.expanduser(FAISS_INDEX_PATH)), "crawler_frontier.db")
+)
+# Minimum seconds between progress saves of a running crawl to the state file.
+CRAWLER_PROGRESS_INTERVAL = float(os.getenv("CRAWLER_PROGRESS_INTERVAL", "2"))
+# A running crawl refreshes its frontier heartbeat this often (seconds); a run
+# marked running whose heartbeat is older than 3 intervals is treated as dead.
+CRAWLER_HEARTBEAT_INTERVAL = float(os.getenv("CRAWLER_HEARTBEAT_INTERVAL", "10"))
+# Opt-in profiling (app/profiling.py): X-Profile request header, armed captures
+# for requests / crawler runs / ingest jobs, and random sampling of requests.
+# Traces are kept in PROFILE_DIR, oldest removed beyond the file / size limits.
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_DIR = os.getenv(
+    "PROFILE_DIR", os.path.join(os.path.dirname(os.path.expanduser(FAISS_INDEX_PATH)), "profiles")
+)
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+PROFILE_MAX_MB = float(os.getenv("PROFILE_MAX_MB", "200"))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# FAISS index type as an index_factory string (inner product): "Flat" is exact
+# search; e.g. "HNSW32", "IVF1024,Flat" or "IVF1024,PQ32" trade recall for speed
+# and memory (measure with benchmarks/ann_eval.py). Types that need training are
+# built by app.build_index and deduplicate_index; the online store starts exact.
+FAISS_INDEX_FACTORY = os.getenv("FAISS_INDEX_FACTORY", "Flat")
+# Search-time parameters: IVF cells probed, HNSW candidate list size (0 = FAISS default).
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "0"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "0"))
+# Startup: these models (comma-separated: embedding, reranker) load in parallel
+# threads next to the index before /ready reports ready; the others load on first use.
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "embedding,reranker")
+# Run one warm-up inference per preloaded model, so the first query is not slow.
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1") == "1"
+# Preload-and-fork serving (python -m app.serve): worker processes, torch threads
+# per worker (0 = cores / workers), seconds between index file checks (0 = only
+# reload on SIGHUP), the longest the read-only workers lag behind the writer's
+# index while it keeps changing, and how long a new worker may take to become ready.
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "2"))
+SERVE_TORCH_THREADS = int(os.getenv("SERVE_TORCH_THREADS", "0"))
+SERVE_INDEX_POLL = float(os.getenv("SERVE_INDEX_POLL", "5"))
+SERVE_INDEX_MAX_LAG = float(os.getenv("SERVE_INDEX_MAX_LAG", "60"))
+SERVE_READY_TIMEOUT = float(os.getenv("SERVE_READY_TIMEOUT", "300"))
+# Unix socket over which the other workers forward index writes to worker 0
+# (default: a per-master file in the temp directory).
+SERVE_WRITER_SOCKET = os.getenv("SERVE_WRITER_SOCKET", "")
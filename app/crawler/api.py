@@ -1,9 +1,16 @@
 from fastapi import APIRouter, BackgroundTasks, HTTPException
 from pydantic import BaseModel
 from typing import Optional
+import time
+from app import profiling
+from app.config import PROFILING_ENABLED
 import uuid
-from app.crawler.spider import NJUSpider
-from app.crawler.state import load_state
+from app.crawler.spider import ACTIVE_RUNS, Spider
+from app.crawler.sites import DEFAULT_SITE, SITES, list_sites
+from app.crawler.state import load_state, update_run_state
+from app.crawler.frontier import Frontier, list_resumable
+from app.crawler.cache import HttpCache
+from app.crawler.seen import SeenUrlStore
 
 router = APIRouter()
 
@@ -11,21 +18,88 @@ class CrawlerRunRequest(BaseModel):
     mode: str = "incremental" # incremental, full
     max_pages: int = 50
     dry_run: bool = False
+    site: str = DEFAULT_SITE  # see GET /crawler/sites
+    profile: Optional[str] = None  # profiler kind for this run (needs PROFILING_ENABLED)
 
 @router.post("/run")
 async def run_crawler(req: CrawlerRunRequest, background_tasks: BackgroundTasks):
+    if req.site not in SITES:
+        raise HTTPException(status_code=404, detail=f"Unknown crawl site: {req.site}")
+    profile = None
+    if req.profile:
+        if not PROFILING_ENABLED:
+            raise HTTPException(status_code=403, detail="Profiling is disabled (PROFILING_ENABLED)")
+        try:
+            profile = profiling.check_kind(req.profile)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     run_id = str(uuid.uuid4())
-    spider = NJUSpider(
+    spider = Spider(
         run_id=run_id,
         mode=req.mode,
         max_pages=req.max_pages,
-        dry_run=req.dry_run
+        dry_run=req.dry_run,
+        site=req.site,
+        profile=profile,
     )
     
     # Run in background
     background_tasks.add_task(spider.run)
     
-    return {"status": "accepted", "run_id": run_id, "message": "Crawler started in background"}
+    return {"status": "accepted", "run_id": run_id, "site": req.site, "message": "Crawler started in background"}
+
+@router.post("/{run_id}/cancel")
+async def cancel_crawler_run(run_id: str):
+    spider = ACTIVE_RUNS.get(run_id)
+    if spider is not None:
+        spider.cancel()
+        return {"status": "stopping", "run_id": run_id}
+    # not running in this process: a run interrupted by a restart still shows as running
+    run = next((r for r in load_state().history if r.run_id == run_id), None)
+    if run is None:
+        raise HTTPException(status_code=404, detail=f"Unknown crawler run: {run_id}")
+    if Frontier(run_id).is_live():
+        raise HTTPException(status_code=409, detail=f"Crawler run {run_id} is running in another process")
+    if run.status == "running":
+        update_run_state(run_id, status="stopped", end_time=time.time())
+        Frontier(run_id).set_status("stopped")
+        return {"status": "stopped", "run_id": run_id}
+    raise HTTPException(status_code=409, detail=f"Crawler run {run_id} is not running ({run.status})")
+
+@router.post("/{run_id}/resume")
+async def resume_crawler_run(run_id: str, background_tasks: BackgroundTasks):
+    if run_id in ACTIVE_RUNS or Frontier(run_id).is_live():
+        raise HTTPException(status_code=409, detail=f"Crawler run {run_id} is already running")
+    try:
+        spider = Spider.resume(run_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    background_tasks.add_task(spider.run)
+    return {"status": "accepted", "run_id": run_id, "site": spider.site.name, "message": "Crawler resumed in background"}
+
+@router.get("/runs")
+async def get_crawler_runs():
+    return {
+        "active": [s.stats for s in ACTIVE_RUNS.values()],
+        # runs that can be resumed from their frontier checkpoint
+        "resumable": [r for r in list_resumable() if r["run_id"] not in ACTIVE_RUNS],
+    }
+
+@router.get("/runs/{run_id}")
+async def get_crawler_run(run_id: str):
+    spider = ACTIVE_RUNS.get(run_id)
+    if spider is not None:
+        # live counters, not the last saved progress
+        return {"run": spider.stats, "active": True, "checkpoint": spider.frontier.get()}
+    run = next((r for r in load_state().history if r.run_id == run_id), None)
+    checkpoint = Frontier(run_id).get()
+    if run is None and checkpoint is None:
+        raise HTTPException(status_code=404, detail=f"Unknown crawler run: {run_id}")
+    return {"run": run, "active": False, "checkpoint": checkpoint}
+
+@router.get("/sites")
+async def get_crawler_sites():
+    return {"sites": list_sites()}
 
 @router.get("/status")
 async def get_crawler_status():
@@ -35,6 +109,10 @@ async def get_crawler_status():
     
     return {
         "last_sync_date": state.last_sync_date,
-        "total_seen_urls": len(state.seen_url_hashes),
+        "site_sync_dates": state.site_sync_dates,
+        # legacy JSON hashes are only present until the next run migrates them
+        "total_seen_urls": len(SeenUrlStore()) + len(state.seen_url_hashes),
+        "http_cache": HttpCache().stats(),
+        "active_runs": list(ACTIVE_RUNS),
         "last_run": last_run
     }
@@ -0,0 +1,84 @@
+import hashlib
+import os
+import sqlite3
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Optional
+from app.config import CRAWLER_CACHE_PATH
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    body_hash TEXT NOT NULL,
+    body BLOB,                 -- zlib-compressed; only kept for pages re-parsed on a 304
+    fetched_at REAL NOT NULL
+);
+"""
+
+def body_hash(body: bytes) -> str:
+    return hashlib.sha1(body).hexdigest()
+
+class HttpCache:
+    """
+    Persistent HTTP validator cache for the crawler (SQLite).
+    Stores ETag / Last-Modified and a body hash per URL, so a refresh can send
+    conditional requests and recognise unchanged pages even when the server
+    ignores them. Entries are written only after a page was fully processed.
+    """
+    def __init__(self, path: str = CRAWLER_CACHE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _conn(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def get(self, url: str) -> Optional[Dict]:
+        with self._conn() as conn:
+            row = conn.execute("SELECT * FROM pages WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        entry = dict(row)
+        entry["body"] = zlib.decompress(entry["body"]) if entry["body"] is not None else None
+        return entry
+
+    def conditional_headers(self, entry: Optional[Dict]) -> Dict[str, str]:
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def put(self, url: str, content_hash: str, etag: Optional[str] = None, last_modified: Optional[str] = None,
+            body: Optional[bytes] = None):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO pages (url, etag, last_modified, body_hash, body, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, content_hash,
+                 zlib.compress(body) if body is not None else None, time.time()),
+            )
+
+    def touch(self, url: str):
+        with self._conn() as conn:
+            conn.execute("UPDATE pages SET fetched_at = ? WHERE url = ?", (time.time(), url))
+
+    def stats(self) -> Dict:
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) AS pages, COALESCE(SUM(LENGTH(body)), 0) AS body_bytes FROM pages"
+            ).fetchone()
+        return dict(row)
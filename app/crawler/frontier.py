@@ -0,0 +1,143 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Set
+from app.config import CRAWLER_FRONTIER_PATH, CRAWLER_HEARTBEAT_INTERVAL
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    site TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    max_pages INTEGER NOT NULL,
+    dry_run INTEGER NOT NULL,
+    next_page INTEGER NOT NULL DEFAULT 1,   -- first list page not fully queued yet
+    list_done INTEGER NOT NULL DEFAULT 0,
+    latest_date TEXT,
+    status TEXT NOT NULL,                   -- running, failed, stopped
+    updated_at REAL NOT NULL                -- also the heartbeat of a running run
+);
+CREATE TABLE IF NOT EXISTS articles (
+    run_id TEXT NOT NULL,
+    url_hash TEXT NOT NULL,
+    article TEXT NOT NULL,                  -- list entry as JSON: url, title, date, is_top
+    done INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (run_id, url_hash)
+);
+"""
+
+# fields of a list-page article worth keeping; the fetched page is attached later
+_ARTICLE_FIELDS = ("url", "title", "date", "is_top", "url_hash")
+
+class Frontier:
+    """
+    Persistent crawl frontier of one run (SQLite): the list page to continue
+    from and the articles queued but not finished yet. An article is marked
+    done only once its outcome is durable (committed to the index, or skipped),
+    so a resumed run redoes at most the work that was in flight.
+    A completed run's frontier is deleted.
+    """
+    def __init__(self, run_id: str, path: str = CRAWLER_FRONTIER_PATH):
+        self.run_id = run_id
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _conn(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def start(self, site: str, mode: str, max_pages: int, dry_run: bool):
+        """Register the run; a resumed run keeps its checkpoint."""
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO runs (run_id, site, mode, max_pages, dry_run, status, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 'running', ?)",
+                (self.run_id, site, mode, max_pages, int(dry_run), time.time()),
+            )
+            conn.execute("UPDATE runs SET status = 'running', updated_at = ? WHERE run_id = ?",
+                         (time.time(), self.run_id))
+
+    def get(self) -> Optional[Dict]:
+        with self._conn() as conn:
+            row = conn.execute("SELECT * FROM runs WHERE run_id = ?", (self.run_id,)).fetchone()
+            if row is None:
+                return None
+            run = dict(row)
+            run["pending"] = conn.execute(
+                "SELECT COUNT(*) FROM articles WHERE run_id = ? AND done = 0", (self.run_id,)
+            ).fetchone()[0]
+        run["dry_run"] = bool(run["dry_run"])
+        run["list_done"] = bool(run["list_done"])
+        return run
+
+    def add(self, articles: Iterable[Dict]):
+        rows = [(self.run_id, a["url_hash"], json.dumps({k: a[k] for k in _ARTICLE_FIELDS}, ensure_ascii=False))
+                for a in articles]
+        if rows:
+            with self._conn() as conn:
+                conn.executemany("INSERT OR IGNORE INTO articles (run_id, url_hash, article) VALUES (?, ?, ?)", rows)
+
+    def done(self, url_hashes: Iterable[str]):
+        rows = [(self.run_id, h) for h in url_hashes]
+        if rows:
+            with self._conn() as conn:
+                conn.executemany("UPDATE articles SET done = 1 WHERE run_id = ? AND url_hash = ?", rows)
+
+    def pending(self) -> List[Dict]:
+        with self._conn() as conn:
+            rows = conn.execute(
+                "SELECT article FROM articles WHERE run_id = ? AND done = 0", (self.run_id,)
+            ).fetchall()
+        return [json.loads(r["article"]) for r in rows]
+
+    def known(self) -> Set[str]:
+        """URL hashes already queued by this run, done or not."""
+        with self._conn() as conn:
+            rows = conn.execute("SELECT url_hash FROM articles WHERE run_id = ?", (self.run_id,)).fetchall()
+        return {r["url_hash"] for r in rows}
+
+    def checkpoint(self, next_page: int, latest_date: Optional[str], list_done: bool = False):
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE runs SET next_page = ?, latest_date = ?, list_done = ?, updated_at = ? WHERE run_id = ?",
+                (next_page, latest_date, int(list_done), time.time(), self.run_id),
+            )
+
+    def heartbeat(self):
+        with self._conn() as conn:
+            conn.execute("UPDATE runs SET updated_at = ? WHERE run_id = ?", (time.time(), self.run_id))
+
+    def is_live(self) -> bool:
+        """Marked running with a recent heartbeat: the run is going on in some process."""
+        run = self.get()
+        return (run is not None and run["status"] == "running"
+                and time.time() - run["updated_at"] < 3 * CRAWLER_HEARTBEAT_INTERVAL)
+
+    def set_status(self, status: str):
+        with self._conn() as conn:
+            conn.execute("UPDATE runs SET status = ?, updated_at = ? WHERE run_id = ?",
+                         (status, time.time(), self.run_id))
+
+    def finish(self):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM articles WHERE run_id = ?", (self.run_id,))
+            conn.execute("DELETE FROM runs WHERE run_id = ?", (self.run_id,))
+
+def list_resumable(path: str = CRAWLER_FRONTIER_PATH) -> List[Dict]:
+    """Runs with a frontier left behind (failed, stopped, or interrupted while running)."""
+    if not os.path.exists(path):
+        return []
+    frontier = Frontier("", path)
+    with frontier._conn() as conn:
+        rows = conn.execute("SELECT run_id FROM runs ORDER BY updated_at DESC").fetchall()
+    return [Frontier(r["run_id"], path).get() for r in rows]
@@ -1,59 +1,73 @@
-from bs4 import BeautifulSoup
 from datetime import datetime
 import re
 from typing import Optional, Tuple, List, Dict
-from app.crawler.utils import normalize_url
+from app.crawler.utils import normalize_url, decode_html, class_xpath, element_text, parse_html
+
+_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+def _first(node, *xpaths):
+    """First element matched by any of the xpaths, in order of preference (like `a or b`)."""
+    for xp in xpaths:
+        found = node.xpath(xp)
+        if found:
+            return found[0]
+    return None
+
+def _text(el) -> str:
+    # same as BeautifulSoup get_text(strip=True)
+    return "".join(s.strip() for s in el.itertext()) if el is not None else ""
 
 class NJUParser:
     BASE_URL = "https://is.nju.edu.cn"
-    
+
     @staticmethod
     def parse_list_page(html: str, base_url: str) -> List[Dict]:
         """
         Parse list page to extract articles.
         Returns list of dicts: {url, title, date, is_top}
         """
-        soup = BeautifulSoup(html, "lxml")
+        tree = parse_html(html)
+        if tree is None:
+            return []
         articles = []
-        
+
         # Try common WebPLUS selectors
         # .news_list, .wp_article_list, etc.
-        # Based on previous analysis or standard templates
-        
         # Strategy: Find the main list container
         # Usually ul.news_list or similar
-        container = soup.select_one(".news_list") or soup.select_one(".wp_article_list")
-        
-        if not container:
+        container = _first(tree, f"//*[{class_xpath('news_list')}]", f"//*[{class_xpath('wp_article_list')}]")
+
+        if container is None:
             # Fallback: look for any ul/table with many links and dates
             return []
 
-        items = container.find_all("li") # Assuming li structure
-        
-        for item in items:
-            link_tag = item.find("a")
-            if not link_tag:
+        for item in container.iter("li"): # Assuming li structure
+            link_tag = _first(item, ".//a")
+            if link_tag is None:
                 continue
-                
+
             url = normalize_url(base_url, link_tag.get("href"))
-            title = link_tag.get("title") or link_tag.get_text(strip=True)
-            
+            title = link_tag.get("title") or _text(link_tag)
+
             # Date extraction
-            date_tag = item.select_one(".Article_PublishDate") or item.select_one(".news_meta") or item.find("span", class_="date")
+            date_tag = _first(
+                item,
+                f".//*[{class_xpath('Article_PublishDate')}]",
+                f".//*[{class_xpath('news_meta')}]",
+                f".//span[{class_xpath('date')}]",
+            )
             date_str = ""
-            if date_tag:
-                date_str = date_tag.get_text(strip=True)
+            if date_tag is not None:
+                date_str = _text(date_tag)
             else:
                 # Try regex on text
-                match = re.search(r"\d{4}-\d{2}-\d{2}", item.get_text())
+                match = _DATE_RE.search(item.text_content())
                 if match:
                     date_str = match.group(0)
-            
+
             # Top detection (heuristic)
-            is_top = False
-            if item.select_one(".top") or item.select_one("img[src*='top']"):
-                is_top = True
-                
+            is_top = bool(item.xpath(f".//*[{class_xpath('top')}] | .//img[contains(@src, 'top')]"))
+
             if url and title:
                 articles.append({
                     "url": url,
@@ -61,44 +75,50 @@ class NJUParser:
                     "date": date_str,
                     "is_top": is_top
                 })
-                
+
         return articles
 
     @staticmethod
     def parse_detail_page(html: str) -> Dict:
         """
         Parse detail page to extract content and metadata.
+        The page is parsed once; 'content' is the cleaned text of the content node.
         """
-        soup = BeautifulSoup(html, "lxml")
-        
+        tree = parse_html(html)
+        if tree is None:
+            return {"title": "", "content": "", "publish_date": "", "meta_text": ""}
+
         # Title
-        title_tag = soup.select_one(".arti_title")
-        title = title_tag.get_text(strip=True) if title_tag else ""
-        
-        # Content
-        content_tag = soup.select_one(".arti_content") or soup.select_one(".wp_articlecontent")
-        # Remove noise inside content before extraction
-        if content_tag:
-            # Remove scripts/styles inside content
-            for tag in content_tag(["script", "style"]):
-                tag.decompose()
-            content_html = str(content_tag)
-        else:
-            content_html = ""
-            
+        title = _text(_first(tree, f"//*[{class_xpath('arti_title')}]"))
+
+        # Content: text straight from the node, noise removed in place
+        content_tag = _first(tree, f"//*[{class_xpath('arti_content')}]", f"//*[{class_xpath('wp_articlecontent')}]")
+        content = element_text(content_tag) if content_tag is not None else ""
+
         # Meta (Date, Source)
-        meta_tag = soup.select_one(".arti_metas") or soup.select_one(".arti_update")
-        meta_text = meta_tag.get_text(strip=True) if meta_tag else ""
-        
+        meta_text = _text(_first(tree, f"//*[{class_xpath('arti_metas')}]", f"//*[{class_xpath('arti_update')}]"))
+
         # Extract date from meta text if possible
         publish_date = ""
-        match = re.search(r"\d{4}-\d{2}-\d{2}", meta_text)
+        match = _DATE_RE.search(meta_text)
         if match:
             publish_date = match.group(0)
-            
+
         return {
             "title": title,
-            "content_html": content_html,
+            "content": content,
             "publish_date": publish_date,
             "meta_text": meta_text
         }
+
+
+# Module-level entry points taking raw response bytes, so the whole CPU-bound
+# part of a page (charset detection, parsing, cleaning) can run in a worker process.
+# `parser` is the site's parser plugin class (see app/crawler/sites.py).
+
+def parse_list_bytes(content_bytes: bytes, base_url: str, content_type: Optional[str] = None,
+                     parser=NJUParser) -> List[Dict]:
+    return parser.parse_list_page(decode_html(content_bytes, content_type), base_url)
+
+def parse_detail_bytes(content_bytes: bytes, content_type: Optional[str] = None, parser=NJUParser) -> Dict:
+    return parser.parse_detail_page(decode_html(content_bytes, content_type))
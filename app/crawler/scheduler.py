@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import random
+import time
+import urllib.robotparser
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from app import metrics
+from app.config import (
+    CRAWLER_HOST_MAX_CONCURRENCY, CRAWLER_HOST_START_DELAY, CRAWLER_HOST_MIN_DELAY,
+    CRAWLER_HOST_MAX_DELAY, CRAWLER_RESPECT_ROBOTS,
+)
+
+logger = logging.getLogger(__name__)
+
+FETCHES = metrics.counter("crawler_fetches_total", "Crawler HTTP requests by status code ('error': no response).",
+                          ["status"])
+FETCH_SECONDS = metrics.histogram("crawler_fetch_seconds", "Crawler HTTP request latency.")
+
+# A response slower than this multiple of the host's best latency counts as congestion.
+LATENCY_TOLERANCE = 2.0
+_EWMA_ALPHA = 0.3
+
+class HostState:
+    """
+    AIMD politeness state of one host.
+    `window` bounds concurrent requests and `delay` spaces request starts. Fast
+    successes grow the window additively (+1 per window of responses), latency
+    well above the host's best halves it; any success shrinks the delay, while
+    429/5xx and errors halve the window and double the delay. The delay never drops below the robots.txt
+    crawl-delay.
+    """
+    def __init__(self, host: str, max_window: int = CRAWLER_HOST_MAX_CONCURRENCY,
+                 delay: float = CRAWLER_HOST_START_DELAY, min_delay: float = CRAWLER_HOST_MIN_DELAY,
+                 max_delay: float = CRAWLER_HOST_MAX_DELAY):
+        self.host = host
+        self.max_window = max_window
+        self.window = 1.0
+        self.delay = delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.inflight = 0
+        self.next_start = 0.0
+        self.last_decrease = 0.0
+        self.latency: Optional[float] = None      # EWMA
+        self.best_latency: Optional[float] = None
+        self.robots: Optional[urllib.robotparser.RobotFileParser] = None
+        self.requests = 0
+        self.throttled = 0
+        self._changed = asyncio.Event()
+
+    def set_crawl_delay(self, seconds: float):
+        self.min_delay = max(self.min_delay, seconds)
+        self.delay = max(self.delay, seconds)
+
+    async def acquire(self) -> float:
+        """Wait for a slot; returns the (loop clock) start time of the request."""
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self.inflight < int(self.window):
+                if now >= self.next_start:
+                    self.inflight += 1
+                    # small jitter so several crawlers do not fall into lockstep
+                    self.next_start = now + self.delay * random.uniform(0.9, 1.1)
+                    return now
+                timeout = self.next_start - now
+            else:
+                timeout = None
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, status: Optional[int], latency: float, retry_after: Optional[float] = None,
+                started: float = 0.0):
+        now = asyncio.get_running_loop().time()
+        self.inflight -= 1
+        self.requests += 1
+        throttled = status is None or status == 429 or status >= 500
+        slow = False
+        if not throttled:
+            self.latency = latency if self.latency is None else (1 - _EWMA_ALPHA) * self.latency + _EWMA_ALPHA * latency
+            # the baseline is the lowest smoothed latency, so a few tiny responses do not set it
+            self.best_latency = self.latency if self.best_latency is None else min(self.best_latency, self.latency)
+            slow = self.latency > LATENCY_TOLERANCE * self.best_latency and self.latency > 0.05
+        if throttled or slow:
+            self.throttled += throttled
+            # like TCP, back off once per round trip: responses to requests sent
+            # before the last decrease reflect the old rate
+            if started >= self.last_decrease:
+                self.last_decrease = now
+                self.window = max(1.0, self.window / 2)
+                if throttled:
+                    self.delay = min(self.max_delay, max(self.delay * 2, self.min_delay, 0.1))
+            if retry_after:
+                self.delay = min(self.max_delay, max(self.delay, retry_after))
+                self.next_start = max(self.next_start, now + retry_after)
+        else:
+            self.window = min(float(self.max_window), self.window + 1 / self.window)
+        if not throttled:
+            self.delay = max(self.min_delay, self.delay * 0.8)
+        self._changed.set()
+
+    def info(self) -> Dict:
+        return {
+            "host": self.host,
+            "window": round(self.window, 2),
+            "delay": round(self.delay, 3),
+            "min_delay": self.min_delay,
+            "inflight": self.inflight,
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "best_latency": round(self.best_latency, 3) if self.best_latency is not None else None,
+            "requests": self.requests,
+            "throttled": self.throttled,
+        }
+
+def _retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None  # HTTP-date form: fall back to the backoff
+
+class HostScheduler:
+    """
+    Per-host politeness for one crawl: an AIMD HostState per host, plus
+    robots.txt (Disallow and Crawl-delay) fetched once per host.
+    """
+    def __init__(self, user_agent: str = "*", respect_robots: bool = CRAWLER_RESPECT_ROBOTS):
+        self.user_agent = user_agent
+        self.respect_robots = respect_robots
+        self.hosts: Dict[str, HostState] = {}
+        self._robots_lock = asyncio.Lock()
+
+    def host_state(self, url: str) -> HostState:
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        if host not in self.hosts:
+            self.hosts[host] = HostState(host)
+        return self.hosts[host]
+
+    async def _load_robots(self, session, state: HostState):
+        async with self._robots_lock:
+            if state.robots is not None:
+                return
+            robots = urllib.robotparser.RobotFileParser()
+            try:
+                async with session.get(f"{state.host}/robots.txt", timeout=10) as resp:
+                    if resp.status >= 400:
+                        robots.parse([])  # no robots.txt: everything allowed
+                    else:
+                        robots.parse((await resp.text(errors="replace")).splitlines())
+            except Exception as e:
+                logger.warning(f"Could not fetch robots.txt for {state.host}: {e}")
+                robots.parse([])
+            state.robots = robots
+            crawl_delay = robots.crawl_delay(self.user_agent)
+            if crawl_delay:
+                logger.info(f"{state.host}: robots.txt crawl-delay {crawl_delay}s")
+                state.set_crawl_delay(float(crawl_delay))
+
+    async def allowed(self, session, url: str) -> bool:
+        if not self.respect_robots:
+            return True
+        state = self.host_state(url)
+        if state.robots is None:
+            await self._load_robots(session, state)
+        return state.robots.can_fetch(self.user_agent, url)
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """
+        Hold a request slot for url's host. The body reports the outcome through
+        the yielded dict: 'status' (None on a network error), 'retry_after' and
+        optionally 'latency' (defaults to the time the slot was held).
+        """
+        state = self.host_state(url)
+        started = await state.acquire()
+        outcome = {"status": None, "retry_after": None, "latency": None}
+        start = time.monotonic()
+        try:
+            yield outcome
+        finally:
+            latency = outcome["latency"] if outcome["latency"] is not None else time.monotonic() - start
+            FETCHES.inc(status=outcome["status"] or "error")
+            FETCH_SECONDS.observe(latency)
+            state.release(outcome["status"], latency, _retry_after(outcome["retry_after"]), started)
+
+    def stats(self):
+        return [s.info() for s in self.hosts.values()]
@@ -0,0 +1,77 @@
+import os
+import threading
+from typing import Iterable, Optional
+from app.crawler.state import STATE_FILE, CrawlerState, edit_state
+
+SEEN_FILE = os.path.splitext(STATE_FILE)[0] + "_seen.bin"
+DIGEST_SIZE = 20  # sha1
+
+class SeenUrlStore:
+    """
+    Persistent set of crawled URL hashes (hex SHA1, as compute_hash returns).
+    Held in memory as a set of 20-byte digests for O(1) membership; persisted as an
+    append-only file of raw digests, so saving costs only the new entries and
+    nothing is ever forgotten.
+    """
+    def __init__(self, path: str = SEEN_FILE):
+        self.path = path
+        self._digests = set()
+        self._pending = []
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            # ignore a torn trailing record from an interrupted append
+            usable = len(data) - len(data) % DIGEST_SIZE
+            self._digests.update(data[i:i + DIGEST_SIZE] for i in range(0, usable, DIGEST_SIZE))
+
+    @staticmethod
+    def _digest(url_hash: str) -> Optional[bytes]:
+        try:
+            digest = bytes.fromhex(url_hash)
+        except ValueError:
+            return None
+        return digest if len(digest) == DIGEST_SIZE else None
+
+    def __contains__(self, url_hash: str) -> bool:
+        return self._digest(url_hash) in self._digests
+
+    def __len__(self) -> int:
+        return len(self._digests)
+
+    def add(self, url_hash: str):
+        digest = self._digest(url_hash)
+        if digest is None:
+            raise ValueError(f"Not a SHA1 hex digest: {url_hash!r}")
+        with self._lock:
+            if digest not in self._digests:
+                self._digests.add(digest)
+                self._pending.append(digest)
+
+    def update(self, url_hashes: Iterable[str]):
+        for h in url_hashes:
+            if self._digest(h) is not None:
+                self.add(h)
+
+    def flush(self):
+        """Append the entries added since the last flush."""
+        with self._lock:
+            if not self._pending:
+                return
+            data, self._pending = b"".join(self._pending), []
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+def load_seen_urls(state: CrawlerState) -> SeenUrlStore:
+    """Open the seen-URL store, moving any hashes still kept in the JSON state into it."""
+    store = SeenUrlStore()
+    if state.seen_url_hashes:
+        store.update(state.seen_url_hashes)
+        store.flush()
+        state.seen_url_hashes = []
+        with edit_state() as stored:
+            stored.seen_url_hashes = []
+    return store
@@ -0,0 +1,84 @@
+"""
+Crawl site registry. A site is a news list (first page + paged template) and a
+parser plugin: any class with static parse_list_page(html, base_url) and
+parse_detail_page(html) methods returning the same fields as NJUParser.
+Parsers must be importable module-level classes, since they run in the parse
+process pool.
+
+Extra sites can be declared without code in the JSON file named by
+CRAWLER_SITES_FILE:
+    [{"name": "nju-cs", "first_page_url": "https://cs.nju.edu.cn/1654/list.htm",
+      "list_url_template": "https://cs.nju.edu.cn/1654/list{}.htm",
+      "source": "cs.nju.edu.cn", "parser": "webplus"}]
+"""
+import json
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Type
+from urllib.parse import urlsplit
+
+from app.config import CRAWLER_SITES_FILE
+from app.crawler.parser import NJUParser
+
+logger = logging.getLogger(__name__)
+
+# Parser plugins by name. NJUParser's selectors are the standard WebPlus CMS
+# templates used across NJU department sites.
+PARSERS: Dict[str, Type] = {"webplus": NJUParser, "nju": NJUParser}
+
+@dataclass
+class SiteSpec:
+    name: str
+    first_page_url: str
+    list_url_template: str  # "{}" is replaced by the page number (2, 3, ...)
+    source: str = ""        # meta 'source' of ingested chunks; defaults to the host
+    parser: Type = NJUParser
+
+    def __post_init__(self):
+        if not self.source:
+            self.source = urlsplit(self.first_page_url).netloc
+
+    def list_url(self, page: int) -> str:
+        return self.first_page_url if page == 1 else self.list_url_template.format(page)
+
+    def info(self) -> Dict:
+        return {"name": self.name, "first_page_url": self.first_page_url,
+                "source": self.source, "parser": self.parser.__name__}
+
+DEFAULT_SITE = "nju-is"
+
+SITES: Dict[str, SiteSpec] = {}
+
+def register_site(spec: SiteSpec):
+    SITES[spec.name] = spec
+
+def get_site(name: str) -> SiteSpec:
+    if name not in SITES:
+        raise KeyError(f"Unknown crawl site: {name}")
+    return SITES[name]
+
+def list_sites() -> List[Dict]:
+    return [s.info() for s in SITES.values()]
+
+def load_sites_file(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    for e in entries:
+        parser = e.pop("parser", "webplus")
+        if parser not in PARSERS:
+            raise ValueError(f"Unknown parser '{parser}' for site {e.get('name')}")
+        register_site(SiteSpec(parser=PARSERS[parser], **e))
+
+register_site(SiteSpec(
+    name=DEFAULT_SITE,
+    first_page_url="https://is.nju.edu.cn/57162/list.htm",  # News list
+    list_url_template="https://is.nju.edu.cn/57162/list{}.htm",
+    source="is.nju.edu.cn",
+    parser=NJUParser,
+))
+
+if CRAWLER_SITES_FILE:
+    try:
+        load_sites_file(CRAWLER_SITES_FILE)
+    except Exception as e:
+        logger.error(f"Failed to load crawl sites from {CRAWLER_SITES_FILE}: {e}")
@@ -1,38 +1,94 @@
 import asyncio
 import aiohttp
+import multiprocessing
 import time
 import logging
-import random
 import ssl
-from typing import List, Optional, Dict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, NamedTuple, Optional, Dict
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-import chardet
 
-from app.crawler.state import CrawlerState, RunStats, update_run_state, load_state
-from app.crawler.parser import NJUParser
-from app.crawler.utils import compute_hash, clean_text
-from app.utils.chunker import chunk_text
-from app.embeddings import get_embeddings
-from app.vectorstore import add_embeddings
+from app.crawler.state import CrawlerState, RunStats, edit_state, load_state
+from app.crawler.cache import HttpCache, body_hash
+from app.crawler.seen import load_seen_urls
+from app.crawler.frontier import Frontier
+from app.crawler.parser import parse_list_bytes, parse_detail_bytes
+from app.crawler.scheduler import HostScheduler
+from app.crawler.sites import DEFAULT_SITE, get_site
+from app.crawler.utils import compute_hash
+from app import metrics, profiling
+from app.ingest import ingest_documents
+from app.vectorstore import save_index
+from app.config import (
+    CRAWLER_MAX_CONCURRENCY, CRAWLER_LIST_PREFETCH, CRAWLER_DETAIL_WORKERS,
+    CRAWLER_PARSE_WORKERS, CRAWLER_INGEST_BATCH, CRAWLER_PARSE_PROCESSES, CRAWLER_COMMIT_ARTICLES,
+    CRAWLER_PROGRESS_INTERVAL, CRAWLER_HEARTBEAT_INTERVAL,
+)
 
 logger = logging.getLogger(__name__)
 
-class NJUSpider:
-    def __init__(self, run_id: str, mode: str = "incremental", max_pages: int = 50, dry_run: bool = False):
+# Runs in progress in this process, by run_id (for cancel and live progress)
+ACTIVE_RUNS: Dict[str, "Spider"] = {}
+
+ARTICLES = metrics.counter("crawler_articles_ingested_total", "Crawled articles ingested into the index.")
+CACHE_HITS = metrics.counter("crawler_cache_hits_total", "Pages found unchanged (304 or same body hash).", ["page"])
+ERRORS = metrics.counter("crawler_errors_total", "Crawler errors by kind of page.", ["kind"])
+metrics.gauge("crawler_active_runs", "Crawler runs in progress.").set_function(lambda: len(ACTIVE_RUNS))
+
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+class Page(NamedTuple):
+    url: str
+    body: Optional[bytes]          # None on 304
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    not_modified: bool = False
+    content_type: Optional[str] = None
+
+    @property
+    def hash(self) -> Optional[str]:
+        return body_hash(self.body) if self.body is not None else None
+
+class Spider:
+    """
+    Crawler core for one site of the registry (app/crawler/sites.py): walks its
+    news list, fetches and parses articles with the site's parser plugin, and
+    ingests them. Requests go through a per-host adaptive politeness scheduler.
+    Progress is checkpointed to a persistent frontier: Spider.resume(run_id)
+    continues an interrupted, failed or cancelled run.
+    """
+    def __init__(self, run_id: str, mode: str = "incremental", max_pages: int = 50, dry_run: bool = False,
+                 site: str = DEFAULT_SITE, profile: Optional[str] = None):
         self.run_id = run_id
         self.mode = mode
         self.max_pages = max_pages
         self.dry_run = dry_run
+        self.site = get_site(site)
         self.state = load_state()
-        self.stats = RunStats(run_id=run_id, start_time=time.time(), mode=mode)
+        self.seen = load_seen_urls(self.state)
+        self.stats = RunStats(run_id=run_id, start_time=time.time(), mode=mode, site=self.site.name)
+        self.frontier = Frontier(run_id)
+        self.profile = profile  # profiler kind for this run (app/profiling.py), or None
+        self.resumed = False
+        self._task = None
+        self._cancelled = False
+        self._last_progress = 0.0
         
-        # Concurrency control
-        self.sem = asyncio.Semaphore(3) # Max 3 concurrent requests
+        # Concurrency control: a global cap, and adaptive per-host windows and delays
+        self.sem = asyncio.Semaphore(CRAWLER_MAX_CONCURRENCY) # Max concurrent requests
+        self.scheduler = HostScheduler()
         self.session = None
+        self.latest_date_seen = None
+        # CPU-bound work runs off the event loop: HTML parsing in worker processes,
+        # embedding/commit in one thread (torch releases the GIL)
+        self.parse_pool = None
+        self.ingest_pool = None
+        self.uncommitted = []  # ingested articles whose index additions are not persisted yet
+        self.cache = HttpCache()
         
         # Target Config
-        self.list_url_template = "https://is.nju.edu.cn/57162/list{}.htm" # News list
-        self.first_page_url = "https://is.nju.edu.cn/57162/list.htm"
+        self.list_url_template = self.site.list_url_template
+        self.first_page_url = self.site.first_page_url
         
         # SSL Context for legacy servers
         self.ssl_context = ssl.create_default_context()
@@ -43,55 +99,127 @@ class NJUSpider:
         except Exception:
             pass # Ignore if set_ciphers fails (e.g. on some systems)
 
+    @classmethod
+    def resume(cls, run_id: str) -> "Spider":
+        """A spider continuing run_id from its frontier checkpoint (KeyError if there is none)."""
+        checkpoint = Frontier(run_id).get()
+        if checkpoint is None:
+            raise KeyError(f"No checkpoint for crawler run {run_id}")
+        spider = cls(run_id, mode=checkpoint["mode"], max_pages=checkpoint["max_pages"],
+                     dry_run=checkpoint["dry_run"], site=checkpoint["site"])
+        spider.resumed = True
+        # keep counting from the interrupted run's stats
+        for run in spider.state.history:
+            if run.run_id == run_id:
+                spider.stats = run.model_copy(update={"status": "running", "end_time": None})
+        return spider
+
+    def cancel(self):
+        """Stop the run; what was committed stays, the rest remains in the frontier."""
+        self._cancelled = True
+        if self._task is not None:
+            self._task.cancel()
+
     async def run(self):
-        logger.info(f"Starting crawler run {self.run_id} in {self.mode} mode")
+        logger.info(f"{'Resuming' if self.resumed else 'Starting'} crawler run {self.run_id} "
+                    f"for {self.site.name} in {self.mode} mode")
+        ACTIVE_RUNS[self.run_id] = self
+        self.frontier.start(self.site.name, self.mode, self.max_pages, self.dry_run)
+        # the run is in the history from the start, and its counters are saved as it goes
+        self._save_state()
+        if CRAWLER_PARSE_PROCESSES > 0:
+            # spawn, not fork: the server process runs torch with its own threads
+            self.parse_pool = ProcessPoolExecutor(
+                CRAWLER_PARSE_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+            )
+        else:
+            self.parse_pool = ThreadPoolExecutor(CRAWLER_PARSE_WORKERS, thread_name_prefix="crawler-parse")
+        self.ingest_pool = ThreadPoolExecutor(1, thread_name_prefix="crawler-ingest")
+        trace = None
+        heartbeat = asyncio.create_task(self._heartbeat())
         try:
             connector = aiohttp.TCPConnector(ssl=self.ssl_context)
             async with aiohttp.ClientSession(connector=connector) as session:
                 self.session = session
-                await self._crawl_loop()
-                
+                # profiles the event loop thread; parsing in the process pool is not included
+                with profiling.maybe_profile(self.profile or profiling.take("crawler"), f"crawler-{self.run_id}") as trace:
+                    self._task = asyncio.create_task(self._crawl_loop())
+                    await self._task
+
             self.stats.status = "completed"
+        except asyncio.CancelledError:
+            if not self._cancelled:
+                raise
+            logger.info(f"Crawler run {self.run_id} cancelled")
+            self.stats.status = "stopped"
         except Exception as e:
             logger.error(f"Crawler run failed: {e}", exc_info=True)
             self.stats.status = "failed"
             self.stats.errors.append(str(e))
         finally:
+            heartbeat.cancel()
+            if self.uncommitted:
+                # commit whatever was embedded, even if the run failed part-way
+                await self._commit()
+            self.parse_pool.shutdown(wait=False, cancel_futures=True)
+            self.ingest_pool.shutdown(wait=True)
             self.stats.end_time = time.time()
-            # Update history
-            self.state.history.append(self.stats)
-            # Trim history
-            if len(self.state.history) > 10:
-                self.state.history = self.state.history[-10:]
-            
+            self.stats.hosts = self.scheduler.stats()
+            if trace is not None:
+                self.stats.profile_trace = trace.name
+            if self.stats.status == "completed":
+                self.frontier.finish()
+            else:
+                self.frontier.set_status(self.stats.status)
+            ACTIVE_RUNS.pop(self.run_id, None)
+
             # Update last sync date if successful and not dry run
             if self.stats.status == "completed" and not self.dry_run:
                 # Find the latest date in this run (if any)
                 # This logic needs to be robust. For now, we rely on the loop to have found the latest.
                 pass 
-                
-            self.state.save()
+
+            self._save_state()
             logger.info(f"Crawler run finished. Stats: {self.stats}")
 
+    async def _heartbeat(self):
+        """Keep the frontier's updated_at fresh, so other processes can tell the run is alive."""
+        while True:
+            await asyncio.sleep(CRAWLER_HEARTBEAT_INTERVAL)
+            self.frontier.heartbeat()
+
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=2, max=10),
         retry=retry_if_exception_type((aiohttp.ClientError, asyncio.TimeoutError))
     )
-    async def _fetch(self, url: str, method: str = "GET", check_content: bool = False) -> Optional[bytes]:
-        async with self.sem:
-            # Random delay
-            await asyncio.sleep(random.uniform(0.3, 0.6))
-            
+    async def _fetch_page(self, url: str, method: str = "GET", check_content: bool = False,
+                          cached: Optional[Dict] = None) -> Optional[Page]:
+        """
+        Fetch a page, as a conditional request when a cache entry is given.
+        Returns None for skipped content, a Page with not_modified=True on 304.
+        """
+        if not await self.scheduler.allowed(self.session, url):
+            logger.warning(f"Disallowed by robots.txt: {url}")
+            return None
+        # the host slot paces requests (window + delay); the semaphore caps the run overall
+        async with self.scheduler.slot(url) as outcome, self.sem:
             headers = {
-                "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+                "User-Agent": USER_AGENT,
+                **self.cache.conditional_headers(cached),
             }
             
-            if check_content:
-                # Use GET but check headers before reading body
-                async with self.session.get(url, headers=headers, timeout=10) as resp:
-                    resp.raise_for_status()
-                    
+            start = time.monotonic()
+            async with self.session.request(method, url, headers=headers, timeout=10) as resp:
+                outcome["status"] = resp.status
+                outcome["retry_after"] = resp.headers.get("Retry-After")
+                resp.raise_for_status()
+                if resp.status == 304:
+                    outcome["latency"] = time.monotonic() - start
+                    return Page(url, None, not_modified=True)
+
+                if check_content:
+                    # Check headers before reading body
                     # Check Content-Type
                     ctype = resp.headers.get("Content-Type", "").lower()
                     if "text/html" not in ctype:
@@ -103,127 +231,325 @@ class NJUSpider:
                     if cl and int(cl) > 5 * 1024 * 1024: # 5MB limit
                         logger.warning(f"Skipping large file: {url} ({cl} bytes)")
                         return None
-                        
-                    return await resp.read()
-            else:
-                async with self.session.request(method, url, headers=headers, timeout=10) as resp:
-                    resp.raise_for_status()
-                    return await resp.read()
+
+                body = await resp.read()
+                outcome["latency"] = time.monotonic() - start
+                return Page(url, body, resp.headers.get("ETag"), resp.headers.get("Last-Modified"),
+                            content_type=resp.headers.get("Content-Type"))
+
+    async def _fetch(self, url: str, method: str = "GET", check_content: bool = False) -> Optional[bytes]:
+        page = await self._fetch_page(url, method, check_content)
+        return page.body if page else None
 
     async def _crawl_loop(self):
-        page = 1
-        stop_crawling = False
-        latest_date_seen = None
+        """
+        Staged pipeline connected by bounded queues:
+        list pages (fetched CRAWLER_LIST_PREFETCH ahead) -> detail fetch workers
+        -> parse workers -> one ingest stage that embeds and commits articles in
+        batches. The list stage keeps paging while earlier articles are still
+        being fetched and embedded; full queues push back on the stages before them.
+        """
+        detail_q = asyncio.Queue(maxsize=CRAWLER_DETAIL_WORKERS * 4)
+        parse_q = asyncio.Queue(maxsize=CRAWLER_PARSE_WORKERS * 4)
+        ingest_q = asyncio.Queue(maxsize=CRAWLER_INGEST_BATCH * 2)
 
-        while page <= self.max_pages and not stop_crawling:
-            url = self.first_page_url if page == 1 else self.list_url_template.format(page)
-            logger.info(f"Fetching list page: {url}")
-            
+        async def close(queue, consumers):
+            for _ in range(consumers):
+                await queue.put(None)
+
+        async def details():
+            await asyncio.gather(*(self._detail_worker(detail_q, parse_q) for _ in range(CRAWLER_DETAIL_WORKERS)))
+            await close(parse_q, CRAWLER_PARSE_WORKERS)
+
+        async def parsers():
+            await asyncio.gather(*(self._parse_worker(parse_q, ingest_q) for _ in range(CRAWLER_PARSE_WORKERS)))
+            await close(ingest_q, 1)
+
+        async def lists():
             try:
-                content_bytes = await self._fetch(url)
-                if not content_bytes:
-                    logger.warning(f"Failed to fetch list page content: {url}")
-                    break
+                await self._list_stage(detail_q)
+            finally:
+                await close(detail_q, CRAWLER_DETAIL_WORKERS)
+
+        tasks = [asyncio.create_task(c) for c in (lists(), details(), parsers(), self._ingest_stage(ingest_q))]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for t in tasks:
+                t.cancel()
+
+        # Update the site's last sync date if we found something new
+        if self.latest_date_seen and not self.dry_run:
+            last_sync_date = self.state.get_sync_date(self.site.name)
+            if not last_sync_date or self.latest_date_seen > last_sync_date:
+                self.state.set_sync_date(self.site.name, self.latest_date_seen)
+
+    def _page_url(self, page: int) -> str:
+        # attributes rather than self.site.list_url, so a run can be pointed elsewhere
+        return self.first_page_url if page == 1 else self.list_url_template.format(page)
+
+    async def _fetch_list_page(self, page: int) -> List[Dict]:
+        url = self._page_url(page)
+        logger.info(f"Fetching list page: {url}")
+        cached = self.cache.get(url)
+        fetched = await self._fetch_page(url, cached=cached if cached and cached["body"] else None)
+        content_type = None
+        if fetched and fetched.not_modified:
+            self.stats.unchanged_count += 1
+            CACHE_HITS.inc(page="list")
+            content_bytes = cached["body"]
+        else:
+            content_type = fetched.content_type if fetched else None
+            content_bytes = fetched.body if fetched else None
+            if content_bytes:
+                # list pages keep their body: a 304 still has to be parsed for its links
+                self.cache.put(url, fetched.hash, fetched.etag, fetched.last_modified, body=content_bytes)
+        if not content_bytes:
+            logger.warning(f"Failed to fetch list page content: {url}")
+            return []
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.parse_pool, parse_list_bytes, content_bytes, url, content_type, self.site.parser
+        )
+
+    async def _list_stage(self, detail_q: asyncio.Queue):
+        """Walk the list pages in order, keeping the next pages in flight, and queue new articles."""
+        prefetch = {}
+        # pinned articles repeat on every list page; a resumed run also skips what it queued before
+        queued = self.frontier.known()
+        last_sync_date = self.state.get_sync_date(self.site.name)
+        page = 1
+        if self.resumed:
+            checkpoint = self.frontier.get()
+            pending = self.frontier.pending()
+            logger.info(f"Resuming at list page {checkpoint['next_page']} with {len(pending)} pending articles")
+            page = self.max_pages + 1 if checkpoint["list_done"] else checkpoint["next_page"]
+            self.latest_date_seen = checkpoint["latest_date"]
+            for article in pending:
+                await detail_q.put(article)
+        try:
+            while page <= self.max_pages:
+                for p in range(page, min(page + CRAWLER_LIST_PREFETCH, self.max_pages) + 1):
+                    if p not in prefetch:
+                        prefetch[p] = asyncio.create_task(self._fetch_list_page(p))
+                try:
+                    articles = await prefetch.pop(page)
+                except Exception as e:
+                    url = self._page_url(page)
+                    logger.error(f"Error processing list page {url}: {e}")
+                    self.stats.error_count += 1
+                    ERRORS.inc(kind="list")
+                    self.stats.errors.append(f"List page {url}: {str(e)}")
+                    if page == 1: # If first page fails, probably critical
+                        raise
+                    page += 1
+                    continue
 
-                # Auto-detect encoding
-                encoding = chardet.detect(content_bytes)['encoding'] or 'utf-8'
-                html = content_bytes.decode(encoding, errors='replace')
-                
-                articles = NJUParser.parse_list_page(html, url)
-                
                 if not articles:
                     logger.warning(f"No articles found on page {page}. Stopping.")
                     break
-                
+
+                new_articles = []
+                stop = False
                 for article in articles:
                     # Check if we should stop (Incremental logic)
-                    if self.mode == "incremental" and self.state.last_sync_date:
+                    if self.mode == "incremental" and last_sync_date:
                         if not article["is_top"]: # Ignore top posts for date check
-                            if article["date"] < self.state.last_sync_date:
-                                logger.info(f"Found old article ({article['date']} < {self.state.last_sync_date}). Stopping.")
-                                stop_crawling = True
+                            if article["date"] < last_sync_date:
+                                logger.info(f"Found old article ({article['date']} < {last_sync_date}). Stopping.")
+                                stop = True
                                 break
-                    
+
                     # Track latest date for state update
-                    if not latest_date_seen or (article["date"] > latest_date_seen):
-                        latest_date_seen = article["date"]
+                    if not self.latest_date_seen or (article["date"] > self.latest_date_seen):
+                        self.latest_date_seen = article["date"]
 
-                    # Process article
-                    await self._process_article(article)
-                    
+                    # Deduplication (URL level)
+                    article["url_hash"] = compute_hash(article["url"])
+                    if article["url_hash"] in queued:
+                        continue
+                    queued.add(article["url_hash"])
+                    # full mode revalidates seen URLs through the HTTP cache instead
+                    if self.mode != "full" and article["url_hash"] in self.seen:
+                        logger.info(f"Skipping seen URL: {article['url']}")
+                        self.stats.skipped_count += 1
+                        continue
+                    new_articles.append(article)
+                # record the page's articles before queueing them, then move the checkpoint past it
+                self.frontier.add(new_articles)
+                for article in new_articles:
+                    await detail_q.put(article)
+                if stop:
+                    break
                 page += 1
-                
+                self.frontier.checkpoint(page, self.latest_date_seen)
+            self.frontier.checkpoint(page, self.latest_date_seen, list_done=True)
+        finally:
+            for t in prefetch.values():
+                t.cancel()
+
+    async def _detail_worker(self, detail_q: asyncio.Queue, parse_q: asyncio.Queue):
+        while True:
+            article = await detail_q.get()
+            if article is None:
+                return
+            url = article["url"]
+            logger.info(f"Processing article: {url}")
+            cached = self.cache.get(url)
+            try:
+                # Fetch detail with content check
+                page = await self._fetch_page(url, check_content=True, cached=cached)
             except Exception as e:
-                logger.error(f"Error processing list page {url}: {e}")
-                self.stats.error_count += 1
-                self.stats.errors.append(f"List page {url}: {str(e)}")
-                # Don't stop entire run for one page error, but maybe break if critical
-                if page == 1: # If first page fails, probably critical
-                    raise e
-        
-        # Update state last_sync_date if we found something new
-        if latest_date_seen and not self.dry_run:
-            if not self.state.last_sync_date or latest_date_seen > self.state.last_sync_date:
-                self.state.last_sync_date = latest_date_seen
-
-    async def _process_article(self, article_meta: Dict):
-        url = article_meta["url"]
-        url_hash = compute_hash(url)
-        
-        # Deduplication (URL level)
-        if url_hash in self.state.seen_url_hashes:
-            logger.info(f"Skipping seen URL: {url}")
-            self.stats.skipped_count += 1
-            return
-            
-        logger.info(f"Processing article: {url}")
-        try:
-            # Fetch detail with content check
-            content_bytes = await self._fetch(url, check_content=True)
-            if not content_bytes:
+                self._article_error(url, e)
+                continue
+            if not page:
                 self.stats.skipped_count += 1
-                return
+                self._article_done(article)
+                continue
+            if page.not_modified or (cached and page.hash == cached["body_hash"]):
+                # unchanged since it was last processed: no parsing, no embedding
+                logger.info(f"Unchanged article: {url}")
+                self.stats.unchanged_count += 1
+                CACHE_HITS.inc(page="detail")
+                self.cache.touch(url)
+                self._article_done(article)
+                continue
+            article["page"] = page
+            await parse_q.put((article, page.body))
 
-            encoding = chardet.detect(content_bytes)['encoding'] or 'utf-8'
-            html = content_bytes.decode(encoding, errors='replace')
-            
-            detail = NJUParser.parse_detail_page(html)
-            clean_content = clean_text(detail["content_html"])
-            
-            if not clean_content or len(clean_content) < 50:
-                logger.warning(f"Content too short for {url}, skipping.")
+    async def _parse_article(self, article: Dict, content_bytes: bytes) -> Optional[Dict]:
+        """Decode and extract an article in the parse pool; returns an ingest document or None if too short."""
+        loop = asyncio.get_running_loop()
+        page = article.get("page")
+        detail = await loop.run_in_executor(
+            self.parse_pool, parse_detail_bytes, content_bytes, page.content_type if page else None, self.site.parser
+        )
+        clean_content = detail["content"]
+        if not clean_content or len(clean_content) < 50:
+            return None
+        return {
+            "text": clean_content,
+            "source": self.site.source,
+            "id_prefix": article["url_hash"],
+            "meta": {
+                "url": article["url"],
+                "title": detail["title"],
+                "publish_date": detail["publish_date"] or article["date"],
+            },
+        }
+
+    async def _parse_worker(self, parse_q: asyncio.Queue, ingest_q: asyncio.Queue):
+        while True:
+            item = await parse_q.get()
+            if item is None:
+                return
+            article, content_bytes = item
+            try:
+                doc = await self._parse_article(article, content_bytes)
+            except Exception as e:
+                self._article_error(article["url"], e)
+                continue
+            if doc is None:
+                logger.warning(f"Content too short for {article['url']}, skipping.")
                 self.stats.skipped_count += 1
+                if not self.dry_run:
+                    self._cache_page(article)
+                self._article_done(article)
+                continue
+            if self.dry_run:
+                logger.info(f"[DRY RUN] Would ingest {article['url']} ({len(doc['text'])} chars)")
+                self.stats.fetched_count += 1
+                self._article_done(article)
+                continue
+            await ingest_q.put((article, doc))
+
+    async def _ingest_stage(self, ingest_q: asyncio.Queue):
+        """
+        Embed parsed articles in batches of up to CRAWLER_INGEST_BATCH, in the ingest
+        thread. Articles that arrive while a batch is embedding form the next batch.
+        """
+        done = False
+        while not done:
+            item = await ingest_q.get()
+            if item is None:
                 return
+            batch = [item]
+            # take whatever else is already waiting, without holding back a partial batch
+            while len(batch) < CRAWLER_INGEST_BATCH and not ingest_q.empty():
+                item = ingest_q.get_nowait()
+                if item is None:
+                    done = True
+                    break
+                batch.append(item)
+            await self._ingest_batch(batch)
 
-            # Ingestion
-            if not self.dry_run:
-                # Chunking
-                chunks = chunk_text(clean_content, chunk_size=512, overlap=64)
-                
-                # Embedding & Storage
-                embeddings = get_embeddings(chunks)
-                metas = [{
-                    "source": "is.nju.edu.cn",
-                    "url": url,
-                    "title": detail["title"],
-                    "publish_date": detail["publish_date"] or article_meta["date"],
-                    "id": f"{url_hash}_{idx}",
-                    "text": c
-                } for idx, c in enumerate(chunks)]
-                
-                add_embeddings(embeddings, metas)
-                self.stats.ingested_count += 1
-                
-                # Update seen hashes
-                self.state.seen_url_hashes.append(url_hash)
-                # Trim seen hashes if too big
-                if len(self.state.seen_url_hashes) > 10000:
-                    self.state.seen_url_hashes = self.state.seen_url_hashes[-10000:]
-            else:
-                logger.info(f"[DRY RUN] Would ingest {url} ({len(clean_content)} chars)")
-                self.stats.fetched_count += 1
+    async def _ingest_batch(self, batch):
+        articles = [a for a, _ in batch]
+        loop = asyncio.get_running_loop()
+        # the index is persisted once per CRAWLER_COMMIT_ARTICLES articles, not per batch
+        results = await loop.run_in_executor(
+            self.ingest_pool, lambda: ingest_documents([doc for _, doc in batch], persist=False)
+        )
+        for article, result in zip(articles, results):
+            if result["status"] == "failed":
+                self._article_error(article["url"], result.get("error"))
+                continue
+            self.stats.ingested_count += 1
+            ARTICLES.inc()
+            self.uncommitted.append(article)
+        if len(self.uncommitted) >= CRAWLER_COMMIT_ARTICLES:
+            await self._commit()
+        else:
+            self._save_progress()
 
-        except Exception as e:
-            logger.error(f"Error processing article {url}: {e}")
-            self.stats.error_count += 1
-            self.stats.errors.append(f"Article {url}: {str(e)}")
+    async def _commit(self):
+        """
+        Persist the index, then mark its articles as seen and cached: a crash before
+        the persist leaves them to be crawled again rather than silently missing.
+        """
+        articles, self.uncommitted = self.uncommitted, []
+        await asyncio.get_running_loop().run_in_executor(self.ingest_pool, save_index)
+        for article in articles:
+            self._cache_page(article)
+            # Update seen hashes
+            self.seen.add(article["url_hash"])
+        self.seen.flush()
+        self.frontier.done(a["url_hash"] for a in articles)
+        self._save_progress(force=True)
+
+    def _article_done(self, article: Dict):
+        """An article finished without anything to commit (skipped, unchanged, dry run)."""
+        self.frontier.done([article["url_hash"]])
+        self._save_progress()
+
+    def _save_progress(self, force: bool = False):
+        """Save the run's counters to the state file, at most every CRAWLER_PROGRESS_INTERVAL seconds."""
+        now = time.monotonic()
+        if force or now - self._last_progress >= CRAWLER_PROGRESS_INTERVAL:
+            self._last_progress = now
+            self._save_state()
+
+    def _save_state(self):
+        """Merge this run's entry and its site's sync date into the state file."""
+        sync_date = self.state.get_sync_date(self.site.name)
+        with edit_state() as state:
+            state.record_run(self.stats)
+            stored = state.get_sync_date(self.site.name)
+            if sync_date and (not stored or sync_date > stored):
+                state.set_sync_date(self.site.name, sync_date)
+
+    def _cache_page(self, article: Dict):
+        """Record the validators of a processed article, so a refresh can skip it while unchanged."""
+        page = article.get("page")
+        if page is not None:
+            self.cache.put(page.url, page.hash, page.etag, page.last_modified)
+
+    def _article_error(self, url: str, error):
+        logger.error(f"Error processing article {url}: {error}")
+        self.stats.error_count += 1
+        ERRORS.inc(kind="article")
+        self.stats.errors.append(f"Article {url}: {str(error)}")
+
+
+# The original single-site crawler; Spider(run_id, ...) defaults to the same site.
+NJUSpider = Spider
@@ -1,5 +1,7 @@
+from contextlib import contextmanager
 from pydantic import BaseModel, Field
 from typing import List, Dict, Optional
+import fcntl
 import json
 import os
 import time
@@ -13,23 +15,47 @@ class RunStats(BaseModel):
     end_time: Optional[float] = None
     status: str = "running"  # running, completed, failed, stopped
     mode: str = "incremental"
+    site: str = "nju-is"
     fetched_count: int = 0
     ingested_count: int = 0
     skipped_count: int = 0
+    unchanged_count: int = 0  # revalidated pages that were not modified (304 or same body hash)
     error_count: int = 0
     errors: List[str] = []
+    hosts: List[Dict] = []  # per-host politeness scheduler state at the end of the run
+    profile_trace: Optional[str] = None  # name of the run's profiling trace, if it was profiled
 
 class CrawlerState(BaseModel):
-    last_sync_date: Optional[str] = None  # YYYY-MM-DD
+    last_sync_date: Optional[str] = None  # YYYY-MM-DD, of the default site
+    site_sync_dates: Dict[str, str] = Field(default_factory=dict)  # other sites
     last_sync_ts: float = 0.0
-    seen_url_hashes: List[str] = Field(default_factory=list) # Keep recent N
+    seen_url_hashes: List[str] = Field(default_factory=list) # Legacy; migrated into SeenUrlStore (seen.py)
     history: List[RunStats] = Field(default_factory=list) # Keep recent N runs
 
+    def get_sync_date(self, site: str) -> Optional[str]:
+        if site == "nju-is":
+            return self.last_sync_date
+        return self.site_sync_dates.get(site)
+
+    def set_sync_date(self, site: str, date: str):
+        if site == "nju-is":
+            self.last_sync_date = date
+        else:
+            self.site_sync_dates[site] = date
+
+    def record_run(self, stats: RunStats):
+        """Replace the run's history entry, or append it keeping the last 10 runs."""
+        for i, run in enumerate(self.history):
+            if run.run_id == stats.run_id:
+                self.history[i] = stats
+                return
+        self.history = self.history[-9:] + [stats]
+
     def save(self):
         # Atomic write
         temp_file = STATE_FILE + ".tmp"
         with open(temp_file, "w", encoding="utf-8") as f:
-            f.write(self.model_dump_json(indent=2))
+            f.write(self.model_dump_json())
         os.replace(temp_file, STATE_FILE)
 
 def load_state() -> CrawlerState:
@@ -42,13 +68,25 @@ def load_state() -> CrawlerState:
     except Exception:
         return CrawlerState()
 
-def update_run_state(run_id: str, **kwargs):
-    state = load_state()
-    for run in state.history:
-        if run.run_id == run_id:
-            updated = run.model_copy(update=kwargs)
-            # Update in place
-            idx = state.history.index(run)
-            state.history[idx] = updated
+@contextmanager
+def edit_state():
+    """
+    Load the state under a file lock and save it back on exit. Concurrent runs
+    and the API each change only their own entries, so they merge instead of
+    overwriting each other's history and sync dates.
+    """
+    with open(STATE_FILE + ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            state = load_state()
+            yield state
             state.save()
-            return
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def update_run_state(run_id: str, **kwargs):
+    with edit_state() as state:
+        for idx, run in enumerate(state.history):
+            if run.run_id == run_id:
+                state.history[idx] = run.model_copy(update=kwargs)
+                return
@@ -1,42 +1,101 @@
+import codecs
 import hashlib
 import re
-from bs4 import BeautifulSoup
+from typing import Optional
+import chardet
+import lxml.etree
+import lxml.html
 
 def compute_hash(text: str) -> str:
     return hashlib.sha1(text.encode("utf-8")).hexdigest()
 
+_HEADER_CHARSET_RE = re.compile(r"charset=[\"']?([\w.:-]+)", re.I)
+_META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([\w.:-]+)""", re.I)
+# Declared legacy Chinese charsets are decoded with their superset
+_CHARSET_ALIASES = {"gb2312": "gb18030", "gbk": "gb18030", "x-gbk": "gb18030"}
+
+def _known_charset(name) -> Optional[str]:
+    if not name:
+        return None
+    name = name.decode("ascii", "ignore") if isinstance(name, bytes) else name
+    name = _CHARSET_ALIASES.get(name.strip().lower(), name.strip())
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+def detect_charset(content_bytes: bytes, content_type: Optional[str] = None) -> str:
+    """
+    Encoding of an HTML body: the Content-Type header charset, else a <meta>
+    declaration in the first 4 KB, and only then chardet over the whole body.
+    """
+    if content_type:
+        m = _HEADER_CHARSET_RE.search(content_type)
+        charset = _known_charset(m.group(1)) if m else None
+        if charset:
+            return charset
+    m = _META_CHARSET_RE.search(content_bytes[:4096])
+    charset = _known_charset(m.group(1)) if m else None
+    if charset:
+        return charset
+    return chardet.detect(content_bytes)['encoding'] or 'utf-8'
+
+def decode_html(content_bytes: bytes, content_type: Optional[str] = None) -> str:
+    return content_bytes.decode(detect_charset(content_bytes, content_type), errors='replace')
+
+def class_xpath(name: str) -> str:
+    """XPath predicate matching elements whose class list contains name (CSS '.name')."""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+# Tags and (heuristic) noise containers dropped before text extraction
+_NOISE_TAGS = ("script", "style", "nav", "footer", "iframe", "noscript")
+_NOISE_NAMES = ("header", "footer", "nav", "sidebar", "menu",
+                "breadcrumb", "pagination", "prev-next", "related-posts")
+_NOISE_IDS = ("header", "footer", "nav", "sidebar")
+_NOISE_XPATH = " | ".join(
+    [f".//{t}" for t in _NOISE_TAGS]
+    + [f".//*[{class_xpath(c)}]" for c in _NOISE_NAMES]
+    + [f".//*[@id='{i}']" for i in _NOISE_IDS]
+)
+
+_XML_DECL_RE = re.compile(r"^\s*<\?xml[^>]*\?>")
+
+def parse_html(html: str):
+    """
+    lxml tree of decoded HTML, or None for an empty document. An XML declaration
+    is dropped first: lxml refuses str input that names an encoding.
+    """
+    html = _XML_DECL_RE.sub("", html, count=1)
+    if not html.strip():
+        return None
+    try:
+        return lxml.html.fromstring(html)
+    except lxml.etree.ParserError:  # e.g. only comments
+        return None
+
+def _drop(el):
+    # drop_tree keeps the tail text, which belongs to the parent
+    if el.getparent() is not None:
+        el.drop_tree()
+
+def element_text(node) -> str:
+    """
+    Clean text of an lxml element: noise removed (in one XPath pass), one line per
+    text node, whitespace normalised.
+    """
+    for el in node.xpath(_NOISE_XPATH):
+        _drop(el)
+    lines = (line.strip() for piece in node.itertext() for line in piece.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return "\n".join(chunk for chunk in chunks if chunk)
+
 def clean_text(html_content: str) -> str:
     """
     Clean HTML content to extract pure text for RAG.
     Removes scripts, styles, navs, footers, etc.
     """
-    if not html_content:
-        return ""
-    
-    soup = BeautifulSoup(html_content, "lxml")
-    
-    # Remove unwanted tags
-    for tag in soup(["script", "style", "nav", "footer", "iframe", "noscript"]):
-        tag.decompose()
-        
-    # Remove common noise classes/ids (heuristic)
-    noise_selectors = [
-        ".header", ".footer", ".nav", ".sidebar", ".menu", 
-        ".breadcrumb", ".pagination", ".prev-next", ".related-posts",
-        "#header", "#footer", "#nav", "#sidebar"
-    ]
-    for selector in noise_selectors:
-        for tag in soup.select(selector):
-            tag.decompose()
-
-    text = soup.get_text(separator="\n")
-    
-    # Normalize whitespace
-    lines = (line.strip() for line in text.splitlines())
-    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-    text = "\n".join(chunk for chunk in chunks if chunk)
-    
-    return text
+    tree = parse_html(html_content or "")
+    return element_text(tree) if tree is not None else ""
 
 def normalize_url(base_url: str, link: str) -> str:
     if not link:
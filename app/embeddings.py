@@ -1,13 +1,22 @@
 import os
+import threading
 from typing import List
 import numpy as np
-import torch
-from transformers import AutoTokenizer, AutoModel
-from app.config import EMBEDDING_MODEL_PATH
+from app.config import EMBEDDING_MODEL_PATH, EMBED_BATCH_SIZE
 
+# torch and transformers are imported on first use: importing them takes seconds,
+# and processes that never embed (crawler workers, chunking pools) skip that cost
 _tokenizer = None
 _model = None
-_device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+_device = None
+_lock = threading.Lock()  # concurrent first callers load the model once
+
+def _get_device():
+    global _device
+    if _device is None:
+        import torch
+        _device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    return _device
 
 def _resolve_model_path(mpath: str) -> str:
     """
@@ -29,26 +38,58 @@ def _resolve_model_path(mpath: str) -> str:
     return mpath
 
 def load_model(force_reload: bool = False):
-    global _tokenizer, _model, _device
+    global _tokenizer, _model
     if _model is None or _tokenizer is None or force_reload:
-        name = _resolve_model_path(EMBEDDING_MODEL_PATH)
-        # If name is a path, transformers will load from local files; if it's an id, it will fetch from HF hub/cache.
-        _tokenizer = AutoTokenizer.from_pretrained(name, use_fast=True)
-        _model = AutoModel.from_pretrained(name)
-        _model.to(_device)
-        _model.eval()
+        with _lock:
+            if _model is None or _tokenizer is None or force_reload:
+                from transformers import AutoTokenizer, AutoModel
+                name = _resolve_model_path(EMBEDDING_MODEL_PATH)
+                # If name is a path, transformers will load from local files; if it's an id, it will fetch from HF hub/cache.
+                tokenizer = AutoTokenizer.from_pretrained(name, use_fast=True)
+                model = AutoModel.from_pretrained(name)
+                model.to(_get_device())
+                model.eval()
+                # publish the model last: a caller that sees it also sees its tokenizer
+                _tokenizer = tokenizer
+                _model = model
     return _tokenizer, _model
 
+def load_tokenizer():
+    """Tokenizer only (no model weights), e.g. for chunking in worker processes."""
+    global _tokenizer
+    if _tokenizer is None:
+        with _lock:
+            if _tokenizer is None:
+                from transformers import AutoTokenizer
+                _tokenizer = AutoTokenizer.from_pretrained(_resolve_model_path(EMBEDDING_MODEL_PATH), use_fast=True)
+    return _tokenizer
+
+def warm_up():
+    """One embedding pass over a full batch, so the first query does not pay for allocator and kernel set-up."""
+    get_embeddings(["预热" * (16 * (i + 1)) for i in range(EMBED_BATCH_SIZE)], batch_size=EMBED_BATCH_SIZE)
+
 def mean_pooling(model_output, attention_mask):
+    import torch
     token_embeddings = model_output.last_hidden_state  # (batch_size, seq_len, hidden)
     input_mask_expanded = attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
     summed = torch.sum(token_embeddings * input_mask_expanded, dim=1)
     summed_mask = torch.clamp(input_mask_expanded.sum(dim=1), min=1e-9)
     return (summed / summed_mask)
 
-def get_embeddings(texts: List[str], batch_size: int = 8, progress: bool = False) -> np.ndarray:
+def get_embeddings(texts: List[str], batch_size: int = 8, progress: bool = False,
+                   sort_by_length: bool = True) -> np.ndarray:
+    """
+    Embed texts in batches; rows of the result follow the input order.
+    With sort_by_length, batches are formed from texts of similar length so
+    little compute is spent on padding.
+    """
+    import torch
     tok, model = load_model()
-    device = _device
+    device = _get_device()
+    order = None
+    if sort_by_length and len(texts) > batch_size:
+        order = np.argsort([len(t) for t in texts], kind="stable")
+        texts = [texts[i] for i in order]
     embeddings = []
     total = len(texts)
     total_batches = (total + batch_size - 1) // batch_size if batch_size > 0 else 1
@@ -62,4 +103,20 @@ def get_embeddings(texts: List[str], batch_size: int = 8, progress: bool = False
             pooled = mean_pooling(out, enc["attention_mask"])  # tensor (bs, dim)
             pooled = torch.nn.functional.normalize(pooled, p=2, dim=1)  # L2 normalize (useful for cosine)
             embeddings.append(pooled.cpu().numpy())
-    return np.vstack(embeddings)
+    result = np.vstack(embeddings)
+    if order is not None:
+        restored = np.empty_like(result)
+        restored[order] = result
+        result = restored
+    return result
+
+def count_tokens(texts: List[str]) -> List[int]:
+    """
+    Number of tokens per text under the embedding tokenizer (no special tokens).
+    Used to size prompts and chunks with the same tokenizer the model sees.
+    """
+    if not texts:
+        return []
+    tok, _ = load_model()
+    enc = tok(list(texts), add_special_tokens=False, truncation=False)
+    return [len(ids) for ids in enc["input_ids"]]
@@ -0,0 +1,145 @@
+import logging
+import time
+from typing import Dict, List
+import numpy as np
+from app import metrics
+from app.utils.chunker import chunk_documents
+from app.utils.simhash import simhash, SimHashIndex
+from app.embeddings import get_embeddings
+from app.vectorstore import apply_changes, content_hash, doc_key, get_doc_chunks, find_near_duplicate
+from app.config import EMBED_BATCH_SIZE, NEAR_DUP_MODE, NEAR_DUP_MAX_DISTANCE, NEAR_DUP_MIN_CHARS
+
+logger = logging.getLogger(__name__)
+
+# Default source of the API models: such documents have no identity, so they are
+# only ever added to, never diffed away by a later document.
+ANONYMOUS_SOURCE = "local"
+
+INGEST_DOCUMENTS = metrics.counter("rag_ingest_documents_total", "Ingested documents by status.", ["status"])
+INGEST_CHUNKS = metrics.counter(
+    "rag_ingest_chunks_total", "Ingested chunks by outcome (embedded, unchanged, near_duplicate, removed).", ["result"]
+)
+INGEST_SECONDS = metrics.histogram("rag_ingest_batch_seconds", "Embedding and commit time of one ingest batch.")
+
+def _record(results: List[Dict]) -> List[Dict]:
+    for r in results:
+        INGEST_DOCUMENTS.inc(status=r["status"])
+        if r["status"] != "completed":
+            continue
+        for field, result in (("embedded", "embedded"), ("unchanged", "unchanged"),
+                              ("near_duplicates", "near_duplicate"), ("removed", "removed")):
+            if r.get(field):
+                INGEST_CHUNKS.inc(r[field], result=result)
+    return results
+
+def ingest_documents(docs: List[Dict], batch_size: int = EMBED_BATCH_SIZE, persist: bool = True) -> List[Dict]:
+    """
+    Ingest many documents as one batch.
+    docs: [{'text': str, 'source': str, 'meta': dict (optional, copied into every chunk's meta),
+            'id_prefix': str (optional, chunk ids become '<id_prefix>_<idx>')}]
+    Every chunk is stored with a content hash. A document already in the index
+    (same url, else same source) is diffed against its stored chunks: unchanged
+    chunks keep their vectors, only new or edited chunks are embedded, and chunks
+    that disappeared are tombstoned. New chunks that are near-duplicates (SimHash)
+    of a chunk of another document, stored or earlier in the batch, are not
+    embedded: per NEAR_DUP_MODE they are linked as an alias of that chunk or dropped.
+    The remaining new chunks of the whole batch are pooled, embedded in
+    length-sorted batches and committed with one apply_changes call.
+    Returns one result per document, in input order:
+    {'source', 'status': 'completed' | 'empty' | 'failed', 'chunks', 'embedded',
+     'unchanged', 'near_duplicates', 'removed', 'error' (if failed)}.
+    """
+    results = [
+        {"source": d.get("source", ANONYMOUS_SOURCE), "status": "empty", "chunks": 0,
+         "embedded": 0, "unchanged": 0, "near_duplicates": 0, "removed": 0}
+        for d in docs
+    ]
+    if not docs:
+        return results
+    try:
+        chunk_lists = chunk_documents([d.get("text") or "" for d in docs])
+    except Exception as e:
+        logger.error(f"Chunking failed for batch of {len(docs)} documents: {e}")
+        for r in results:
+            r.update(status="failed", error=str(e))
+        return _record(results)
+
+    texts, metas, owners = [], [], []
+    updates, tombstones = {}, []
+    stored_by_key, last_owner = {}, {}
+    dedup = NEAR_DUP_MODE in ("link", "reject")
+    aliases = {}                     # stored index id -> aliases to record
+    batch_near_dup = SimHashIndex(NEAR_DUP_MAX_DISTANCE)  # new chunks of this batch, by position
+    for doc_idx, (doc, chunks) in enumerate(zip(docs, chunk_lists)):
+        if not chunks:
+            # a blank fetch is not a deletion; leave any stored chunks alone
+            continue
+        result = results[doc_idx]
+        prefix = doc.get("id_prefix")
+        extra = doc.get("meta") or {}
+        base = {**extra, "source": result["source"]}
+        key = doc_key(base)
+        if key not in stored_by_key:
+            # documents repeated within the batch share one pool of stored chunks
+            stored_by_key[key] = get_doc_chunks(key)
+        stored = stored_by_key[key]
+        last_owner[key] = doc_idx
+        exclude_key = None if key == ANONYMOUS_SOURCE else key
+        for idx, c in enumerate(chunks):
+            h = content_hash(c)
+            meta = {**base, "id": f"{prefix}_{idx}" if prefix else idx, "text": c, "hash": h}
+            if dedup:
+                meta["simhash"] = simhash(c)
+            kept = stored.get(h)
+            if kept:
+                updates[kept.pop(0)] = meta
+                result["unchanged"] += 1
+                continue
+            if dedup and len(c) >= NEAR_DUP_MIN_CHARS:
+                # everything but the text, so the alias can stand in for the chunk if that is removed
+                alias = {k: v for k, v in meta.items() if k not in ("text", "hash", "simhash")}
+                hit = find_near_duplicate(meta["simhash"], exclude_key)
+                if hit is not None:
+                    result["near_duplicates"] += 1
+                    if NEAR_DUP_MODE == "link":
+                        aliases.setdefault(hit[0], []).append(alias)
+                    continue
+                pending = batch_near_dup.query(
+                    meta["simhash"], lambda pos: exclude_key is not None and doc_key(metas[pos]) == exclude_key
+                )
+                if pending is not None:
+                    result["near_duplicates"] += 1
+                    if NEAR_DUP_MODE == "link":
+                        metas[pending[0]].setdefault("aliases", []).append(alias)
+                    continue
+                batch_near_dup.add(len(metas), meta["simhash"])
+            texts.append(c)
+            metas.append(meta)
+            owners.append(doc_idx)
+            result["embedded"] += 1
+        result["chunks"] = len(chunks)
+    for key, stored in stored_by_key.items():
+        if key == ANONYMOUS_SOURCE:
+            continue
+        removed = [idx for ids in stored.values() for idx in ids]
+        tombstones.extend(removed)
+        results[last_owner[key]]["removed"] = len(removed)
+
+    touched = [i for i, r in enumerate(results) if r["chunks"]]
+    if not touched:
+        return _record(results)
+    t_start = time.perf_counter()
+    try:
+        embeddings = (get_embeddings(texts, batch_size=batch_size, sort_by_length=True)
+                      if texts else np.zeros((0, 0), dtype="float32"))
+        apply_changes(embeddings, metas, updates, tombstones, aliases=aliases, persist=persist)
+    except Exception as e:
+        logger.error(f"Embedding/commit failed for batch of {len(docs)} documents: {e}")
+        for doc_idx in touched:
+            results[doc_idx].update(status="failed", error=str(e))
+        return _record(results)
+    INGEST_SECONDS.observe(time.perf_counter() - t_start)
+
+    for doc_idx in touched:
+        results[doc_idx]["status"] = "completed"
+    return _record(results)
@@ -0,0 +1,294 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from app.ingest import ingest_documents
+from app import metrics, profiling
+from app.config import JOBS_DB_PATH, INGEST_BATCH_DOCS, INGEST_WORKERS, JOB_MAX_ATTEMPTS
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,            -- queued, running, completed, failed
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_run_at REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    total_docs INTEGER NOT NULL,
+    done_docs INTEGER NOT NULL DEFAULT 0,
+    failed_docs INTEGER NOT NULL DEFAULT 0,
+    chunks INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS job_docs (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    text TEXT NOT NULL,
+    meta TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending, completed, empty, failed
+    chunks INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    PRIMARY KEY (job_id, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, next_run_at);
+"""
+
+
+class JobStore:
+    """
+    SQLite-backed ingest job queue.
+    A job is a list of documents; each committed batch of documents is recorded,
+    so a job interrupted by a crash or restart resumes with its pending documents only.
+    """
+    def __init__(self, path: str = JOBS_DB_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _conn(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, docs: List[Dict]) -> str:
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO jobs (id, status, created_at, updated_at, total_docs) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, now, now, len(docs)),
+            )
+            conn.executemany(
+                "INSERT INTO job_docs (job_id, seq, source, text, meta) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (job_id, seq, d.get("source", "local"), d.get("text") or "",
+                     json.dumps(d["meta"], ensure_ascii=False) if d.get("meta") else None)
+                    for seq, d in enumerate(docs)
+                ],
+            )
+            conn.execute("COMMIT")
+        return job_id
+
+    def claim(self) -> Optional[str]:
+        """Atomically take the oldest runnable job; returns its id or None."""
+        with self._conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' AND next_run_at <= ? ORDER BY created_at LIMIT 1",
+                (time.time(),),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?", (time.time(), row["id"])
+            )
+            conn.execute("COMMIT")
+            return row["id"]
+
+    def recover(self) -> int:
+        """Requeue jobs left 'running' by a previous process."""
+        with self._conn() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running'", (time.time(),)
+            )
+            return cur.rowcount
+
+    def pending_docs(self, job_id: str, limit: int) -> List[Dict]:
+        with self._conn() as conn:
+            rows = conn.execute(
+                "SELECT seq, source, text, meta FROM job_docs WHERE job_id = ? AND status IN ('pending', 'failed') "
+                "ORDER BY seq LIMIT ?",
+                (job_id, limit),
+            ).fetchall()
+        return [
+            {"seq": r["seq"], "source": r["source"], "text": r["text"],
+             "meta": json.loads(r["meta"]) if r["meta"] else None}
+            for r in rows
+        ]
+
+    def commit_docs(self, job_id: str, docs: List[Dict], results: List[Dict]):
+        """Record the outcome of one ingested batch (after the index was persisted)."""
+        with self._conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "UPDATE job_docs SET status = ?, chunks = ?, error = ? WHERE job_id = ? AND seq = ?",
+                [(r["status"], r["chunks"], r.get("error"), job_id, d["seq"]) for d, r in zip(docs, results)],
+            )
+            conn.execute(
+                """UPDATE jobs SET updated_at = ?,
+                   done_docs = (SELECT COUNT(*) FROM job_docs WHERE job_id = ? AND status IN ('completed', 'empty')),
+                   failed_docs = (SELECT COUNT(*) FROM job_docs WHERE job_id = ? AND status = 'failed'),
+                   chunks = (SELECT COALESCE(SUM(chunks), 0) FROM job_docs WHERE job_id = ?)
+                   WHERE id = ?""",
+                (time.time(), job_id, job_id, job_id, job_id),
+            )
+            conn.execute("COMMIT")
+
+    def complete(self, job_id: str):
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'completed', error = NULL, updated_at = ? WHERE id = ?",
+                (time.time(), job_id),
+            )
+
+    def retry_or_fail(self, job_id: str, error: str, max_attempts: int = JOB_MAX_ATTEMPTS):
+        """Count a failed attempt; requeue with exponential backoff until max_attempts."""
+        with self._conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            attempts = (row["attempts"] if row else 0) + 1
+            if attempts < max_attempts:
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', attempts = ?, error = ?, next_run_at = ?, updated_at = ? WHERE id = ?",
+                    (attempts, error, time.time() + min(300, 5 * 2 ** (attempts - 1)), time.time(), job_id),
+                )
+            else:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', attempts = ?, error = ?, updated_at = ? WHERE id = ?",
+                    (attempts, error, time.time(), job_id),
+                )
+            conn.execute("COMMIT")
+
+    def get(self, job_id: str, include_docs: bool = False) -> Optional[Dict]:
+        with self._conn() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = dict(row)
+            job["progress"] = (job["done_docs"] + job["failed_docs"]) / job["total_docs"] if job["total_docs"] else 1.0
+            if include_docs:
+                job["documents"] = [
+                    dict(r) for r in conn.execute(
+                        "SELECT seq, source, status, chunks, error FROM job_docs WHERE job_id = ? ORDER BY seq",
+                        (job_id,),
+                    )
+                ]
+        return job
+
+    def counts(self) -> Dict[str, int]:
+        with self._conn() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {r["status"]: r["n"] for r in rows}
+
+    def list(self, limit: int = 50) -> List[Dict]:
+        with self._conn() as conn:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(r) for r in rows]
+
+
+class IngestWorkerPool:
+    """
+    Dedicated ingest workers, outside the web request path.
+    Each worker claims a job, ingests its pending documents INGEST_BATCH_DOCS at a
+    time and records every committed batch, so progress survives restarts.
+    """
+    def __init__(self, store: JobStore, workers: int = INGEST_WORKERS, batch_docs: int = INGEST_BATCH_DOCS):
+        self.store = store
+        self.workers = workers
+        self.batch_docs = batch_docs
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        recovered = self.store.recover()
+        if recovered:
+            logger.info(f"Requeued {recovered} interrupted ingest job(s)")
+        for i in range(self.workers):
+            t = threading.Thread(target=self._loop, name=f"ingest-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            job_id = self.store.claim()
+            if job_id is None:
+                # also polls for retries whose backoff has expired
+                self._wake.wait(timeout=1.0)
+                self._wake.clear()
+                continue
+            self._run_job(job_id)
+
+    def _run_job(self, job_id: str):
+        # an admin can arm a profile of the next job(s), see app/profiling.py
+        with profiling.maybe_profile(profiling.take("ingest"), f"ingest-{job_id}"):
+            self._process_job(job_id)
+
+    def _process_job(self, job_id: str):
+        logger.info(f"Ingest job {job_id} started")
+        try:
+            while not self._stop.is_set():
+                docs = self.store.pending_docs(job_id, self.batch_docs)
+                if not docs:
+                    break
+                results = ingest_documents(docs)
+                self.store.commit_docs(job_id, docs, results)
+                failed = [r for r in results if r["status"] == "failed"]
+                if failed:
+                    raise RuntimeError(f"{len(failed)} document(s) failed: {failed[0].get('error')}")
+            if self._stop.is_set():
+                # leave it for the next process; recover() requeues it
+                return
+            self.store.complete(job_id)
+            logger.info(f"Ingest job {job_id} completed")
+        except Exception as e:
+            logger.error(f"Ingest job {job_id} failed: {e}")
+            self.store.retry_or_fail(job_id, str(e))
+
+
+_store: Optional[JobStore] = None
+_pool: Optional[IngestWorkerPool] = None
+
+def get_job_store() -> JobStore:
+    global _store
+    if _store is None:
+        _store = JobStore()
+    return _store
+
+def start_workers():
+    global _pool
+    if _pool is None and INGEST_WORKERS > 0:
+        _pool = IngestWorkerPool(get_job_store())
+        _pool.start()
+
+def stop_workers():
+    global _pool
+    if _pool is not None:
+        _pool.stop()
+        _pool = None
+
+metrics.gauge("rag_ingest_jobs", "Ingest jobs by status.", ["status"]).set_function(
+    lambda: {(status,): n for status, n in _store.counts().items()} if _store is not None else {}
+)
+
+def submit_job(docs: List[Dict]) -> str:
+    job_id = get_job_store().enqueue(docs)
+    if _pool is not None:
+        _pool.notify()
+    return job_id
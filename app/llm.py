@@ -1,26 +1,55 @@
 import os
+import time
 import aiohttp
+from typing import Optional
 from app.llm_client import LLMClient
-from app.config import OPENAI_API_KEY, OPENAI_BASE_URL, OPENAI_MODEL
+from app.llm_scheduler import get_scheduler, PRIORITY_INTERACTIVE
+from app.config import (
+    OPENAI_API_KEY, OPENAI_BASE_URL, OPENAI_MODEL,
+    LLM_MAX_CONCURRENCY, OPENAI_MAX_CONCURRENCY, LLM_MAX_QUEUE,
+)
 
 _client = LLMClient()
+_primary_scheduler = get_scheduler(_client.provider, LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE)
+_openai_scheduler = get_scheduler("openai", OPENAI_MAX_CONCURRENCY, LLM_MAX_QUEUE)
 
-async def generate_local(system_prompt: str, user_prompt: str) -> str:
+async def generate_local(system_prompt: str, user_prompt: str,
+                         priority: int = PRIORITY_INTERACTIVE, deadline: Optional[float] = None,
+                         max_tokens: int = 512, timeout_at: Optional[float] = None) -> str:
     """
     Generate text using the configured local (or primary) LLM provider.
+    Calls go through the provider's scheduler; raises GenerationRejected when the
+    request cannot be admitted before deadline (absolute time.time()).
+    timeout_at (absolute) cuts the upstream call off; default is a 60s timeout.
     """
-    # Concatenate system and user prompt as the current client interface 
+    # Concatenate system and user prompt as the current client interface
     # primarily handles a single prompt string.
     full_prompt = f"{system_prompt}\n\n{user_prompt}"
-    return await _client.generate(full_prompt)
+    return await _primary_scheduler.run(
+        lambda: _client.generate(full_prompt, max_tokens=max_tokens, timeout=_call_timeout(timeout_at)),
+        priority=priority, deadline=deadline
+    )
 
-async def generate_openai(system_prompt: str, user_prompt: str) -> str:
+async def generate_openai(system_prompt: str, user_prompt: str,
+                          priority: int = PRIORITY_INTERACTIVE, deadline: Optional[float] = None,
+                          max_tokens: Optional[int] = None, timeout_at: Optional[float] = None) -> str:
     """
     Fallback generation using OpenAI.
     """
     if not OPENAI_API_KEY:
         raise ValueError("OPENAI_API_KEY is not set in configuration.")
+    return await _openai_scheduler.run(
+        lambda: _openai_chat(system_prompt, user_prompt, max_tokens, _call_timeout(timeout_at)),
+        priority=priority, deadline=deadline
+    )
 
+def _call_timeout(timeout_at: Optional[float]) -> float:
+    # Evaluated once a slot is granted: whatever is left until timeout_at, capped at 60s
+    if timeout_at is None:
+        return 60
+    return max(0.1, min(60, timeout_at - time.time()))
+
+async def _openai_chat(system_prompt: str, user_prompt: str, max_tokens: Optional[int] = None, timeout: float = 60) -> str:
     url = f"{OPENAI_BASE_URL}/chat/completions"
     headers = {
         "Authorization": f"Bearer {OPENAI_API_KEY}",
@@ -34,9 +63,11 @@ async def generate_openai(system_prompt: str, user_prompt: str) -> str:
         ],
         "temperature": 0.3
     }
+    if max_tokens:
+        data["max_tokens"] = max_tokens
 
     async with aiohttp.ClientSession() as session:
-        async with session.post(url, json=data, headers=headers, timeout=60) as resp:
+        async with session.post(url, json=data, headers=headers, timeout=timeout) as resp:
             if resp.status != 200:
                 error_text = await resp.text()
                 raise Exception(f"OpenAI API Error: {resp.status} - {error_text}")
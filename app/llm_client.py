@@ -9,13 +9,13 @@ class LLMClient:
         self.base_url = os.getenv("LLM_BASE_URL", "https://ark.cn-beijing.volces.com/api/v3")
         self.model = os.getenv("LLM_MODEL", "doubao-seed-1-6-251015")
 
-    async def generate(self, prompt: str, max_tokens: int = 512):
+    async def generate(self, prompt: str, max_tokens: int = 512, timeout: float = 60):
         if self.provider.lower() == "doubao":
-            return await self._doubao_chat(prompt, max_tokens)
+            return await self._doubao_chat(prompt, max_tokens, timeout)
         else:
             raise ValueError("Unsupported LLM provider: " + self.provider)
 
-    async def _doubao_chat(self, prompt: str, max_tokens: int):
+    async def _doubao_chat(self, prompt: str, max_tokens: int, timeout: float = 60):
         url = f"{self.base_url}/chat/completions"
         headers = {
             "Authorization": f"Bearer {self.api_key}",
@@ -30,7 +30,7 @@ class LLMClient:
             "stream": False
         }
         async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=data, headers=headers, timeout=60) as resp:
+            async with session.post(url, json=data, headers=headers, timeout=timeout) as resp:
                 resp.raise_for_status()
                 r = await resp.json()
                 return r["choices"][0]["message"]["content"]
@@ -0,0 +1,171 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+from app import metrics
+
+T = TypeVar("T")
+
+# Lower value = served first.
+PRIORITY_INTERACTIVE = 0
+
+GENERATIONS = metrics.counter("llm_generations_total", "Generations by outcome (completed, failed, rejected).",
+                              ["provider", "outcome"])
+QUEUE_WAIT_SECONDS = metrics.histogram("llm_queue_wait_seconds", "Time generations waited for a slot.", ["provider"])
+
+
+class GenerationRejected(Exception):
+    """
+    Raised when a generation cannot be admitted.
+    status_code is 429 when the queue is full and 503 when the expected queue wait
+    would overrun the caller's deadline.
+    """
+    def __init__(self, message: str, status_code: int, retry_after: float = 1.0):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class GenerationScheduler:
+    """
+    Concurrency governor for one LLM provider.
+    - at most max_concurrency generations are in flight
+    - waiters are served by (priority, arrival order)
+    - admission control rejects early instead of letting requests pile up in aiohttp
+    """
+    def __init__(self, name: str, max_concurrency: int, max_queue: int):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self._inflight = 0
+        self._heap = []  # [priority, seq, future]
+        self._seq = itertools.count()
+        self._service_ewma: Optional[float] = None
+        self.completed = 0
+        self.failed = 0
+        self.rejected = {429: 0, 503: 0}
+
+    def queue_depth(self, priority: Optional[int] = None) -> int:
+        return sum(
+            1 for p, _, fut in self._heap
+            if not fut.done() and (priority is None or p <= priority)
+        )
+
+    def estimate_wait(self, priority: int) -> float:
+        """Expected seconds until a new waiter of this priority gets a slot."""
+        if self._inflight < self.max_concurrency and not self.queue_depth():
+            return 0.0
+        if self._service_ewma is None:
+            return 0.0
+        ahead = self.queue_depth(priority)
+        return (ahead + 1) / self.max_concurrency * self._service_ewma
+
+    def _reject(self, message: str, status_code: int, retry_after: float):
+        self.rejected[status_code] += 1
+        GENERATIONS.inc(provider=self.name, outcome=f"rejected_{status_code}")
+        raise GenerationRejected(message, status_code, retry_after)
+
+    async def _acquire(self, priority: int, deadline: Optional[float]):
+        if self._inflight < self.max_concurrency and not self.queue_depth():
+            self._inflight += 1
+            return
+        if self.queue_depth() >= self.max_queue:
+            self._reject(f"{self.name}: generation queue full", 429, self.estimate_wait(priority) or 1.0)
+        wait = self.estimate_wait(priority)
+        timeout = None
+        if deadline is not None:
+            timeout = deadline - time.time()
+            if wait > timeout:
+                self._reject(
+                    f"{self.name}: expected queue wait {wait:.1f}s exceeds deadline", 503, wait
+                )
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, [priority, next(self._seq), fut])
+        try:
+            await asyncio.wait({fut}, timeout=timeout)
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self._release()  # slot was handed over just before cancellation
+            else:
+                fut.cancel()
+            raise
+        if not fut.done():
+            fut.cancel()
+            self._reject(f"{self.name}: deadline reached while queued", 503, self.estimate_wait(priority))
+        # slot handed over by _release; _inflight already accounts for it
+
+    def _release(self):
+        while self._heap:
+            _, _, fut = heapq.heappop(self._heap)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._inflight -= 1
+
+    def _observe(self, seconds: float):
+        if self._service_ewma is None:
+            self._service_ewma = seconds
+        else:
+            self._service_ewma = 0.8 * self._service_ewma + 0.2 * seconds
+
+    async def run(self, fn: Callable[[], Awaitable[T]], priority: int = PRIORITY_INTERACTIVE,
+                  deadline: Optional[float] = None) -> T:
+        """
+        Run fn() once a slot is free.
+        deadline is an absolute time.time() by which the caller needs the slot.
+        """
+        t_queued = time.time()
+        await self._acquire(priority, deadline)
+        t_start = time.time()
+        QUEUE_WAIT_SECONDS.observe(t_start - t_queued, provider=self.name)
+        try:
+            result = await fn()
+            self.completed += 1
+            GENERATIONS.inc(provider=self.name, outcome="completed")
+            return result
+        except Exception:
+            self.failed += 1
+            GENERATIONS.inc(provider=self.name, outcome="failed")
+            raise
+        finally:
+            self._observe(time.time() - t_start)
+            self._release()
+
+    def stats(self) -> Dict:
+        depth_by_priority: Dict[int, int] = {}
+        for p, _, fut in self._heap:
+            if not fut.done():
+                depth_by_priority[p] = depth_by_priority.get(p, 0) + 1
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self._inflight,
+            "queue_depth": sum(depth_by_priority.values()),
+            "queue_depth_by_priority": depth_by_priority,
+            "avg_service_time": self._service_ewma,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": dict(self.rejected),
+        }
+
+
+_schedulers: Dict[str, GenerationScheduler] = {}
+
+def get_scheduler(provider: str, max_concurrency: int, max_queue: int) -> GenerationScheduler:
+    sched = _schedulers.get(provider)
+    if sched is None:
+        sched = GenerationScheduler(provider, max_concurrency, max_queue)
+        _schedulers[provider] = sched
+    return sched
+
+def scheduler_stats() -> Dict[str, Dict]:
+    return {name: s.stats() for name, s in _schedulers.items()}
+
+metrics.gauge("llm_queue_depth", "Generations waiting for a slot.", ["provider"]).set_function(
+    lambda: {(name,): s.queue_depth() for name, s in _schedulers.items()}
+)
+metrics.gauge("llm_in_flight", "Generations in progress.", ["provider"]).set_function(
+    lambda: {(name,): s._inflight for name, s in _schedulers.items()}
+)
@@ -1,23 +1,66 @@
+import time
 import uvicorn
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from app import metrics, profiling, startup
+from app.config import PROFILING_ENABLED
 from app.api import router as api_router
-from app.embeddings import load_model
-from app.reranker import load_reranker
-from app.vectorstore import load_index
+from app.jobs import stop_workers
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("Loading FAISS index...")
-    load_index()
-    print("Loading embedding model...")
-    load_model()
-    print("Loading reranker model...")
-    load_reranker()
+    # index and models load in parallel in the background; GET /ready reports when they are in place
+    print("Loading FAISS index and models...")
+    startup.start()
     yield
+    startup.stop()
+    stop_workers()
 
 app = FastAPI(title="RAG FastAPI", lifespan=lifespan)
+
+HTTP_REQUESTS = metrics.counter("http_requests_total", "HTTP requests by method, route and status.",
+                                ["method", "route", "status"])
+HTTP_SECONDS = metrics.histogram("http_request_seconds", "HTTP request latency (until response headers).", ["route"])
+
+def _route_label(request: Request) -> str:
+    """The route template (/crawler/runs/{run_id}), not the raw path, keeps label cardinality bounded."""
+    if request.scope.get("route") is None:
+        return "unmatched"
+    # included routers only know their own part of the path, so rebuild it from the path params
+    params = {str(v): k for k, v in request.path_params.items()}
+    return "/".join(f"{{{params[seg]}}}" if seg in params else seg for seg in request.url.path.split("/"))
+
+@app.middleware("http")
+async def record_http_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = _route_label(request)
+        HTTP_REQUESTS.inc(method=request.method, route=route, status=status)
+        HTTP_SECONDS.observe(time.perf_counter() - start, route=route)
 app.include_router(api_router, prefix="")
 
+if PROFILING_ENABLED:
+    # only registered when enabled, so requests pay nothing otherwise
+    @app.middleware("http")
+    async def profile_requests(request: Request, call_next):
+        kind = request.headers.get("x-profile") or profiling.take("request") or profiling.sample()
+        if not kind:
+            return await call_next(request)
+        try:
+            kind = profiling.check_kind(kind)
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"detail": str(e)})
+        with profiling.profile(kind, f"{request.method}-{request.url.path}") as trace:
+            response = await call_next(request)
+        if trace.name:
+            response.headers["X-Profile-Trace"] = trace.name
+        return response
+
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="0.0.0.0", port=8001, reload=True)
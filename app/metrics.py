@@ -0,0 +1,204 @@
+"""
+In-process metrics in the Prometheus text format (GET /metrics).
+
+Counters, gauges and histograms are created once at import time of the module
+that owns them and updated with a dict lookup and a lock, so they are cheap
+enough for per-request and per-chunk paths:
+
+    FETCHES = counter("crawler_fetches_total", "Crawler HTTP requests", ["kind", "status"])
+    FETCHES.inc(kind="detail", status="200")
+    with STAGE_SECONDS.time(stage="search"):
+        ...
+
+Gauges backed by existing state (index size, queue depths) take a callback
+via set_function() and are only evaluated when /metrics is scraped.
+"""
+import bisect
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Seconds; covers sub-millisecond searches up to slow LLM generations.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._function: Optional[Callable] = None
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn: Callable):
+        """
+        Compute the gauge at scrape time. fn returns a number, or for a labelled
+        gauge a dict of label-value tuples to numbers.
+        """
+        self._function = fn
+
+    def _samples(self) -> List[str]:
+        if self._function is not None:
+            try:
+                value = self._function()
+            except Exception:
+                return []  # a broken callback must not break the whole scrape
+            values = value if isinstance(value, dict) else {(): value}
+            with self._lock:
+                self._values = {tuple(str(v) for v in k): float(val) for k, val in values.items()}
+        return super()._samples()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(s[0]), s[1], s[2]) for k, s in self._series.items()]
+        lines = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+_registry: Dict[str, _Metric] = {}
+_registry_lock = threading.Lock()
+
+def _register(cls, name: str, help: str, labelnames: Sequence[str] = (), **kwargs):
+    # idempotent, so module reloads and tests get the existing metric back
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, help, labelnames, **kwargs)
+        elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+            raise ValueError(f"Metric {name} already registered with a different type or labels")
+        return metric
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    return _register(Counter, name, help, labelnames)
+
+def gauge(name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return _register(Gauge, name, help, labelnames)
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram, name, help, labelnames, buckets=buckets)
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format (0.0.4)."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return "\n".join(m.render() for m in metrics) + "\n"
+
+
+def _rss_bytes() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # no procfs: peak RSS instead (KiB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+gauge("process_resident_memory_bytes", "Resident memory size in bytes.").set_function(_rss_bytes)
+_START_TIME = time.time()
+gauge("process_start_time_seconds", "Start time of the process since unix epoch in seconds.").set_function(lambda: _START_TIME)
+
+# Shared by the query pipeline (app/api.py) and batch retrieval (app/retrieval.py).
+STAGE_SECONDS = histogram("rag_stage_seconds", "Latency of RAG pipeline stages.", ["stage"])
@@ -1,21 +1,236 @@
-from typing import List, Dict, Tuple
+from collections import OrderedDict
+from typing import List, Dict, Tuple, Optional
+import numpy as np
+from app.embeddings import get_embeddings, count_tokens
+from app.utils.chunker import split_sentences
+from app.config import PROMPT_DEDUP_THRESHOLD
+from app.ingest import ANONYMOUS_SOURCE
+from app.vectorstore import doc_key
 
-def build_rag_prompt(question: str, snippets: List[Dict], max_snippets: int = 3) -> Tuple[str, str]:
+SYSTEM_PROMPT = (
+    "你是一名面向特定文档的中文问答助手，只能依据给定的上下文片段回答用户问题。\n\n"
+    "回答规则：\n"
+    "1) 严格使用提供的上下文，不得调用外部知识或模型自带知识。\n"
+    "2) 若上下文无法回答，必须回复：\"我无法基于提供的文档回答这个问题。\"，不要编造。\n"
+    "3) 需给出引用，格式为 [source:source_name#id]，每条事实都要对应引用。\n"
+    "4) 用中文作答，保持简洁、专业、紧扣问题。"
+)
+
+# Upper bound on sentences fed to the knapsack; the least relevant ones are dropped first.
+_MAX_CANDIDATE_SENTENCES = 512
+# Sentence embedding cache: the same chunks are retrieved again and again, so their
+# sentences are only embedded once.
+_SENTENCE_CACHE_SIZE = 4096
+_sentence_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+def _format_snippet(sid, src, text: str) -> str:
+    return f"<snippet id=\"{sid}\" source=\"{src}\">\n{text}\n</snippet>"
+
+def _format_user(question: str, context_block: str) -> str:
+    return (
+        f"User Question: {question}\n\n"
+        f"Context Snippets:\n{context_block}\n\n"
+        "Please answer the question following the guidelines above."
+    )
+
+def _embed_sentences(sentences: List[str]) -> np.ndarray:
+    missing = list(dict.fromkeys(s for s in sentences if s not in _sentence_cache))
+    if missing:
+        vecs = get_embeddings(missing, batch_size=32)
+        for s, v in zip(missing, vecs):
+            _sentence_cache[s] = v
+    for s in sentences:
+        _sentence_cache.move_to_end(s)
+    vectors = np.vstack([_sentence_cache[s] for s in sentences])
+    while len(_sentence_cache) > _SENTENCE_CACHE_SIZE:
+        _sentence_cache.popitem(last=False)
+    return vectors
+
+def _knapsack(weights: np.ndarray, values: np.ndarray, capacity: int) -> List[int]:
+    """
+    Exact 0/1 knapsack over integer token weights, vectorized over capacities.
+    Returns the indices of the chosen items.
+    """
+    if capacity <= 0 or len(weights) == 0:
+        return []
+    best = np.zeros(capacity + 1)
+    take = np.zeros((len(weights), capacity + 1), dtype=bool)
+    for i, (w, v) in enumerate(zip(weights, values)):
+        if w > capacity or v <= 0:
+            continue
+        cand = best[:capacity + 1 - w] + v
+        better = cand > best[w:]
+        take[i, w:] = better
+        best[w:] = np.where(better, cand, best[w:])
+    chosen = []
+    c = capacity
+    for i in range(len(weights) - 1, -1, -1):
+        if take[i, c]:
+            chosen.append(i)
+            c -= int(weights[i])
+    return chosen[::-1]
+
+def compress_snippets(question: str, snippets: List[Dict], token_budget: int,
+                      query_vec: Optional[np.ndarray] = None,
+                      dedup_threshold: float = PROMPT_DEDUP_THRESHOLD) -> List[Dict]:
+    """
+    Sentence-level extractive compression of snippets into token_budget tokens.
+    - sentences are scored by cosine similarity to the query
+    - near-duplicate sentences (also across snippets) are dropped
+    - the budget is filled with the highest total relevance (0/1 knapsack)
+    Returns snippet dicts in input order; snippets with no kept sentence are omitted.
+    """
+    units = []  # (snippet index, sentence index, sentence)
+    for si, s in enumerate(snippets):
+        for j, sent in enumerate(split_sentences(s.get('text', ''))):
+            units.append((si, j, sent))
+    if not units or token_budget <= 0:
+        return []
+
+    sentences = [u[2] for u in units]
+    sent_vecs = _embed_sentences(sentences)
+    if query_vec is None:
+        query_vec = get_embeddings([question])[0]
+    relevance = sent_vecs @ np.asarray(query_vec, dtype=sent_vecs.dtype).reshape(-1)
+
+    # Greedy dedup in relevance order: a sentence survives only if it is not a
+    # near-copy of a more relevant survivor.
+    order = np.argsort(-relevance)[:_MAX_CANDIDATE_SENTENCES]
+    kept = []
+    for i in order:
+        if kept and float(np.max(sent_vecs[kept] @ sent_vecs[i])) >= dedup_threshold:
+            continue
+        kept.append(int(i))
+
+    kept_sents = [sentences[i] for i in kept]
+    weights = np.array(count_tokens(kept_sents), dtype=np.int64)
+    values = np.clip(relevance[kept], 0.0, None)
+    chosen = {kept[i] for i in _knapsack(weights, values, token_budget)}
+
+    grouped: Dict[int, List[Tuple[int, str]]] = {}
+    for i in sorted(chosen):
+        si, j, sent = units[i]
+        grouped.setdefault(si, []).append((j, sent))
+
+    compressed = []
+    for si in sorted(grouped):
+        parts = []
+        prev = None
+        for j, sent in grouped[si]:
+            if prev is not None and j != prev + 1:
+                parts.append("……")
+            parts.append(sent)
+            prev = j
+        compressed.append({**snippets[si], 'text': "".join(parts)})
+    return compressed
+
+def mmr_select(query_vec: np.ndarray, items: List[Dict], vectors: np.ndarray, k: int,
+               lambda_: float = 0.5) -> List[Dict]:
+    """
+    Maximal marginal relevance over reranked items.
+    - relevance: rerank 'score' scaled to [0, 1] (cosine to query_vec if absent)
+    - redundancy: max cosine between an item's stored vector and those already picked
+    Returns up to k items in pick order.
+    """
+    n = len(items)
+    if n <= 1 or k <= 0:
+        return items[:k]
+    vecs = np.asarray(vectors, dtype=np.float32)
+    if all('score' in it for it in items):
+        rel = np.array([float(it['score']) for it in items], dtype=np.float32)
+    else:
+        rel = vecs @ np.asarray(query_vec, dtype=np.float32).reshape(-1)
+    span = float(rel.max() - rel.min())
+    rel = (rel - rel.min()) / span if span > 0 else np.ones_like(rel)
+
+    sim = vecs @ vecs.T
+    picked = [int(np.argmax(rel))]
+    max_sim = sim[picked[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[picked[0]] = False
+    while len(picked) < min(k, n):
+        mmr = lambda_ * rel - (1.0 - lambda_) * max_sim
+        mmr[~available] = -np.inf
+        nxt = int(np.argmax(mmr))
+        picked.append(nxt)
+        available[nxt] = False
+        np.maximum(max_sim, sim[nxt], out=max_sim)
+    return [items[i] for i in picked]
+
+def _chunk_position(chunk_id) -> Optional[int]:
+    # ids are either the chunk index itself or "<doc hash>_<index>" (crawler)
+    if isinstance(chunk_id, (int, np.integer)):
+        return int(chunk_id)
+    tail = str(chunk_id).rsplit("_", 1)[-1]
+    return int(tail) if tail.isdigit() else None
+
+def _join_overlapping(a: str, b: str, min_overlap: int = 8) -> str:
+    """Concatenate consecutive chunks, dropping the overlap the chunker repeated."""
+    for n in range(min(len(a), len(b)), min_overlap - 1, -1):
+        if a.endswith(b[:n]):
+            return a + b[n:]
+    return a + b
+
+def merge_adjacent_chunks(snippets: List[Dict]) -> List[Dict]:
+    """
+    Merge snippets that are consecutive chunks of the same document into one.
+    Documents are keyed by vectorstore.doc_key. Anonymous ingests all share one
+    source and number their chunks from 0; a document's chunks are stored one
+    after another, so there 'vector_id' minus the position tells documents apart
+    (without a 'vector_id' they are not merged). The merged snippet keeps
+    the first chunk's id, the best score and lists all ids in 'merged_ids'.
+    Order follows each group's best-ranked member.
+    """
+    groups: Dict[object, List[Tuple[int, int, Dict]]] = {}
+    passthrough = []
+    for rank, s in enumerate(snippets):
+        pos = _chunk_position(s.get('id'))
+        key = doc_key(s)
+        if pos is not None and key == ANONYMOUS_SOURCE:
+            key = (key, s['vector_id'] - pos) if s.get('vector_id') is not None else None
+        if pos is None or key is None:
+            passthrough.append((rank, s))
+            continue
+        groups.setdefault(key, []).append((pos, rank, s))
+
+    merged = list(passthrough)
+    for members in groups.values():
+        members.sort(key=lambda m: m[0])
+        run = [members[0]]
+        for m in members[1:] + [None]:
+            if m is not None and m[0] == run[-1][0] + 1:
+                run.append(m)
+                continue
+            if len(run) == 1:
+                merged.append((run[0][1], run[0][2]))
+            else:
+                text = run[0][2].get('text', '')
+                for _, _, s in run[1:]:
+                    text = _join_overlapping(text, s.get('text', ''))
+                first = run[0][2]
+                merged.append((min(r for _, r, _ in run), {
+                    **first,
+                    'text': text,
+                    'score': max(s.get('score', 0) for _, _, s in run),
+                    'merged_ids': [s.get('id') for _, _, s in run],
+                }))
+            run = [m] if m is not None else []
+    merged.sort(key=lambda m: m[0])
+    return [s for _, s in merged]
+
+def build_rag_prompt(question: str, snippets: List[Dict], max_snippets: int = 3,
+                     token_budget: int = 0, query_vec: Optional[np.ndarray] = None) -> Tuple[str, str]:
     """
     Build a robust RAG prompt:
     - question: user question
     - snippets: list of dicts each must contain keys: id, source, text, score (score optional)
     - max_snippets: number of top snippets to include (control token usage)
+    - token_budget: if > 0, total prompt size in tokens; snippets are compressed to
+      their most query-relevant sentences to fit (see compress_snippets)
+    - query_vec: query embedding to reuse for sentence scoring in token-budget mode
     Returns: (system_prompt, user_prompt)
     """
-    system = (
-        "你是一名面向特定文档的中文问答助手，只能依据给定的上下文片段回答用户问题。\n\n"
-        "回答规则：\n"
-        "1) 严格使用提供的上下文，不得调用外部知识或模型自带知识。\n"
-        "2) 若上下文无法回答，必须回复：\"我无法基于提供的文档回答这个问题。\"，不要编造。\n"
-        "3) 需给出引用，格式为 [source:source_name#id]，每条事实都要对应引用。\n"
-        "4) 用中文作答，保持简洁、专业、紧扣问题。"
-    )
+    system = SYSTEM_PROMPT
 
     # Sort snippets by score if provided, else keep order
     if snippets and 'score' in snippets[0]:
@@ -25,23 +240,31 @@ def build_rag_prompt(question: str, snippets: List[Dict], max_snippets: int = 3)
 
     selected = snippets_sorted[:max_snippets]
 
+    if token_budget > 0:
+        # Pin fallback ids before compression may drop snippets.
+        selected = [{'id': f"chunk{i}", **s} for i, s in enumerate(selected, start=1)]
+        # Everything except sentence text is fixed overhead; reserve it up front.
+        overhead = count_tokens(
+            [system, _format_user(question, "")]
+            + [_format_snippet(s['id'], s.get('source', 'unknown'), "") for s in selected]
+        )
+        context_budget = token_budget - sum(overhead) - 2 * len(selected)
+        selected = compress_snippets(question, selected, context_budget, query_vec=query_vec)
+
     context_lines = []
     for i, s in enumerate(selected, start=1):
         sid = s.get('id', f"chunk{i}")
         src = s.get('source', 'unknown')
         text = s.get('text', '').strip()
-        # Truncate snippet text to reasonable length per snippet to limit tokens
-        max_chars = 1200
-        if len(text) > max_chars:
-            text = text[:max_chars] + "..."
-        context_lines.append(f"<snippet id=\"{sid}\" source=\"{src}\">\n{text}\n</snippet>")
+        if token_budget <= 0:
+            # Truncate snippet text to reasonable length per chunk to limit tokens
+            max_chars = 1200 * len(s.get('merged_ids') or [s])
+            if len(text) > max_chars:
+                text = text[:max_chars] + "..."
+        context_lines.append(_format_snippet(sid, src, text))
 
     context_block = "\n\n".join(context_lines)
 
-    user = (
-        f"User Question: {question}\n\n"
-        f"Context Snippets:\n{context_block}\n\n"
-        "Please answer the question following the guidelines above."
-    )
+    user = _format_user(question, context_block)
 
     return system, user
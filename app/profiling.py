@@ -0,0 +1,195 @@
+"""
+Opt-in profiling of live requests, crawler runs and ingest jobs.
+
+Profilers ("kinds"):
+  cprofile     - stdlib cProfile, saved as .prof (pstats; snakeviz, or ?format=text)
+  pyinstrument - sampling profiler with async support, saved as .html (optional dependency)
+  torch        - torch.profiler operator trace, saved as Chrome trace .json
+                 (open in chrome://tracing or Perfetto)
+
+A capture is triggered by the X-Profile request header (value: the kind), by
+arm(target, kind, count) for the next requests / crawler runs / ingest jobs, or
+by PROFILE_SAMPLE_RATE for a random share of requests. Only one capture runs at
+a time; others proceed unprofiled. With PROFILING_ENABLED off none of this is
+wired in. cProfile and pyinstrument see the thread they were started on: for a
+request that is the event loop (which also runs other concurrent requests, but
+not run_in_threadpool work); the torch profiler records operators on all threads.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+
+from app.config import PROFILE_DIR, PROFILE_MAX_FILES, PROFILE_MAX_MB, PROFILE_SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("cprofile", "pyinstrument", "torch")
+TARGETS = ("request", "crawler", "ingest")
+_EXTENSIONS = {"cprofile": "prof", "pyinstrument": "html", "torch": "json"}
+_NAME_RE = re.compile(r"^[\w.-]+$")
+
+_busy = threading.Lock()       # one capture at a time
+_armed_lock = threading.Lock()
+_armed: Dict[str, List[str]] = {t: [] for t in TARGETS}  # target -> kinds of pending captures
+
+
+def available_kinds() -> List[str]:
+    kinds = ["cprofile"]
+    try:
+        import pyinstrument  # noqa: F401
+        kinds.append("pyinstrument")
+    except ImportError:
+        pass
+    try:
+        import torch.profiler  # noqa: F401
+        kinds.append("torch")
+    except ImportError:
+        pass
+    return kinds
+
+def check_kind(kind: str) -> str:
+    kind = (kind or "cprofile").strip().lower()
+    if kind in ("1", "true", "yes"):
+        kind = "cprofile"
+    if kind not in available_kinds():
+        raise ValueError(f"Unsupported profiler '{kind}'; available: {', '.join(available_kinds())}")
+    return kind
+
+def arm(target: str, kind: str = "cprofile", count: int = 1) -> Dict:
+    """Profile the next `count` requests / crawler runs / ingest jobs."""
+    if target not in TARGETS:
+        raise ValueError(f"Unknown profiling target '{target}'; one of {', '.join(TARGETS)}")
+    kind = check_kind(kind)
+    with _armed_lock:
+        _armed[target].extend([kind] * max(1, count))
+        return armed()
+
+def armed() -> Dict[str, int]:
+    return {t: len(kinds) for t, kinds in _armed.items()}
+
+def take(target: str) -> Optional[str]:
+    """The kind of capture armed for this target, consuming it; None if nothing is armed."""
+    if not _armed[target]:  # unlocked fast path
+        return None
+    with _armed_lock:
+        return _armed[target].pop(0) if _armed[target] else None
+
+def sample() -> Optional[str]:
+    return "cprofile" if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE else None
+
+
+class Trace:
+    """Handle of one capture; `name` is set once the trace file is written (None if skipped)."""
+    def __init__(self, kind: str, label: str):
+        self.kind = kind
+        self.label = re.sub(r"[^\w.-]+", "_", label)[:60]
+        self.name: Optional[str] = None
+        self.seconds: Optional[float] = None
+
+    def _path(self) -> str:
+        self.name = f"{time.strftime('%Y%m%d-%H%M%S')}-{self.label}-{uuid.uuid4().hex[:6]}.{_EXTENSIONS[self.kind]}"
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        return os.path.join(PROFILE_DIR, self.name)
+
+
+@contextmanager
+def profile(kind: str, label: str):
+    """Capture a trace of the block. Yields a Trace; skipped (name None) while another capture runs."""
+    trace = Trace(check_kind(kind), label)
+    if not _busy.acquire(blocking=False):
+        logger.info(f"Profiler busy, not profiling {label}")
+        yield trace
+        return
+    start = time.perf_counter()
+    try:
+        if trace.kind == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield trace
+            finally:
+                profiler.disable()
+                trace.seconds = time.perf_counter() - start
+                profiler.dump_stats(trace._path())
+        elif trace.kind == "pyinstrument":
+            from pyinstrument import Profiler
+            profiler = Profiler(async_mode="enabled")
+            profiler.start()
+            try:
+                yield trace
+            finally:
+                profiler.stop()
+                trace.seconds = time.perf_counter() - start
+                with open(trace._path(), "w", encoding="utf-8") as f:
+                    f.write(profiler.output_html())
+        else:
+            import torch
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            with torch.profiler.profile(activities=activities, record_shapes=True) as profiler:
+                try:
+                    yield trace
+                finally:
+                    trace.seconds = time.perf_counter() - start
+            profiler.export_chrome_trace(trace._path())
+        logger.info(f"Profile of {label} ({trace.seconds:.2f}s) saved as {trace.name}")
+    finally:
+        _busy.release()
+        _prune()
+
+def maybe_profile(kind: Optional[str], label: str):
+    """profile() when kind is set, else a no-op context yielding None."""
+    return profile(kind, label) if kind else nullcontext()
+
+
+def _trace_files() -> List[os.DirEntry]:
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    return sorted((e for e in os.scandir(PROFILE_DIR) if e.is_file()), key=lambda e: e.stat().st_mtime)
+
+def _prune():
+    """Keep PROFILE_DIR within PROFILE_MAX_FILES and PROFILE_MAX_MB, dropping the oldest traces."""
+    files = _trace_files()
+    total = sum(e.stat().st_size for e in files)
+    while files and (len(files) > PROFILE_MAX_FILES or total > PROFILE_MAX_MB * 1024 * 1024):
+        oldest = files.pop(0)
+        total -= oldest.stat().st_size
+        try:
+            os.remove(oldest.path)
+        except OSError:
+            pass
+
+def list_traces() -> List[Dict]:
+    return [
+        {"name": e.name, "bytes": e.stat().st_size, "created": e.stat().st_mtime}
+        for e in reversed(_trace_files())
+    ]
+
+def trace_path(name: str) -> Optional[str]:
+    """Path of a stored trace, or None; names are never joined unchecked."""
+    if not _NAME_RE.match(name):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+def delete_traces() -> int:
+    files = _trace_files()
+    for e in files:
+        os.remove(e.path)
+    return len(files)
+
+def cprofile_text(path: str, limit: int = 60, sort: str = "cumulative") -> str:
+    """Top functions of a .prof trace, as pstats prints them."""
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
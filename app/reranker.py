@@ -1,12 +1,20 @@
 import os
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+import threading
 from typing import List, Tuple, Dict
-from app.config import RERANKER_MODEL
+from app.config import RERANKER_MODEL, RERANK_BATCH_SIZE
 
-_device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+# torch and transformers are imported on first use (see app/embeddings.py)
+_device = None
 _tokenizer = None
 _model = None
+_lock = threading.Lock()
+
+def _get_device():
+    global _device
+    if _device is None:
+        import torch
+        _device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    return _device
 
 def _resolve_model_path(mpath: str) -> str:
     """
@@ -33,16 +41,26 @@ def _resolve_model_path(mpath: str) -> str:
 def load_reranker():
     global _tokenizer, _model
     if _model is None or _tokenizer is None:
-        name = _resolve_model_path(RERANKER_MODEL)
-        _tokenizer = AutoTokenizer.from_pretrained(name)
-        _model = AutoModelForSequenceClassification.from_pretrained(name)
-        _model.to(_device)
-        _model.eval()
+        with _lock:
+            if _model is None or _tokenizer is None:
+                from transformers import AutoTokenizer, AutoModelForSequenceClassification
+                name = _resolve_model_path(RERANKER_MODEL)
+                tokenizer = AutoTokenizer.from_pretrained(name)
+                model = AutoModelForSequenceClassification.from_pretrained(name)
+                model.to(_get_device())
+                model.eval()
+                _tokenizer = tokenizer
+                _model = model
     return _tokenizer, _model
 
+def warm_up():
+    """Score one full batch of pairs, so the first query does not pay for allocator and kernel set-up."""
+    rerank_batch(["预热"], [["预热" * (16 * (i + 1)) for i in range(RERANK_BATCH_SIZE)]], batch_size=RERANK_BATCH_SIZE)
+
 def _score_batch(tokenizer, model, queries: List[str], docs: List[str]) -> List[float]:
+    import torch
     enc = tokenizer(queries, docs, padding=True, truncation=True, return_tensors="pt", max_length=512)
-    enc = {k: v.to(_device) for k, v in enc.items()}
+    enc = {k: v.to(_get_device()) for k, v in enc.items()}
     with torch.no_grad():
         out = model(**enc)
         logits = out.logits  # shape (batch, num_labels) or (batch,1)
@@ -85,3 +103,31 @@ def rerank(query: str, candidates: List[str], batch_size: int = 8) -> List[Dict]
     # sort by score desc
     results_sorted = sorted(results, key=lambda x: x["score"], reverse=True)
     return results_sorted
+
+def rerank_batch(queries: List[str], candidates: List[List[str]], batch_size: int = 32) -> List[List[Dict]]:
+    """
+    Rerank the candidates of many queries at once.
+    All (query, doc) pairs are packed into shared batches ordered by length, so
+    padding stays small and each forward pass is full.
+    Returns, per query, the same structure as rerank().
+    """
+    tokenizer, model = load_reranker()
+    pairs = [(qi, di) for qi, docs in enumerate(candidates) for di in range(len(docs))]
+    pairs.sort(key=lambda p: len(queries[p[0]]) + len(candidates[p[0]][p[1]]))
+    scores = {}
+    for i in range(0, len(pairs), batch_size):
+        batch = pairs[i:i+batch_size]
+        batch_queries = [queries[qi] for qi, _ in batch]
+        batch_docs = [candidates[qi][di] for qi, di in batch]
+        try:
+            batch_scores = _score_batch(tokenizer, model, batch_queries, batch_docs)
+        except Exception:
+            batch_scores = [0.0] * len(batch)
+        for pair, score in zip(batch, batch_scores):
+            scores[pair] = score
+
+    results = []
+    for qi, docs in enumerate(candidates):
+        ranked = [{"text": d, "score": scores[(qi, di)], "index": di} for di, d in enumerate(docs)]
+        results.append(sorted(ranked, key=lambda x: x["score"], reverse=True))
+    return results
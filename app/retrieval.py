@@ -0,0 +1,58 @@
+from typing import Dict, Iterator, List
+from app.embeddings import get_embeddings
+from app.vectorstore import search_batch
+from app.reranker import rerank_batch
+from app.metrics import STAGE_SECONDS
+from app.config import TOP_K, LLM_CONTEXT_DOCS, EMBED_BATCH_SIZE, RERANK_BATCH_SIZE, SEARCH_BATCH_BLOCK
+
+def retrieve_batch(queries: List[str], top_k: int = TOP_K, top_n: int = LLM_CONTEXT_DOCS,
+                   use_rerank: bool = True) -> List[Dict]:
+    """
+    Retrieve contexts for many queries without generation:
+    one embedding pass, one FAISS search over the query matrix and one packed
+    rerank pass over all (query, candidate) pairs.
+    Returns [{'query': str, 'contexts': [{id, source, url, text, score, vector_score}, ...]}]
+    with up to top_n contexts per query.
+    """
+    if not queries:
+        return []
+    with STAGE_SECONDS.time(stage="batch_embedding"):
+        q_vecs = get_embeddings(queries, batch_size=EMBED_BATCH_SIZE)
+    with STAGE_SECONDS.time(stage="batch_search"):
+        hits = search_batch(q_vecs, top_k=top_k)
+
+    if use_rerank:
+        texts = [[h["meta"].get("text", "") for h in row] for row in hits]
+        with STAGE_SECONDS.time(stage="batch_rerank"):
+            ranked = rerank_batch(queries, texts, batch_size=RERANK_BATCH_SIZE)
+    else:
+        ranked = [
+            [{"text": h["meta"].get("text", ""), "score": h["score"], "index": i} for i, h in enumerate(row)]
+            for row in hits
+        ]
+
+    results = []
+    for q, row, order in zip(queries, hits, ranked):
+        contexts = []
+        for item in order[:top_n]:
+            hit = row[item["index"]]
+            meta = hit["meta"]
+            contexts.append({
+                "id": meta.get("id"),
+                "source": meta.get("source"),
+                "url": meta.get("url"),
+                "text": item["text"],
+                "score": float(item["score"]),
+                "vector_score": hit["score"],
+            })
+        results.append({"query": q, "contexts": contexts})
+    return results
+
+def iter_retrieve_batch(queries: List[str], top_k: int = TOP_K, top_n: int = LLM_CONTEXT_DOCS,
+                        use_rerank: bool = True, block_size: int = SEARCH_BATCH_BLOCK) -> Iterator[Dict]:
+    """
+    Same as retrieve_batch, processed in blocks of block_size queries so results
+    can be streamed out and memory stays bounded for very large query sets.
+    """
+    for i in range(0, len(queries), block_size):
+        yield from retrieve_batch(queries[i:i+block_size], top_k=top_k, top_n=top_n, use_rerank=use_rerank)
@@ -0,0 +1,378 @@
+"""
+Preload-and-fork serving: one master process loads the models and the FAISS
+index, then forks uvicorn workers that share those pages copy-on-write, so
+adding a worker costs little memory beyond its activations.
+
+    python -m app.serve [--workers 4] [--host 0.0.0.0] [--port 8001] [--torch-threads 2]
+
+- The master binds the listening socket once and every worker accepts on it.
+- The master never runs inference and keeps torch at one thread, so no
+  OpenMP / intra-op thread pool exists at fork time (those threads would not
+  survive into the children). Each worker sets its own torch thread count
+  (SERVE_TORCH_THREADS, default cores / workers) and warms its models up.
+- gc.freeze() before forking keeps the collector from writing to, and so
+  un-sharing, the master's objects.
+- The index is read fully into memory (not mmapped), so every worker starts
+  from the same snapshot. Worker 0 is the only writer: it runs the ingest job
+  workers, and the other workers forward /ingest*, /crawler* and /admin*
+  requests to it over a private unix socket (SERVE_WRITER_SOCKET). Crawls,
+  ingests and compaction therefore all change one in-memory index, and
+  crawler progress and cancellation see every run.
+- When worker 0 persists the index, the master (checking every
+  SERVE_INDEX_POLL seconds) reloads it once the files stop changing, or at
+  the latest SERVE_INDEX_MAX_LAG seconds later, and replaces the read-only
+  workers one at a time. Worker 0 is never restarted for its own writes, so
+  running crawls and ingest jobs continue.
+- After an offline build, POST /admin/reload-index (forwarded to worker 0;
+  build_index --reload-url does it) updates the writer and, through the
+  file change, the readers. SIGHUP restarts all workers including worker 0,
+  which interrupts running crawls (resumable) and ingest jobs (requeued).
+- A new worker must pass /ready before its predecessor is stopped; worker 0
+  is stopped before its successor starts, so two writers never overlap, and
+  the successor re-reads the index files if they changed after the master
+  loaded them (e.g. the old writer's last commit).
+- SIGTERM / SIGINT stop the workers gracefully. /metrics is per worker.
+"""
+import argparse
+import gc
+import logging
+import os
+import random
+import select
+import signal
+import socket
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+from app.config import (
+    SERVE_WORKERS, SERVE_TORCH_THREADS, SERVE_INDEX_POLL, SERVE_INDEX_MAX_LAG, SERVE_READY_TIMEOUT,
+    SERVE_WRITER_SOCKET,
+)
+
+logger = logging.getLogger("app.serve")
+
+# requests handled by worker 0 only: everything that writes the index or controls crawls
+WRITER_PREFIXES = ("/ingest", "/crawler", "/admin")
+_HOP_HEADERS = {b"host", b"connection", b"keep-alive", b"transfer-encoding", b"upgrade"}
+
+
+class WriterProxy:
+    """ASGI wrapper for workers other than 0: forwards WRITER_PREFIXES requests to worker 0."""
+    def __init__(self, app, uds: str):
+        self.app = app
+        self.uds = uds
+        self._client = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(WRITER_PREFIXES):
+            return await self.app(scope, receive, send)
+        import httpx
+        if self._client is None:
+            self._client = httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(uds=self.uds),
+                                             base_url="http://writer", timeout=None)
+
+        async def body():
+            while True:
+                message = await receive()
+                if message["type"] != "http.request":
+                    return
+                yield message.get("body", b"")
+                if not message.get("more_body"):
+                    return
+
+        target = scope.get("raw_path") or scope["path"].encode()
+        if scope.get("query_string"):
+            target += b"?" + scope["query_string"]
+        headers = [(k, v) for k, v in scope["headers"] if k.lower() not in _HOP_HEADERS and k.lower() != b"content-length"]
+        request = self._client.build_request(scope["method"], target.decode("latin-1"), headers=headers, content=body())
+        try:
+            response = await self._client.send(request, stream=True)
+        except httpx.TransportError:
+            await send({"type": "http.response.start", "status": 503,
+                        "headers": [(b"content-type", b"application/json"), (b"retry-after", b"1")]})
+            await send({"type": "http.response.body", "body": b'{"detail":"Index writer is restarting, retry shortly"}'})
+            return
+        try:
+            await send({"type": "http.response.start", "status": response.status_code,
+                        "headers": [(k, v) for k, v in response.headers.raw if k.lower() not in _HOP_HEADERS]})
+            async for chunk in response.aiter_raw():
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await response.aclose()
+
+
+class Worker:
+    def __init__(self, worker_id: int, pid: int, ready_fd: int):
+        self.worker_id = worker_id
+        self.pid = pid
+        self.ready_fd: Optional[int] = ready_fd  # read end; the worker writes one byte once ready
+        self.started_at = time.time()
+
+
+class Master:
+    def __init__(self, host: str, port: int, workers: int = SERVE_WORKERS, torch_threads: int = SERVE_TORCH_THREADS):
+        self.host = host
+        self.port = port
+        self.n_workers = max(1, workers)
+        self.torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // self.n_workers)
+        self.workers: Dict[int, Worker] = {}
+        self.sock: Optional[socket.socket] = None
+        self.writer_sock: Optional[socket.socket] = None
+        self.writer_path = SERVE_WRITER_SOCKET or os.path.join(tempfile.gettempdir(), f"rag-serve-{os.getpid()}.sock")
+        self._loaded_mtime = 0.0
+        self._seen_mtime = 0.0
+        self._changed_at: Optional[float] = None  # first poll that saw the files differ from the loaded ones
+        self._reload_requested = False
+        self._stopping = False
+
+    # --- master side -------------------------------------------------------
+
+    def _bind(self):
+        sock = socket.socket(socket.AF_INET6 if ":" in self.host else socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        self.sock = sock
+        if os.path.exists(self.writer_path):
+            os.unlink(self.writer_path)
+        writer = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        writer.bind(self.writer_path)
+        os.chmod(self.writer_path, 0o600)
+        writer.listen(256)
+        writer.set_inheritable(True)
+        self.writer_sock = writer
+
+    def _load(self):
+        """Everything the workers share: code, models and the index."""
+        gc.disable()  # nothing is collected until the freeze below
+        import torch
+        torch.set_num_threads(1)
+        import app.main  # noqa: F401  (imports every module once, before the fork)
+        from app import embeddings, reranker, startup
+        for name in startup.preload_models():
+            t = time.perf_counter()
+            if name == "embedding":
+                embeddings.load_model()
+            else:
+                reranker.load_reranker()
+            logger.info(f"Loaded {name} model in {time.perf_counter() - t:.1f}s")
+        self._load_index()
+
+    def _index_mtime(self) -> float:
+        from app.vectorstore import INDEX_PATH, META_PATH
+        return max((os.path.getmtime(p) for p in (INDEX_PATH, META_PATH) if os.path.exists(p)), default=0.0)
+
+    def _load_index(self):
+        from app import vectorstore
+        self._loaded_mtime = self._seen_mtime = self._index_mtime()
+        self._changed_at = None
+        t = time.perf_counter()
+        ntotal = vectorstore.reload_index()
+        logger.info(f"Loaded index ({ntotal} vectors) in {time.perf_counter() - t:.1f}s")
+        gc.collect()
+        gc.freeze()
+
+    def _spawn(self, worker_id: int) -> Worker:
+        ready_r, ready_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            self._child(worker_id, ready_w)  # never returns
+        os.close(ready_w)
+        logger.info(f"Started worker {worker_id} (pid {pid})")
+        return Worker(worker_id, pid, ready_r)
+
+    def _wait_ready(self, worker: Worker, timeout: float = SERVE_READY_TIMEOUT) -> bool:
+        """Wait for the worker's readiness byte; EOF means it exited first."""
+        if worker.ready_fd is None:
+            return True
+        readable, _, _ = select.select([worker.ready_fd], [], [], timeout)
+        ok = bool(readable) and os.read(worker.ready_fd, 1) == b"1"
+        os.close(worker.ready_fd)
+        worker.ready_fd = None
+        if ok:
+            logger.info(f"Worker {worker.worker_id} (pid {worker.pid}) ready in {time.time() - worker.started_at:.1f}s")
+        else:
+            logger.error(f"Worker {worker.worker_id} (pid {worker.pid}) did not become ready")
+        return ok
+
+    def _stop_worker(self, worker: Worker, timeout: float = 30, terminate: bool = True):
+        """
+        SIGTERM (uvicorn finishes open requests), SIGKILL after timeout; reaps the
+        process. terminate=False only waits: a second SIGTERM makes uvicorn exit at once.
+        """
+        if worker.ready_fd is not None:
+            os.close(worker.ready_fd)
+            worker.ready_fd = None
+        try:
+            if terminate:
+                os.kill(worker.pid, signal.SIGTERM)
+            deadline = time.time() + timeout
+            while time.time() < deadline:
+                if os.waitpid(worker.pid, os.WNOHANG)[0]:
+                    return
+                time.sleep(0.1)
+            logger.warning(f"Worker {worker.worker_id} (pid {worker.pid}) did not stop, killing it")
+            os.kill(worker.pid, signal.SIGKILL)
+            os.waitpid(worker.pid, 0)
+        except (ProcessLookupError, ChildProcessError):
+            pass
+
+    def _reap(self):
+        """Replace workers that died on their own."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            worker = next((w for w in self.workers.values() if w.pid == pid), None)
+            if worker is None:
+                continue
+            logger.error(f"Worker {worker.worker_id} (pid {pid}) exited with status {status}")
+            if worker.ready_fd is not None:
+                os.close(worker.ready_fd)
+            if not self._stopping:
+                if time.time() - worker.started_at < 5:
+                    time.sleep(1)  # do not spin on a worker that crashes at startup
+                self.workers[worker.worker_id] = self._spawn(worker.worker_id)
+
+    def reload(self, include_writer: bool = True):
+        """
+        Reload the index in the master, then replace the workers one by one;
+        include_writer=False keeps worker 0 (whose own writes changed the index).
+        """
+        self._reload_requested = False
+        logger.info(f"Reloading index and restarting {'all' if include_writer else 'read-only'} workers")
+        self._load_index()
+        for worker_id in sorted(self.workers):
+            if self._stopping:
+                return
+            if worker_id == 0 and not include_writer:
+                continue
+            old = self.workers[worker_id]
+            if worker_id == 0:
+                # the ingest writer: stop it before its successor starts writing
+                self._stop_worker(old)
+                self.workers[0] = new = self._spawn(0)
+                self._wait_ready(new)
+                continue
+            new = self._spawn(worker_id)
+            if not self._wait_ready(new):
+                self._stop_worker(new)
+                continue  # keep serving with the old worker
+            self.workers[worker_id] = new
+            self._stop_worker(old)
+
+    def _index_changed(self) -> bool:
+        """
+        The index files changed and then stayed unchanged for one poll interval,
+        or have kept changing (a long crawl) for SERVE_INDEX_MAX_LAG seconds.
+        """
+        mtime = self._index_mtime()
+        if mtime == self._loaded_mtime:
+            self._changed_at = None
+        elif self._changed_at is None:
+            self._changed_at = time.time()
+        changed = self._changed_at is not None and (
+            mtime == self._seen_mtime or time.time() - self._changed_at >= SERVE_INDEX_MAX_LAG
+        )
+        self._seen_mtime = mtime
+        return changed
+
+    def _on_signal(self, sig, frame):
+        if sig == signal.SIGHUP:
+            self._reload_requested = True
+        else:
+            self._stopping = True
+
+    def run(self):
+        self._bind()
+        self._load()
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, self._on_signal)
+        for worker_id in range(self.n_workers):
+            self.workers[worker_id] = self._spawn(worker_id)
+        for worker in list(self.workers.values()):
+            self._wait_ready(worker)
+        logger.info(f"Serving on {self.host}:{self.port} with {self.n_workers} worker(s), "
+                    f"{self.torch_threads} torch thread(s) each")
+        last_check = time.time()
+        while not self._stopping:
+            time.sleep(0.5)
+            self._reap()
+            if self._reload_requested and not self._stopping:
+                self.reload()
+            elif SERVE_INDEX_POLL > 0 and time.time() - last_check >= SERVE_INDEX_POLL:
+                last_check = time.time()
+                if self.n_workers > 1 and self._index_changed():
+                    self.reload(include_writer=False)
+        logger.info("Stopping workers")
+        for worker in list(self.workers.values()):
+            try:
+                os.kill(worker.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for worker in list(self.workers.values()):
+            self._stop_worker(worker, terminate=False)
+        self.sock.close()
+        self.writer_sock.close()
+        os.unlink(self.writer_path)
+
+    # --- worker side -------------------------------------------------------
+
+    def _child(self, worker_id: int, ready_w: int):
+        code = 1
+        try:
+            for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+                signal.signal(sig, signal.SIG_DFL)
+            for worker in self.workers.values():
+                if worker.ready_fd is not None:
+                    os.close(worker.ready_fd)
+            gc.enable()
+            random.seed()
+            import torch
+            torch.set_num_threads(self.torch_threads)
+            import uvicorn
+            from app import startup
+            from app.main import app
+            startup.ingest_workers_enabled = worker_id == 0
+            if worker_id == 0 and self._index_mtime() != self._loaded_mtime:
+                # the previous writer persisted after the master loaded; start from its last write
+                from app import vectorstore
+                vectorstore.reload_index()
+            sockets = [self.sock, self.writer_sock] if worker_id == 0 else [self.sock]
+            served = app if worker_id == 0 else WriterProxy(app, self.writer_path)
+
+            def report_ready():
+                ok = startup.wait()
+                os.write(ready_w, b"1" if ok else b"0")
+                os.close(ready_w)
+            threading.Thread(target=report_ready, name="ready-report", daemon=True).start()
+            uvicorn.Server(uvicorn.Config(served, log_level="info")).run(sockets=sockets)
+            code = 0
+        except BaseException:
+            logger.exception(f"Worker {worker_id} failed")
+        finally:
+            os._exit(code)  # never fall back into the master's code
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preload-and-fork multi-worker server.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--torch-threads", type=int, default=SERVE_TORCH_THREADS,
+                        help="torch intra-op threads per worker (0 = cores / workers)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(process)d] %(name)s: %(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # one line per forwarded write
+    Master(args.host, args.port, args.workers, args.torch_threads).run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Startup loading and readiness.
+
+The FAISS index and the models in PRELOAD_MODELS load in parallel threads (with
+a warm-up inference each, MODEL_WARMUP) while the server already answers: /status
+is liveness, /ready turns 200 once everything preloaded is in place, so rolling
+deploys and autoscalers route traffic only to warm instances. Models left out of
+PRELOAD_MODELS load on first use. Ingest workers start once the index is loaded,
+since a job arriving earlier would write into a fresh empty index.
+In workers forked by app.serve the index and models are already in memory, so
+only the warm-up runs.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from app import metrics
+from app.config import PRELOAD_MODELS, MODEL_WARMUP
+
+logger = logging.getLogger(__name__)
+
+MODELS = ("embedding", "reranker")
+
+_lock = threading.Lock()
+_components: Dict[str, Dict] = {}
+_started_at: Optional[float] = None
+_ready_at: Optional[float] = None
+_stopping = False
+_done = threading.Event()
+# app.serve turns this off in all but one forked worker, so one process writes the index
+ingest_workers_enabled = True
+
+def preload_models():
+    names = [n.strip().lower() for n in PRELOAD_MODELS.split(",") if n.strip()]
+    unknown = [n for n in names if n not in MODELS]
+    if unknown:
+        raise ValueError(f"Unknown PRELOAD_MODELS entries {unknown}; known: {', '.join(MODELS)}")
+    return names
+
+def _load_index():
+    from app.vectorstore import load_index
+    load_index()  # no-op in workers forked by app.serve, which already hold the index
+    with _lock:
+        if _stopping or not ingest_workers_enabled:
+            return
+        from app.jobs import start_workers
+        start_workers()
+
+def _load_embedding():
+    from app import embeddings
+    embeddings.load_model()
+    if MODEL_WARMUP:
+        embeddings.warm_up()
+
+def _load_reranker():
+    from app import reranker
+    reranker.load_reranker()
+    if MODEL_WARMUP:
+        reranker.warm_up()
+
+_LOADERS = {"index": _load_index, "embedding": _load_embedding, "reranker": _load_reranker}
+
+def _run(name: str):
+    _components[name].update(status="loading")
+    start = time.perf_counter()
+    try:
+        _LOADERS[name]()
+    except Exception as e:
+        logger.exception(f"Loading {name} failed")
+        _components[name].update(status="failed", error=str(e))
+    else:
+        _components[name].update(status="ready")
+    finally:
+        _components[name]["seconds"] = round(time.perf_counter() - start, 3)
+        logger.info(f"{name}: {_components[name]['status']} in {_components[name]['seconds']}s")
+
+def _preload(names):
+    global _ready_at
+    with ThreadPoolExecutor(max_workers=len(names), thread_name_prefix="preload") as pool:
+        list(pool.map(_run, names))
+    if all(_components[n]["status"] == "ready" for n in names):
+        _ready_at = time.time()
+        logger.info(f"Ready after {_ready_at - _started_at:.1f}s")
+    _done.set()
+
+def start() -> threading.Thread:
+    """Load the index and preloaded models in the background; returns the loader thread."""
+    global _started_at, _ready_at, _stopping
+    names = ["index"] + preload_models()
+    _started_at, _ready_at, _stopping = time.time(), None, False
+    _done.clear()
+    _components.clear()
+    for name in ("index",) + MODELS:
+        _components[name] = {"status": "pending" if name in names else "lazy", "seconds": None, "error": None}
+    thread = threading.Thread(target=_preload, args=(names,), name="preload", daemon=True)
+    thread.start()
+    return thread
+
+def wait(timeout: Optional[float] = None) -> bool:
+    """
+    Block until preloading has finished (e.g. in scripts and benchmarks), also
+    when called before start(); True if ready.
+    """
+    _done.wait(timeout)
+    return is_ready()
+
+def stop():
+    """Keep a still-running preload from starting ingest workers after shutdown."""
+    global _stopping
+    with _lock:
+        _stopping = True
+
+def is_ready() -> bool:
+    return _ready_at is not None
+
+def _lazy_loaded(name: str) -> bool:
+    from app import embeddings, reranker
+    return (embeddings if name == "embedding" else reranker)._model is not None
+
+def readiness() -> Dict:
+    components = {name: dict(c) for name, c in _components.items()}
+    for name, c in components.items():
+        if c["status"] == "lazy" and _lazy_loaded(name):
+            c["status"] = "loaded on demand"
+    return {
+        "ready": is_ready(),
+        "seconds": round((_ready_at or time.time()) - _started_at, 3) if _started_at else None,
+        "components": components,
+    }
+
+metrics.gauge("rag_ready", "1 once the index and preloaded models are loaded and warm.").set_function(
+    lambda: 1 if is_ready() else 0
+)
@@ -1,2 +1,9 @@
-from .chunker import chunk_text
-__all__ = ["chunk_text"]
+from .chunker import (
+    chunk_text, chunk_documents, chunk_text_by_tokens, sentence_spans, split_sentences,
+    StreamingChunker, iter_chunks,
+)
+from .simhash import simhash, hamming, SimHashIndex
+__all__ = [
+    "chunk_text", "chunk_documents", "chunk_text_by_tokens", "sentence_spans", "split_sentences",
+    "StreamingChunker", "iter_chunks", "simhash", "hamming", "SimHashIndex",
+]
@@ -1,3 +1,12 @@
+import re
+from typing import Iterable, Iterator, List, Tuple
+import numpy as np
+from app.config import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+
+# A sentence is a run of text closed by Chinese/ASCII sentence punctuation (plus any
+# trailing closing quotes/brackets), or a trailing fragment that ends at a line break.
+_SENTENCE_RE = re.compile(r"[^\n。！？!?；;]*[。！？!?；;]+[”’」』）)]*|[^\n。！？!?；;]+")
+
 def chunk_text(text: str, chunk_size: int = 512, overlap: int = 64):
     text = text.strip()
     if len(text) <= chunk_size:
@@ -12,3 +21,166 @@ def chunk_text(text: str, chunk_size: int = 512, overlap: int = 64):
             break
         start = end - overlap
     return chunks
+
+def sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """
+    Return (start, end) character offsets of the sentences in text.
+    Whitespace-only fragments are dropped.
+    """
+    spans = []
+    for m in _SENTENCE_RE.finditer(text):
+        start, end = m.span()
+        # trim surrounding whitespace so spans start/end on real characters
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if end > start:
+            spans.append((start, end))
+    return spans
+
+def split_sentences(text: str) -> List[str]:
+    return [text[s:e] for s, e in sentence_spans(text)]
+
+def _token_units(text: str, token_starts: np.ndarray, max_tokens: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Split text into packing units: sentences, with sentences longer than
+    max_tokens cut at token boundaries.
+    Returns (bounds, counts): (n, 2) character offsets and tokens per unit.
+    """
+    spans = sentence_spans(text)
+    if not spans:
+        return np.zeros((0, 2), dtype=np.int64), np.zeros(0, dtype=np.int64)
+    bounds = np.asarray(spans, dtype=np.int64)
+    # a token belongs to the sentence its first character falls in
+    lo = np.searchsorted(token_starts, bounds[:, 0], side="left")
+    hi = np.searchsorted(token_starts, bounds[:, 1], side="left")
+    counts = hi - lo
+    if counts.max(initial=0) <= max_tokens:
+        return bounds, counts
+
+    out_bounds, out_counts = [], []
+    for (start, end), t_lo, t_hi in zip(bounds.tolist(), lo.tolist(), hi.tolist()):
+        if t_hi - t_lo <= max_tokens:
+            out_bounds.append((start, end))
+            out_counts.append(t_hi - t_lo)
+            continue
+        for t in range(t_lo, t_hi, max_tokens):
+            piece_start = start if t == t_lo else int(token_starts[t])
+            nxt = t + max_tokens
+            piece_end = end if nxt >= t_hi else int(token_starts[nxt])
+            out_bounds.append((piece_start, piece_end))
+            out_counts.append(min(max_tokens, t_hi - t))
+    return np.asarray(out_bounds, dtype=np.int64), np.asarray(out_counts, dtype=np.int64)
+
+def _pack_units(counts: np.ndarray, max_tokens: int, overlap_tokens: int = 0) -> List[Tuple[int, int]]:
+    """
+    Greedily pack consecutive units into chunks of at most max_tokens tokens.
+    Each new chunk repeats the trailing units of the previous one worth at most
+    overlap_tokens tokens. Returns [start, end) unit ranges.
+    """
+    n = len(counts)
+    if n == 0:
+        return []
+    cum = np.cumsum(counts)
+    ranges = []
+    i = 0
+    while i < n:
+        base = cum[i - 1] if i else 0
+        j = max(i + 1, int(np.searchsorted(cum, base + max_tokens, side="right")))
+        ranges.append((i, j))
+        if j >= n:
+            break
+        k = j
+        if overlap_tokens > 0:
+            # smallest k with tokens(units k..j-1) <= overlap_tokens, without stalling
+            k = int(np.searchsorted(cum, cum[j - 1] - overlap_tokens, side="left")) + 1
+            k = min(max(k, i + 1), j)
+        i = k
+    return ranges
+
+def _load_tokenizer(tokenizer):
+    if tokenizer is None:
+        from app.embeddings import load_tokenizer
+        tokenizer = load_tokenizer()  # no model weights needed to count tokens
+    return tokenizer
+
+def chunk_documents(texts: List[str], max_tokens: int = CHUNK_MAX_TOKENS,
+                    overlap_tokens: int = CHUNK_OVERLAP_TOKENS, tokenizer=None) -> List[List[str]]:
+    """
+    Token-aware, sentence-boundary chunking of many documents at once.
+    All documents are tokenized in one batched call of the embedding tokenizer;
+    its character offsets give exact token counts per sentence, and sentences are
+    packed into chunks of up to max_tokens tokens. Blank documents yield no chunks.
+    """
+    tokenizer = _load_tokenizer(tokenizer)
+    texts = [t.strip() for t in texts]
+    if not texts:
+        return []
+    enc = tokenizer(texts, add_special_tokens=False, return_offsets_mapping=True, truncation=False)
+    results = []
+    for text, offsets in zip(texts, enc["offset_mapping"]):
+        if not text:
+            results.append([])
+            continue
+        token_starts = np.fromiter((s for s, _ in offsets), dtype=np.int64, count=len(offsets))
+        bounds, counts = _token_units(text, token_starts, max_tokens)
+        results.append([
+            text[bounds[a, 0]:bounds[b - 1, 1]]
+            for a, b in _pack_units(counts, max_tokens, overlap_tokens)
+        ])
+    return results
+
+def chunk_text_by_tokens(text: str, max_tokens: int = CHUNK_MAX_TOKENS,
+                         overlap_tokens: int = CHUNK_OVERLAP_TOKENS, tokenizer=None) -> List[str]:
+    return chunk_documents([text], max_tokens, overlap_tokens, tokenizer)[0]
+
+class StreamingChunker:
+    """
+    Incremental counterpart of chunk_text_by_tokens for documents that arrive in pieces.
+    feed() buffers text and returns the chunks that can no longer change; the last,
+    possibly incomplete chunk stays buffered until more text arrives or flush().
+    Memory is bounded by window_chars plus one chunk, whatever the document size.
+    """
+    def __init__(self, max_tokens: int = CHUNK_MAX_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                 tokenizer=None, window_chars: int = 0):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.tokenizer = _load_tokenizer(tokenizer)
+        # Enough text for a few chunks before packing (Chinese is ~1 token per char)
+        self.window_chars = window_chars or max_tokens * 4
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        if len(self._buffer) < self.window_chars:
+            return []
+        return self._drain(final=False)
+
+    def flush(self) -> List[str]:
+        return self._drain(final=True)
+
+    def _drain(self, final: bool) -> List[str]:
+        text = self._buffer
+        enc = self.tokenizer([text], add_special_tokens=False, return_offsets_mapping=True, truncation=False)
+        offsets = enc["offset_mapping"][0]
+        token_starts = np.fromiter((s for s, _ in offsets), dtype=np.int64, count=len(offsets))
+        bounds, counts = _token_units(text, token_starts, self.max_tokens)
+        ranges = _pack_units(counts, self.max_tokens, self.overlap_tokens)
+        if final:
+            self._buffer = ""
+        elif len(ranges) <= 1:
+            return []
+        else:
+            # keep everything from the start of the last chunk: it may still grow
+            self._buffer = text[bounds[ranges[-1][0], 0]:]
+            ranges = ranges[:-1]
+        return [text[bounds[a, 0]:bounds[b - 1, 1]] for a, b in ranges]
+
+def iter_chunks(pieces: Iterable[str], max_tokens: int = CHUNK_MAX_TOKENS,
+                overlap_tokens: int = CHUNK_OVERLAP_TOKENS, tokenizer=None) -> Iterator[str]:
+    """Generator over the chunks of a document given as an iterable of text pieces."""
+    chunker = StreamingChunker(max_tokens, overlap_tokens, tokenizer)
+    for piece in pieces:
+        yield from chunker.feed(piece)
+    yield from chunker.flush()
@@ -0,0 +1,89 @@
+import hashlib
+import re
+from typing import Dict, Hashable, List, Optional, Tuple
+import numpy as np
+
+_WS_RE = re.compile(r"\s+")
+_BITS = 64
+
+def _shingles(text: str, ngram: int) -> List[str]:
+    text = _WS_RE.sub("", text)
+    if len(text) <= ngram:
+        return [text] if text else []
+    return [text[i:i + ngram] for i in range(len(text) - ngram + 1)]
+
+def simhash(text: str, ngram: int = 3) -> int:
+    """
+    64-bit SimHash over character n-gram shingles (whitespace ignored, so it
+    works for Chinese without word segmentation). Near-identical texts get
+    signatures that differ in only a few bits.
+    """
+    shingles = _shingles(text, ngram)
+    if not shingles:
+        return 0
+    # stable across processes, unlike hash(); signatures are persisted in the metadata
+    digests = b"".join(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest() for s in shingles)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(len(shingles), 8), axis=1)
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(shingles)
+    return int.from_bytes(np.packbits(votes > 0).tobytes(), "big")
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+class SimHashIndex:
+    """
+    LSH index over 64-bit SimHash signatures.
+    The signature is split into `bands` bit bands; two signatures within
+    max_distance bits share at least one identical band when bands > max_distance
+    (pigeonhole), so only band-bucket collisions are compared exactly.
+    """
+    def __init__(self, max_distance: int = 3, bands: Optional[int] = None):
+        bands = bands or max(4, max_distance + 1)
+        if bands <= max_distance:
+            raise ValueError("bands must exceed max_distance for exact recall")
+        self.max_distance = max_distance
+        self.bands = bands
+        self._width = _BITS // bands
+        self._mask = (1 << self._width) - 1
+        self._buckets: List[Dict[int, List[Hashable]]] = [{} for _ in range(bands)]
+        self._signatures: Dict[Hashable, int] = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def _keys(self, sig: int):
+        return [(sig >> (b * self._width)) & self._mask for b in range(self.bands)]
+
+    def add(self, key: Hashable, sig: int):
+        if key in self._signatures:
+            self.remove(key)
+        self._signatures[key] = sig
+        for bucket, band in zip(self._buckets, self._keys(sig)):
+            bucket.setdefault(band, []).append(key)
+
+    def remove(self, key: Hashable):
+        sig = self._signatures.pop(key, None)
+        if sig is None:
+            return
+        for bucket, band in zip(self._buckets, self._keys(sig)):
+            keys = bucket.get(band)
+            if keys:
+                keys.remove(key)
+                if not keys:
+                    del bucket[band]
+
+    def query(self, sig: int, exclude=None) -> Optional[Tuple[Hashable, int]]:
+        """Closest indexed key within max_distance as (key, distance), or None."""
+        best = None
+        seen = set()
+        for bucket, band in zip(self._buckets, self._keys(sig)):
+            for key in bucket.get(band, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                if exclude is not None and exclude(key):
+                    continue
+                d = hamming(sig, self._signatures[key])
+                if d <= self.max_distance and (best is None or d < best[1]):
+                    best = (key, d)
+        return best
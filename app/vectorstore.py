@@ -1,8 +1,17 @@
+import fcntl
+import hashlib
 import os
+from contextlib import contextmanager
 import faiss
 import numpy as np
 import pickle
 import threading
+from app import metrics
+from app.config import (
+    NEAR_DUP_MAX_DISTANCE, FAISS_INDEX_FACTORY, FAISS_NPROBE, FAISS_EF_SEARCH, EMBED_BATCH_SIZE,
+    SEARCH_OVERFETCH,
+)
+from app.utils.simhash import SimHashIndex
 
 INDEX_PATH = os.path.expanduser(os.getenv("FAISS_INDEX_PATH", "~/projects/rag-fastapi/data/faiss_index.bin"))
 META_PATH = INDEX_PATH + ".meta.pkl"
@@ -11,59 +20,378 @@ _index = None
 _id_to_meta = {}
 _dim = None
 _lock = threading.Lock()
+# document key -> ids of its live chunks, and a SimHash LSH index over live
+# chunks that carry a signature; both rebuilt on load, maintained on changes
+_doc_ids = {}
+_near_dup = SimHashIndex(NEAR_DUP_MAX_DISTANCE)
+_n_deleted = 0
+
+metrics.gauge("rag_index_vectors", "Vectors in the FAISS index, tombstoned ones included.").set_function(
+    lambda: _index.ntotal if _index is not None else 0
+)
+metrics.gauge("rag_index_deleted_vectors", "Tombstoned vectors awaiting compaction.").set_function(lambda: _n_deleted)
+
+def content_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def doc_key(meta):
+    """Identity of the document a chunk belongs to: its url if crawled, else its source."""
+    return meta.get("url") or meta.get("source")
+
+def _track(idx, meta):
+    _doc_ids.setdefault(doc_key(meta), []).append(idx)
+    if meta.get("simhash") is not None:
+        _near_dup.add(idx, meta["simhash"])
+
+def _untrack(idx, meta):
+    ids = _doc_ids.get(doc_key(meta))
+    if ids and idx in ids:
+        ids.remove(idx)
+        if not ids:
+            del _doc_ids[doc_key(meta)]
+    _near_dup.remove(idx)
+
+def _rebuild_lookups():
+    global _doc_ids, _near_dup, _n_deleted
+    _doc_ids, _near_dup, _n_deleted = {}, SimHashIndex(NEAR_DUP_MAX_DISTANCE), 0
+    for idx, meta in _id_to_meta.items():
+        if meta.get("deleted"):
+            _n_deleted += 1
+        else:
+            _track(idx, meta)
+
+def is_flat_factory(factory):
+    return factory.strip().lower() in ("", "flat")
+
+def configure_index(index, nprobe=None, ef_search=None):
+    """
+    Apply search-time parameters (FAISS_NPROBE / FAISS_EF_SEARCH by default) and
+    make IVF vectors reconstructable, as get_vectors and compaction need.
+    """
+    nprobe = FAISS_NPROBE if nprobe is None else nprobe
+    ef_search = FAISS_EF_SEARCH if ef_search is None else ef_search
+    try:
+        ivf = faiss.extract_index_ivf(index)
+        if ivf.direct_map.type == faiss.DirectMap.NoMap:
+            ivf.make_direct_map()
+    except RuntimeError:
+        pass  # not an IVF index
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        if value:
+            try:
+                params.set_index_parameter(index, name, value)
+            except RuntimeError:
+                pass  # parameter does not apply to this index type
+    return index
+
+def is_lossy_index(index):
+    """True if the index keeps compressed codes (PQ, SQ, PCA, ...) rather than the vectors themselves."""
+    idx = faiss.downcast_index(index)
+    if isinstance(idx, faiss.IndexPreTransform):
+        return True
+    if isinstance(idx, faiss.IndexIVF):
+        return not isinstance(idx, faiss.IndexIVFFlat)
+    if isinstance(idx, faiss.IndexHNSW):
+        idx = faiss.downcast_index(idx.storage)
+    return not isinstance(idx, faiss.IndexFlat)
+
+def build_ann_index(vectors, factory=FAISS_INDEX_FACTORY):
+    """An index of the factory type holding vectors, trained on them if the type needs it."""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    if is_flat_factory(factory):
+        index = faiss.IndexFlatIP(vectors.shape[1])
+    else:
+        index = faiss.index_factory(vectors.shape[1], factory, faiss.METRIC_INNER_PRODUCT)
+        if not index.is_trained:
+            index.train(vectors)
+    index.add(vectors)
+    return configure_index(index)
 
 def create_index(dim):
     global _index, _dim
     _dim = dim
-    _index = faiss.IndexFlatIP(dim)
+    index = None
+    if not is_flat_factory(FAISS_INDEX_FACTORY):
+        index = faiss.index_factory(dim, FAISS_INDEX_FACTORY, faiss.METRIC_INNER_PRODUCT)
+        if not index.is_trained:
+            # no training data yet: start exact; build_index / deduplicate_index build the configured type
+            index = None
+    _index = configure_index(index if index is not None else faiss.IndexFlatIP(dim))
 
-def add_embeddings(embeddings, metas):
+def add_embeddings(embeddings, metas, persist=True):
+    """
+    Append vectors and their metas. With persist=False the caller is responsible
+    for calling save_index() once its batch of additions is done.
+    """
     global _index, _id_to_meta
     with _lock:
+        if _index is None:
+            _read_index_files()  # never start a fresh index over the files on disk
         if _index is None:
             create_index(embeddings.shape[1])
         n_before = _index.ntotal
         _index.add(embeddings)
         for i, meta in enumerate(metas):
             _id_to_meta[n_before + i] = meta
-        persist_index()
+            _track(n_before + i, meta)
+        if persist:
+            persist_index()
 
-def search(query_vec, top_k=10):
-    global _index
+def get_doc_chunks(key):
+    """Return {content hash: [index ids]} of the live chunks of a document."""
     if _index is None:
         load_index()
-    if _index is None or _index.ntotal == 0:
-        return []
+    chunks = {}
+    for idx in _doc_ids.get(key, []):
+        meta = _id_to_meta[idx]
+        h = meta.get("hash") or content_hash(meta.get("text", ""))
+        chunks.setdefault(h, []).append(idx)
+    return chunks
+
+def find_near_duplicate(signature, exclude_key=None):
+    """
+    Closest live chunk whose SimHash is within NEAR_DUP_MAX_DISTANCE bits, as
+    (index id, meta, distance), or None. Chunks of document exclude_key are
+    ignored (a re-ingested document is not a duplicate of its old version).
+    """
+    if _index is None:
+        load_index()
+    exclude = None
+    if exclude_key is not None:
+        exclude = lambda idx: doc_key(_id_to_meta[idx]) == exclude_key
+    hit = _near_dup.query(signature, exclude)
+    if hit is None:
+        return None
+    return hit[0], _id_to_meta[hit[0]], hit[1]
+
+def _merge_aliases(current, new):
+    merged = list(current)
+    seen = {(a.get("url") or a.get("source"), a.get("id")) for a in merged}
+    for a in new:
+        k = (a.get("url") or a.get("source"), a.get("id"))
+        if k not in seen:
+            seen.add(k)
+            merged.append(a)
+    return merged
+
+def _promote_alias(meta):
+    """
+    Meta for the chunk that replaces a tombstoned chunk in the first of its aliases
+    still missing from its own document; the other aliases move along. None if
+    there is no such alias.
+    """
+    aliases = [a for a in meta.get("aliases", [])
+               if not any(_id_to_meta[i].get("id") == a.get("id") for i in _doc_ids.get(doc_key(a), []))]
+    if not aliases:
+        return None
+    heir = {k: meta[k] for k in ("text", "hash", "simhash") if k in meta}
+    heir.update(aliases[0])
+    if len(aliases) > 1:
+        heir["aliases"] = aliases[1:]
+    return heir
+
+def apply_changes(embeddings, metas, updates=None, tombstones=(), aliases=None, persist=True):
+    """
+    Commit one incremental ingest under the lock: append new vectors, replace the
+    metadata of kept chunks (updates: {index id: meta}), tombstone removed ones and
+    record near-duplicate aliases on stored chunks (aliases: {index id: [alias]}).
+    Aliases already recorded on a chunk survive metadata updates; when the chunk
+    is tombstoned, its first alias becomes a stored chunk with the same vector.
+    Tombstoned entries stay in the FAISS index but are never returned;
+    deduplicate_index() compacts them away.
+    """
+    global _n_deleted
+    with _lock:
+        if len(metas):
+            if _index is None:
+                _read_index_files()  # never start a fresh index over the files on disk
+            if _index is None:
+                create_index(embeddings.shape[1])
+            n_before = _index.ntotal
+            _index.add(embeddings)
+            for i, meta in enumerate(metas):
+                _id_to_meta[n_before + i] = meta
+                _track(n_before + i, meta)
+        for idx, meta in (updates or {}).items():
+            old = _id_to_meta.get(idx)
+            if old is None or old.get("deleted"):
+                continue
+            if old.get("aliases"):
+                meta = {**meta, "aliases": _merge_aliases(old["aliases"], meta.get("aliases", []))}
+            _untrack(idx, old)
+            _id_to_meta[idx] = meta
+            _track(idx, meta)
+        for idx, new in (aliases or {}).items():
+            meta = _id_to_meta.get(idx)
+            if meta is not None and not meta.get("deleted"):
+                _id_to_meta[idx] = {**meta, "aliases": _merge_aliases(meta.get("aliases", []), new)}
+        promoted = []
+        for idx in tombstones:
+            meta = _id_to_meta.get(idx)
+            if meta is not None and not meta.get("deleted"):
+                _untrack(idx, meta)
+                _id_to_meta[idx] = {**meta, "deleted": True}
+                _n_deleted += 1
+                heir = _promote_alias(meta)
+                if heir is not None:
+                    promoted.append((idx, heir))
+        if promoted:
+            # near-duplicates were never embedded; they take over the tombstoned chunk's vector
+            n_before = _index.ntotal
+            _index.add(np.vstack([_index.reconstruct(int(idx)) for idx, _ in promoted]))
+            for i, (_, heir) in enumerate(promoted):
+                _id_to_meta[n_before + i] = heir
+                _track(n_before + i, heir)
+        if persist and _index is not None:
+            persist_index()
+
+def search(query_vec, top_k=10):
     if query_vec.ndim == 1:
         query_vec = query_vec.reshape(1, -1)
-    distances, indices = _index.search(query_vec, top_k)
-    results = []
-    for d, idx in zip(distances[0], indices[0]):
-        if idx < 0:
-            continue
-        meta = _id_to_meta.get(int(idx), {})
-        results.append({"score": float(d), "id": int(idx), "meta": meta})
-    return results
+    return search_batch(query_vec[:1], top_k=top_k)[0]
+
+def search_batch(query_vecs, top_k=10):
+    """
+    Search many queries with a single FAISS call.
+    query_vecs: (n_queries, dim) array. Returns one result list per query.
+    Tombstoned chunks are skipped: the first call over-fetches by at most
+    SEARCH_OVERFETCH, and only queries left with fewer than top_k live hits are
+    searched again with a larger k.
+    """
+    global _index
+    if _index is None:
+        load_index()
+    index, id_to_meta = _index, _id_to_meta
+    n_queries = query_vecs.shape[0] if query_vecs.ndim > 1 else 1
+    if index is None or index.ntotal == 0:
+        return [[] for _ in range(n_queries)]
+    if query_vecs.ndim == 1:
+        query_vecs = query_vecs.reshape(1, -1)
+    query_vecs = np.ascontiguousarray(query_vecs, dtype="float32")
+    fetch_k = min(index.ntotal, top_k + _n_deleted, top_k * max(1, SEARCH_OVERFETCH))
+    all_results = [None] * n_queries
+    pending = np.arange(n_queries)
+    while len(pending):
+        distances, indices = index.search(query_vecs[pending], fetch_k)
+        short = []
+        for q, row_d, row_i in zip(pending, distances, indices):
+            results = []
+            for d, idx in zip(row_d, row_i):
+                if idx < 0:
+                    continue
+                meta = id_to_meta.get(int(idx), {})
+                if meta.get("deleted"):
+                    continue
+                results.append({"score": float(d), "id": int(idx), "meta": meta})
+                if len(results) >= top_k:
+                    break
+            all_results[q] = results
+            # a row padded with -1 has run out of candidates; a larger k finds no more
+            if len(results) < top_k and fetch_k < index.ntotal and row_i[-1] >= 0:
+                short.append(q)
+        pending = np.array(short, dtype="int64")
+        fetch_k = min(index.ntotal, fetch_k * 4)
+    return all_results
+
+def get_vectors(ids):
+    """
+    Return the stored vectors for the given index ids as a (len(ids), dim) float32 array.
+    """
+    if _index is None:
+        load_index()
+    if _index is None or len(ids) == 0:
+        return np.zeros((0, _dim or 0), dtype="float32")
+    keys = np.asarray(ids, dtype="int64")
+    try:
+        return _index.reconstruct_batch(keys)
+    except Exception:
+        return np.vstack([_index.reconstruct(int(i)) for i in keys])
+
+@contextmanager
+def _pair_lock(index_path, exclusive):
+    """
+    Cross-process lock on an index file pair: writers swap both files in under an
+    exclusive lock, readers read both under a shared one, so a reader never pairs
+    the index of one write with the metadata of another.
+    """
+    with open(index_path + ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def write_index_files(index, id_to_meta, index_path=None):
+    """
+    Write an index and its metadata in the serving format. Both are written to
+    temporary files first and swapped in together (see _pair_lock), so a
+    concurrent read_index_files never sees a half-written or mismatched pair.
+    """
+    index_path = index_path or INDEX_PATH
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    tmp_index = f"{index_path}.{os.getpid()}.tmp"
+    faiss.write_index(index, tmp_index)
+    tmp_meta = f"{index_path}.meta.pkl.{os.getpid()}.tmp"
+    with open(tmp_meta, "wb") as f:
+        pickle.dump(id_to_meta, f)
+    with _pair_lock(index_path, exclusive=True):
+        os.replace(tmp_index, index_path)
+        os.replace(tmp_meta, index_path + ".meta.pkl")
+
+def read_index_files(index_path=None):
+    """(index, {id: meta}) as last written by write_index_files, or (None, {}) if there is none."""
+    index_path = index_path or INDEX_PATH
+    if not os.path.exists(index_path):
+        return None, {}
+    with _pair_lock(index_path, exclusive=False):
+        index = faiss.read_index(index_path)
+        id_to_meta = {}
+        if os.path.exists(index_path + ".meta.pkl"):
+            with open(index_path + ".meta.pkl", "rb") as f:
+                id_to_meta = pickle.load(f)
+    return index, id_to_meta
 
 def persist_index():
-    global _index, _id_to_meta
+    """Write the in-memory index to disk; the caller holds _lock (others use save_index)."""
     if _index is None:
         return
-    os.makedirs(os.path.dirname(INDEX_PATH), exist_ok=True)
-    faiss.write_index(_index, INDEX_PATH)
     # make a shallow copy to avoid mutation during pickle
-    meta_copy = dict(_id_to_meta)
-    with open(META_PATH, "wb") as f:
-        pickle.dump(meta_copy, f)
+    write_index_files(_index, dict(_id_to_meta))
+
+def save_index():
+    """
+    persist_index for callers outside this module: holds the lock, so no commit
+    adds to the index or its metadata while the pair is written.
+    """
+    with _lock:
+        persist_index()
 
 def load_index():
+    """
+    Load the index files, unless an index is already in memory: a write that
+    lazily loaded or created it while startup was still reading the files must
+    not be replaced by the older snapshot.
+    """
+    with _lock:
+        if _index is None:
+            _read_index_files()
+
+def _read_index_files():
+    """Replace the in-memory index with the files on disk; the caller holds _lock."""
     global _index, _id_to_meta, _dim
-    if os.path.exists(INDEX_PATH):
-        _index = faiss.read_index(INDEX_PATH)
-        if os.path.exists(META_PATH):
-            with open(META_PATH, "rb") as f:
-                _id_to_meta = pickle.load(f)
+    index, id_to_meta = read_index_files()
+    if index is not None:
+        # swap both together so readers never pair a new index with old metadata
+        _index, _id_to_meta = configure_index(index), id_to_meta
         _dim = _index.d if hasattr(_index, "d") else None
+        _rebuild_lookups()
+
+def reload_index():
+    """Hot-load the index files from disk (e.g. after an offline build). Returns ntotal."""
+    with _lock:
+        _read_index_files()
+        return _index.ntotal if _index is not None else 0
 
 def get_existing_sources():
     """Return a set of all sources currently in the index."""
@@ -72,26 +400,33 @@ def get_existing_sources():
         load_index()
     sources = set()
     for meta in _id_to_meta.values():
-        if "source" in meta:
+        if "source" in meta and not meta.get("deleted"):
             sources.add(meta["source"])
     return sources
 
 def deduplicate_index():
     """
-    Remove duplicate entries based on 'source' and 'text'.
-    Rebuilds the index in memory and persists it.
+    Remove duplicate entries based on 'source' and 'text', and compact away
+    tombstoned chunks. Rebuilds the index in memory and persists it. Vectors are
+    taken from the index when it stores them exactly; a lossy (PQ, SQ, ...) index
+    only holds approximations, so its kept chunks are re-embedded from their text
+    instead of training the new quantizer on reconstruction error.
     """
     global _index, _id_to_meta
     with _lock:
         if _index is None:
-            load_index()
+            _read_index_files()
         if _index is None or _index.ntotal == 0:
             return 0
 
         print("Starting deduplication...")
         # Group by source
         source_groups = {}
+        removed_count = 0
         for idx, m in _id_to_meta.items():
+            if m.get('deleted'):
+                removed_count += 1
+                continue
             src = m.get('source', 'unknown')
             
             # Normalize source: if it's just a number like "315", convert to "315.json"
@@ -107,36 +442,53 @@ def deduplicate_index():
 
         kept_vectors = []
         kept_metas = []
-        removed_count = 0
 
-        # Reconstruct all vectors (fast for IndexFlat)
-        try:
-            all_vectors = _index.reconstruct_n(0, _index.ntotal)
-        except Exception as e:
-            print(f"Error reconstructing vectors: {e}")
-            return 0
+        lossy = is_lossy_index(_index)
+        if not lossy:
+            try:
+                all_vectors = _index.reconstruct_n(0, _index.ntotal)
+            except Exception as e:
+                print(f"Error reconstructing vectors: {e}")
+                return 0
 
         for src, indices in source_groups.items():
-            seen_texts = set()
+            seen_texts = {}
             for idx in indices:
                 txt = _id_to_meta[idx].get('text', '')
                 # Deduplicate by exact text match within the same source
                 if txt not in seen_texts:
-                    seen_texts.add(txt)
-                    kept_vectors.append(all_vectors[idx])
+                    seen_texts[txt] = len(kept_metas)
+                    if not lossy:
+                        kept_vectors.append(all_vectors[idx])
                     kept_metas.append(_id_to_meta[idx])
                 else:
                     removed_count += 1
+                    aliases = _id_to_meta[idx].get('aliases')
+                    if aliases:
+                        # the kept copy carries the near-duplicates of the dropped one
+                        kept = kept_metas[seen_texts[txt]]
+                        kept_metas[seen_texts[txt]] = {
+                            **kept, 'aliases': _merge_aliases(kept.get('aliases', []), aliases)}
 
         if removed_count > 0:
-            print(f"Removing {removed_count} duplicates. Rebuilding index...")
+            print(f"Removing {removed_count} duplicate or deleted entries. Rebuilding index...")
+            if lossy and kept_metas:
+                from app.embeddings import get_embeddings
+                print(f"Re-embedding {len(kept_metas)} chunks (the index only stores compressed vectors)...")
+                kept_vectors = get_embeddings([m.get('text', '') for m in kept_metas], batch_size=EMBED_BATCH_SIZE)
             dim = _index.d
             new_index = faiss.IndexFlatIP(dim)
-            if kept_vectors:
-                new_index.add(np.array(kept_vectors))
-            
+            if kept_metas:
+                try:
+                    # the configured index type, trained on the kept vectors
+                    new_index = build_ann_index(np.array(kept_vectors))
+                except RuntimeError as e:
+                    print(f"Could not build a {FAISS_INDEX_FACTORY} index ({e}); keeping an exact index.")
+                    new_index.add(np.array(kept_vectors))
+
             _index = new_index
             _id_to_meta = {i: m for i, m in enumerate(kept_metas)}
+            _rebuild_lookups()
             persist_index()
             print("Deduplication complete.")
         else:
@@ -0,0 +1,223 @@
+"""
+Recall / latency evaluation of approximate (ANN) and quantized FAISS indexes,
+for choosing FAISS_INDEX_FACTORY, FAISS_NPROBE and FAISS_EF_SEARCH.
+
+Exact results from a flat inner-product index are the ground truth. Every
+index type in --configs is built on the same vectors and searched with each
+applicable search parameter (nprobe for IVF, efSearch for HNSW). Per setting:
+
+  recall@k        share of the exact top-k (k = TOP_K, the candidates /query
+                  reranks) that the index returns in its top-k
+  context_recall  share of the exact top-n (n = LLM_CONTEXT_DOCS) found among
+                  those k candidates: what the reranker can still pick for the prompt
+  rerank_overlap  with --rerank: share of the reranked top-n over exact
+                  candidates that reranking the index's candidates reproduces
+  latency         single-query p50/p99, batch q/s, build time, index size
+
+Settings on the recall / p50 Pareto frontier are marked with '*'.
+
+Vectors come from a live index (--index, tombstoned chunks skipped) or are
+synthetic clustered unit vectors (--size/--dim). Queries are stored vectors
+with noise added, or embedded benchmark questions (--query-source corpus,
+needs the embedding model; --rerank also the reranker and --index texts).
+{nlist} and {pq} in --configs are filled in from the data size and dimension:
+
+    python -m benchmarks.ann_eval --size 100000
+    python -m benchmarks.ann_eval --index data/faiss_index.bin --query-source corpus --rerank
+"""
+import math
+import os
+import pickle
+import time
+from typing import Dict, List, Optional
+import numpy as np
+from benchmarks.common import base_parser, isolate, percentiles, write_results
+
+DEFAULT_CONFIGS = "Flat;HNSW32;IVF{nlist},Flat;IVF{nlist},PQ{pq};OPQ{pq},IVF{nlist},PQ{pq}"
+
+def default_nlist(n: int) -> int:
+    """About 4*sqrt(n) cells, a power of two, with >= 39 training points per cell."""
+    nlist = 2 ** round(math.log2(max(1.0, 4 * math.sqrt(n))))
+    while nlist > 1 and n < 39 * nlist:
+        nlist //= 2
+    return nlist
+
+def default_pq(dim: int) -> int:
+    """PQ sub-quantizers: 8 dimensions each (dim/8 bytes per vector)."""
+    m = max(1, dim // 8)
+    while dim % m:
+        m -= 1
+    return m
+
+def load_index_vectors(path: str):
+    """Live vectors of a stored index and their metadata."""
+    import faiss
+    index = faiss.read_index(path)
+    metas = {}
+    if os.path.exists(path + ".meta.pkl"):
+        with open(path + ".meta.pkl", "rb") as f:
+            metas = pickle.load(f)
+    ids = np.array([i for i in range(index.ntotal) if not metas.get(i, {}).get("deleted")], dtype="int64")
+    vectors = index.reconstruct_n(0, index.ntotal)[ids] if len(ids) else np.zeros((0, index.d), dtype="float32")
+    return np.ascontiguousarray(vectors, dtype="float32"), [metas.get(int(i), {}) for i in ids]
+
+def noisy_queries(data: np.ndarray, n: int, rng: np.random.Generator, noise: float = 0.3) -> np.ndarray:
+    q = data[rng.integers(0, len(data), n)] + noise / math.sqrt(data.shape[1]) * rng.standard_normal(
+        (n, data.shape[1])).astype("float32")
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    return q.astype("float32")
+
+def search_settings(index) -> List[str]:
+    """Which search parameter a built index takes: 'nprobe', 'efSearch' or none."""
+    import faiss
+    try:
+        faiss.extract_index_ivf(index)
+        return ["nprobe"]
+    except RuntimeError:
+        pass
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexPreTransform) else index
+    return ["efSearch"] if isinstance(inner, faiss.IndexHNSW) else []
+
+def overlap(found: np.ndarray, truth: np.ndarray, n: int) -> float:
+    """Mean share of each truth row's first n ids that appear in the found row."""
+    shares = [len(set(f.tolist()) & set(t[:n].tolist()) - {-1}) / n for f, t in zip(found, truth)]
+    return float(np.mean(shares))
+
+def rerank_top(queries: List[str], texts: List[str], ids: np.ndarray, n: int, batch_size: int) -> List[List[int]]:
+    from app.reranker import rerank_batch
+    candidates = [[int(i) for i in row if i >= 0] for row in ids]
+    ranked = rerank_batch(queries, [[texts[i] for i in row] for row in candidates], batch_size=batch_size)
+    return [[row[r["index"]] for r in ranks[:n]] for row, ranks in zip(candidates, ranked)]
+
+def evaluate(index, queries: np.ndarray, truth: np.ndarray, k: int, n: int,
+             query_texts: Optional[List[str]], texts: Optional[List[str]],
+             rerank_truth: Optional[List[List[int]]], batch_size: int) -> Dict:
+    single = []
+    for q in queries:
+        t = time.perf_counter()
+        index.search(q.reshape(1, -1), k)
+        single.append(time.perf_counter() - t)
+    t = time.perf_counter()
+    _, found = index.search(queries, k)
+    batch = time.perf_counter() - t
+    row = {
+        f"recall@{k}": overlap(found, truth, k),
+        "context_recall": overlap(found, truth, n),
+        "single": percentiles(single),
+        "batch_qps": len(queries) / batch,
+    }
+    if rerank_truth is not None:
+        picked = rerank_top(query_texts, texts, found, n, batch_size)
+        row["rerank_overlap"] = float(np.mean([len(set(p) & set(t)) / max(1, len(t))
+                                               for p, t in zip(picked, rerank_truth)]))
+    return row
+
+def mark_pareto(rows: List[Dict], recall_key: str):
+    """Flag settings no other setting beats on both recall and p50 latency."""
+    for row in rows:
+        row["pareto"] = not any(
+            o is not row
+            and o[recall_key] >= row[recall_key] and o["single"]["p50_ms"] <= row["single"]["p50_ms"]
+            and (o[recall_key] > row[recall_key] or o["single"]["p50_ms"] < row["single"]["p50_ms"])
+            for o in rows
+        )
+
+def main():
+    from app.config import TOP_K, LLM_CONTEXT_DOCS, RERANK_BATCH_SIZE
+    parser = base_parser(__doc__)
+    parser.add_argument("--index", help="evaluate on the vectors of this stored index instead of synthetic ones")
+    parser.add_argument("--size", type=int, default=50000, help="synthetic vectors")
+    parser.add_argument("--dim", type=int, default=512, help="synthetic vector size (bge-small-zh: 512)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--query-source", choices=["sample", "corpus"], default="sample",
+                        help="sample: stored vectors plus noise; corpus: embedded benchmark questions")
+    parser.add_argument("--configs", default=DEFAULT_CONFIGS, help="';'-separated FAISS factory strings")
+    parser.add_argument("--nprobe", default="1,2,4,8,16,32,64")
+    parser.add_argument("--ef-search", default="16,32,64,128,256")
+    parser.add_argument("--k", type=int, default=TOP_K, help="candidates per query (TOP_K)")
+    parser.add_argument("--context", type=int, default=LLM_CONTEXT_DOCS, help="documents kept for the prompt")
+    parser.add_argument("--rerank", action="store_true", help="also measure overlap after reranking (needs --index texts)")
+    args = parser.parse_args()
+    isolate(args.workdir)
+
+    import faiss
+    from app.vectorstore import build_ann_index, configure_index
+    from benchmarks.bench_search import clustered_vectors
+    from benchmarks.corpus import make_queries
+
+    rng = np.random.default_rng(args.seed)
+    texts = None
+    if args.index:
+        data, metas = load_index_vectors(os.path.expanduser(args.index))
+        texts = [m.get("text", "") for m in metas]
+    else:
+        data = clustered_vectors(args.size, args.dim, rng)
+    if len(data) < args.k:
+        parser.error(f"need at least k={args.k} vectors, have {len(data)}")
+    n, dim = data.shape
+
+    query_texts = None
+    if args.query_source == "corpus" or args.rerank:
+        from app.embeddings import get_embeddings
+        query_texts = make_queries(args.queries, seed=args.seed)
+        queries = np.ascontiguousarray(get_embeddings(query_texts), dtype="float32")
+        if queries.shape[1] != dim:
+            parser.error(f"embedding size {queries.shape[1]} does not match the index ({dim})")
+    else:
+        queries = noisy_queries(data, args.queries, rng)
+
+    exact = faiss.IndexFlatIP(dim)
+    exact.add(data)
+    _, truth = exact.search(queries, args.k)
+    rerank_truth = None
+    if args.rerank:
+        if not texts or not any(texts):
+            parser.error("--rerank needs chunk texts from --index")
+        rerank_truth = rerank_top(query_texts, texts, truth, args.context, RERANK_BATCH_SIZE)
+
+    nlist, pq = default_nlist(n), default_pq(dim)
+    configs = [c.strip().format(nlist=nlist, pq=pq) for c in args.configs.split(";") if c.strip()]
+    values = {"nprobe": [int(v) for v in args.nprobe.split(",")],
+              "efSearch": [int(v) for v in args.ef_search.split(",")]}
+    print(f"{n} vectors, dim {dim}, {len(queries)} queries, k={args.k}, context={args.context}")
+
+    rows = []
+    for config in configs:
+        t = time.perf_counter()
+        try:
+            index = build_ann_index(data, config)
+        except RuntimeError as e:
+            print(f"{config}: cannot build ({str(e).splitlines()[0]})")
+            continue
+        build = time.perf_counter() - t
+        size_mb = faiss.serialize_index(index).nbytes / 1024 / 1024
+        settings = search_settings(index)
+        sweep = [(p, v) for p in settings for v in values[p] if p != "nprobe" or v <= nlist] or [(None, None)]
+        for param, value in sweep:
+            if param == "nprobe":
+                configure_index(index, nprobe=value)
+            elif param == "efSearch":
+                configure_index(index, ef_search=value)
+            row = {"config": config, "param": param, "value": value, "build_seconds": build, "index_mb": size_mb}
+            row.update(evaluate(index, queries, truth, args.k, args.context,
+                                query_texts, texts, rerank_truth, RERANK_BATCH_SIZE))
+            rows.append(row)
+
+    recall_key = f"recall@{args.k}"
+    mark_pareto(rows, recall_key)
+    header = f"  {'config':28s} {'param':14s} {recall_key:>10s} {'ctx_recall':>10s}"
+    header += f" {'rerank':>7s}" if args.rerank else ""
+    print(header + f" {'p50_ms':>8s} {'p99_ms':>8s} {'batch_q/s':>10s} {'build_s':>8s} {'MB':>8s}")
+    for row in sorted(rows, key=lambda r: r["single"]["p50_ms"]):
+        param = f"{row['param']}={row['value']}" if row["param"] else "-"
+        line = f"{'*' if row['pareto'] else ' '} {row['config']:28s} {param:14s} {row[recall_key]:10.4f} {row['context_recall']:10.4f}"
+        line += f" {row['rerank_overlap']:7.4f}" if args.rerank else ""
+        print(line + f" {row['single']['p50_ms']:8.3f} {row['single']['p99_ms']:8.3f} {row['batch_qps']:10.0f}"
+                     f" {row['build_seconds']:8.2f} {row['index_mb']:8.1f}")
+
+    write_results("ann", {"index": args.index, "vectors": n, "dim": dim, "queries": len(queries),
+                          "query_source": args.query_source, "configs": configs, "k": args.k,
+                          "context": args.context, "rerank": args.rerank, "seed": args.seed}, rows, args.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Ingest throughput on a synthetic corpus.
+  direct   - ingest_documents in INGEST_BATCH_DOCS groups, as POST /ingest/batch (sync)
+  reingest - the same corpus again: the content-hash diff path, nothing re-embedded
+  jobs     - the durable job queue with one worker, as POST /ingest/batch (async)
+
+    python -m benchmarks.bench_ingest --docs 500 --doc-chars 1500
+"""
+import time
+from benchmarks.common import base_parser, isolate, write_results
+from benchmarks.corpus import make_corpus
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--doc-chars", type=int, default=1500)
+    parser.add_argument("--batch-docs", type=int, default=None, help="documents per ingest batch (default INGEST_BATCH_DOCS)")
+    parser.add_argument("--modes", default="direct,reingest,jobs")
+    args = parser.parse_args()
+    isolate(args.workdir)
+
+    from app.config import INGEST_BATCH_DOCS
+    from app.embeddings import load_model
+    from app.ingest import ingest_documents
+    from app.vectorstore import save_index
+    from app.jobs import JobStore, IngestWorkerPool
+
+    batch_docs = args.batch_docs or INGEST_BATCH_DOCS
+    docs = make_corpus(args.docs, args.doc_chars, seed=args.seed)
+    load_model()
+    ingest_documents(make_corpus(4, args.doc_chars, seed=args.seed + 1))  # warm-up (also creates the index)
+
+    def run_direct(corpus):
+        t0 = time.perf_counter()
+        results = []
+        for i in range(0, len(corpus), batch_docs):
+            results.extend(ingest_documents(corpus[i:i + batch_docs], persist=False))
+        t_ingest = time.perf_counter() - t0
+        t1 = time.perf_counter()
+        save_index()
+        return results, t_ingest, time.perf_counter() - t1
+
+    rows = []
+    modes = args.modes.split(",")
+    for mode in modes:
+        if mode in ("direct", "reingest"):
+            if mode == "reingest" and "direct" not in modes:
+                run_direct(docs)  # reingest needs the corpus in the index first
+            results, seconds, persist_seconds = run_direct(docs)
+            chunks = sum(r["chunks"] for r in results)
+            row = {
+                "mode": mode, "docs": len(docs), "chunks": chunks,
+                "embedded": sum(r["embedded"] for r in results),
+                "failed": sum(r["status"] == "failed" for r in results),
+                "seconds": seconds, "persist_seconds": persist_seconds,
+                "docs_per_s": len(docs) / seconds, "chunks_per_s": chunks / seconds,
+            }
+        elif mode == "jobs":
+            # a fresh source so the worker embeds everything again
+            job_docs = [{**d, "source": "bench-jobs", "meta": {**d["meta"], "url": d["meta"]["url"] + "?jobs"}} for d in docs]
+            store = JobStore()
+            pool = IngestWorkerPool(store, workers=1, batch_docs=batch_docs)
+            pool.start()
+            t0 = time.perf_counter()
+            job_id = store.enqueue(job_docs)
+            pool.notify()
+            while store.get(job_id)["status"] not in ("completed", "failed"):
+                time.sleep(0.05)
+            seconds = time.perf_counter() - t0
+            pool.stop()
+            job = store.get(job_id)
+            row = {
+                "mode": mode, "docs": len(docs), "chunks": job["chunks"], "failed": job["failed_docs"],
+                "status": job["status"], "seconds": seconds,
+                "docs_per_s": len(docs) / seconds, "chunks_per_s": job["chunks"] / seconds,
+            }
+        else:
+            raise SystemExit(f"Unknown mode: {mode}")
+        print(f"{mode:9s} {row['docs']} docs / {row['chunks']} chunks in {row['seconds']:.2f}s "
+              f"({row['docs_per_s']:.1f} docs/s, {row['chunks_per_s']:.1f} chunks/s)")
+        rows.append(row)
+
+    write_results("ingest", {"docs": args.docs, "doc_chars": args.doc_chars, "batch_docs": batch_docs,
+                             "seed": args.seed}, rows, args.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+End-to-end POST /query throughput and latency under concurrency, with the LLM
+replaced by a local fake server (benchmarks.common.FakeLLMServer), so the
+numbers reflect embedding, search, rerank, prompt building and scheduling.
+
+By default the app runs in-process (one event loop, like one uvicorn worker)
+on a fresh index of the synthetic corpus. With --url an already running
+server is measured instead; point its LLM_BASE_URL at a fake LLM yourself.
+
+    python -m benchmarks.bench_query --docs 300 --concurrency 1,4,16 --requests 100
+"""
+import asyncio
+import contextlib
+import os
+import time
+from benchmarks.common import FakeLLMServer, base_parser, isolate, percentiles, write_results
+from benchmarks.corpus import make_corpus, make_queries
+
+async def run_level(client, queries, concurrency, n_requests, timeout_ms):
+    sem = asyncio.Semaphore(concurrency)
+    latencies, stage_totals, statuses = [], {}, {}
+
+    async def one(i):
+        async with sem:
+            body = {"query": queries[i % len(queries)]}
+            if timeout_ms:
+                body["timeout_ms"] = timeout_ms
+            t = time.perf_counter()
+            try:
+                resp = await client.post("/query", json=body)
+                status = resp.status_code
+            except Exception:
+                status, resp = "error", None
+            latencies.append(time.perf_counter() - t)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status == 200:
+                for stage, seconds in resp.json().get("debug_info", {}).get("timings", {}).items():
+                    stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n_requests)))
+    wall = time.perf_counter() - t0
+    ok = statuses.get("200", 0)
+    return {
+        "concurrency": concurrency, "requests": n_requests, "statuses": statuses,
+        "qps": n_requests / wall, "latency": percentiles(latencies),
+        "stage_mean_ms": {k: v / ok * 1000 for k, v in stage_totals.items()} if ok else {},
+    }
+
+async def bench(args, levels, queries):
+    import httpx
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=120) as client:
+            for _ in range(600):  # up to 5 minutes for the server's models to load
+                if (await client.get("/ready")).status_code != 503:
+                    break
+                await asyncio.sleep(0.5)
+            return [await run_level(client, queries, c, args.requests, args.timeout_ms) for c in levels]
+
+    from app.main import app
+    from app.ingest import ingest_documents
+    from app import startup
+    async with app.router.lifespan_context(app):
+        if not await asyncio.to_thread(startup.wait):
+            raise SystemExit(f"Startup failed: {startup.readiness()['components']}")
+        docs = make_corpus(args.docs, args.doc_chars, seed=args.seed)
+        for i in range(0, len(docs), 64):
+            ingest_documents(docs[i:i + 64], persist=False)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            # warm-up, and silence the per-request prompt debug prints
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                await run_level(client, queries, 1, 3, args.timeout_ms)
+                rows = []
+                for c in levels:
+                    rows.append(await run_level(client, queries, c, args.requests, args.timeout_ms))
+            return rows
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--docs", type=int, default=300)
+    parser.add_argument("--doc-chars", type=int, default=1500)
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--requests", type=int, default=100, help="requests per concurrency level")
+    parser.add_argument("--timeout-ms", type=int, default=0, help="per-request latency budget (0 = none)")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="fake LLM seconds per call")
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    args = parser.parse_args()
+
+    llm = None
+    if not args.url:
+        isolate(args.workdir)
+        llm = FakeLLMServer(latency=args.llm_latency).start()
+        os.environ.update({"LLM_PROVIDER": "doubao", "LLM_BASE_URL": llm.base_url, "LLM_API_KEY": "bench"})
+
+    levels = [int(c) for c in args.concurrency.split(",")]
+    queries = make_queries(200, seed=args.seed)
+    rows = asyncio.run(bench(args, levels, queries))
+    for row in rows:
+        lat = row["latency"]
+        print(f"concurrency={row['concurrency']:<3d} {row['qps']:.2f} q/s  p50={lat['p50_ms']:.0f}ms "
+              f"p95={lat['p95_ms']:.0f}ms p99={lat['p99_ms']:.0f}ms  statuses={row['statuses']}")
+    if llm is not None:
+        llm.stop()
+
+    write_results("query", {"docs": args.docs, "doc_chars": args.doc_chars, "concurrency": levels,
+                            "requests": args.requests, "timeout_ms": args.timeout_ms,
+                            "llm_latency": args.llm_latency, "url": args.url, "seed": args.seed}, rows, args.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Reranker latency against the number of candidates (top_k) per query.
+
+    python -m benchmarks.bench_rerank --top-k 5,10,20,50 --queries 20
+"""
+import time
+from benchmarks.common import base_parser, isolate, percentiles, write_results
+from benchmarks.corpus import make_corpus, make_queries
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--top-k", default="5,10,20,50")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=8, help="as /query uses")
+    args = parser.parse_args()
+    isolate(args.workdir)
+
+    from app.reranker import load_reranker, rerank
+    from app.utils.chunker import chunk_documents
+
+    load_reranker()
+    docs = make_corpus(100, 1500, seed=args.seed)
+    chunks = [c for cs in chunk_documents([d["text"] for d in docs]) for c in cs]
+    queries = make_queries(args.queries, seed=args.seed)
+    rerank(queries[0], chunks[:args.batch_size], batch_size=args.batch_size)  # warm-up
+
+    rows = []
+    for k in [int(x) for x in args.top_k.split(",")]:
+        samples = []
+        for i, q in enumerate(queries):
+            candidates = [chunks[(i * k + j) % len(chunks)] for j in range(k)]
+            t = time.perf_counter()
+            rerank(q, candidates, batch_size=args.batch_size)
+            samples.append(time.perf_counter() - t)
+        stats = percentiles(samples)
+        rows.append({"top_k": k, "latency": stats, "pairs_per_s": k * len(samples) / sum(samples)})
+        print(f"top_k={k:<4d} p50={stats['p50_ms']:.1f}ms p99={stats['p99_ms']:.1f}ms")
+
+    write_results("rerank", {"top_k": args.top_k, "queries": args.queries, "batch_size": args.batch_size,
+                             "seed": args.seed}, rows, args.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Vector search latency against corpus size and index type, on synthetic
+clustered unit vectors (no embedding model needed).
+  app        - the service's own store: app.vectorstore.search / search_batch,
+               metadata lookup included
+  <factory>  - a raw FAISS index_factory string (e.g. "HNSW32", "IVF256,Flat"),
+               inner product, trained on the data
+
+Index types are separated by ';' since factory strings contain commas:
+
+    python -m benchmarks.bench_search --sizes 1000,10000,100000 --index-types "app;HNSW32;IVF256,Flat"
+"""
+import time
+import numpy as np
+from benchmarks.common import base_parser, isolate, percentiles, write_results
+
+def clustered_vectors(n: int, dim: int, rng: np.random.Generator, clusters: int = 64) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim)).astype("float32")
+    x = centers[rng.integers(0, clusters, n)] + 0.5 * rng.standard_normal((n, dim)).astype("float32")
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    return x
+
+def bench_app(data, queries, k):
+    from app import vectorstore
+    # start from an empty in-memory store; nothing is persisted
+    vectorstore._index, vectorstore._id_to_meta = None, {}
+    vectorstore._rebuild_lookups()
+    t0 = time.perf_counter()
+    for i in range(0, len(data), 50000):
+        block = data[i:i + 50000]
+        vectorstore.apply_changes(block, [{"source": "bench", "id": i + j, "text": ""} for j in range(len(block))],
+                                  persist=False)
+    build = time.perf_counter() - t0
+    single = []
+    for q in queries:
+        t = time.perf_counter()
+        vectorstore.search(q, top_k=k)
+        single.append(time.perf_counter() - t)
+    t = time.perf_counter()
+    vectorstore.search_batch(queries, top_k=k)
+    return build, single, time.perf_counter() - t
+
+def bench_faiss(factory, data, queries, k):
+    import faiss
+    index = faiss.index_factory(data.shape[1], factory, faiss.METRIC_INNER_PRODUCT)
+    t0 = time.perf_counter()
+    if not index.is_trained:
+        index.train(data)
+    index.add(data)
+    build = time.perf_counter() - t0
+    single = []
+    for q in queries:
+        t = time.perf_counter()
+        index.search(q.reshape(1, -1), k)
+        single.append(time.perf_counter() - t)
+    t = time.perf_counter()
+    index.search(queries, k)
+    return build, single, time.perf_counter() - t
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--index-types", default="app", help="';'-separated: app and/or FAISS factory strings")
+    parser.add_argument("--dim", type=int, default=512, help="vector size (bge-small-zh: 512)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20)
+    args = parser.parse_args()
+    isolate(args.workdir)
+
+    rng = np.random.default_rng(args.seed)
+    sizes = [int(s) for s in args.sizes.split(",")]
+    all_data = clustered_vectors(max(sizes), args.dim, rng)
+    queries = clustered_vectors(args.queries, args.dim, rng)
+    rows = []
+    for size in sizes:
+        data = all_data[:size]
+        for index_type in args.index_types.split(";"):
+            if index_type == "app":
+                build, single, batch = bench_app(data, queries, args.k)
+            else:
+                build, single, batch = bench_faiss(index_type, data, queries, args.k)
+            row = {"size": size, "index_type": index_type, "build_seconds": build,
+                   "single": percentiles(single), "batch_qps": len(queries) / batch}
+            print(f"{index_type:12s} n={size:<8d} p50={row['single']['p50_ms']:.3f}ms "
+                  f"p99={row['single']['p99_ms']:.3f}ms batch={row['batch_qps']:.0f} q/s")
+            rows.append(row)
+
+    write_results("search", {"sizes": sizes, "index_types": args.index_types.split(";"), "dim": args.dim,
+                             "queries": args.queries, "k": args.k, "seed": args.seed}, rows, args.out)
+
+if __name__ == "__main__":
+    main()
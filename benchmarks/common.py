@@ -0,0 +1,154 @@
+"""
+Shared benchmark plumbing: an isolated data directory, timing statistics,
+JSON result files tagged with the git commit, and a fake LLM server.
+
+isolate() must run before anything from app is imported: app modules read
+their paths from the environment at import time.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+def isolate(workdir: Optional[str] = None) -> str:
+    """Point the index, job queue and crawler files at a scratch directory."""
+    workdir = workdir or tempfile.mkdtemp(prefix="rag-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    os.environ["FAISS_INDEX_PATH"] = os.path.join(workdir, "faiss_index.bin")
+    os.environ["JOBS_DB_PATH"] = os.path.join(workdir, "ingest_jobs.db")
+    os.environ.setdefault("INGEST_WORKERS", "0")
+    return workdir
+
+def base_parser(description: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--out", help="result JSON path (default: benchmarks/results/<name>-<commit>-<time>.json)")
+    parser.add_argument("--workdir", help="scratch directory for the index (default: a new temp dir)")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds."""
+    if not samples:
+        return {}
+    s = sorted(samples)
+    def pick(q):
+        return s[min(len(s) - 1, int(q * len(s)))] * 1000
+    return {
+        "n": len(s),
+        "mean_ms": sum(s) / len(s) * 1000,
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": s[-1] * 1000,
+    }
+
+def git_info() -> Dict:
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=REPO_ROOT, capture_output=True, text=True, timeout=10).stdout.strip()
+        except Exception:
+            return ""
+    return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+def environment() -> Dict:
+    env = {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+    for mod in ("torch", "faiss", "numpy", "transformers"):
+        try:
+            env[mod] = __import__(mod).__version__
+        except Exception:
+            pass
+    try:
+        import torch
+        env["torch_threads"] = torch.get_num_threads()
+        env["cuda"] = torch.cuda.is_available()
+    except Exception:
+        pass
+    return env
+
+def write_results(name: str, params: Dict, results: List[Dict], out: Optional[str] = None) -> str:
+    """Write one benchmark run as JSON; compare runs with benchmarks/compare.py."""
+    git = git_info()
+    payload = {
+        "benchmark": name,
+        "git": git,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "params": params,
+        "results": results,
+    }
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        commit = (git["commit"] or "nogit")[:10] + ("-dirty" if git["dirty"] else "")
+        out = os.path.join(RESULTS_DIR, f"{name}-{commit}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    print(f"Results written to {out}")
+    return out
+
+
+class FakeLLMServer:
+    """
+    OpenAI-compatible /chat/completions stub on a background thread, so /query
+    benchmarks measure this service rather than a remote model.
+    Each call sleeps `latency` seconds (+/- jitter) plus `per_token` per returned token.
+    """
+    def __init__(self, latency: float = 0.2, jitter: float = 0.05, per_token: float = 0.0, tokens: int = 64):
+        self.latency = latency
+        self.jitter = jitter
+        self.per_token = per_token
+        self.tokens = tokens
+        self.calls = 0
+        self.port = None
+        self._loop = None
+        self._runner = None
+        self._ready = threading.Event()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    async def _chat(self, request):
+        from aiohttp import web
+        body = await request.json()
+        self.calls += 1
+        tokens = min(self.tokens, body.get("max_tokens") or self.tokens)
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)) + tokens * self.per_token)
+        answer = "根据检索到的资料，" + "相关安排请以学院通知为准。" * max(1, tokens // 12)
+        return web.json_response({
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            "usage": {"completion_tokens": tokens},
+        })
+
+    def _serve(self):
+        from aiohttp import web
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._chat)
+        self._runner = web.AppRunner(app, access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        self._loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+
+    def start(self) -> "FakeLLMServer":
+        threading.Thread(target=self._serve, name="fake-llm", daemon=True).start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result(5)
+            self._loop.call_soon_threadsafe(self._loop.stop)
@@ -0,0 +1,49 @@
+"""
+Compare two result files of the same benchmark, e.g. before and after a change:
+
+    python -m benchmarks.compare benchmarks/results/search-abc-....json benchmarks/results/search-def-....json
+
+Rows are matched on their parameters (size, index_type, top_k, concurrency, mode,
+config/param/value);
+every numeric metric is printed with its relative change.
+"""
+import json
+import sys
+
+_KEYS = ("mode", "size", "index_type", "top_k", "concurrency", "config", "param", "value")
+
+def _flatten(row, prefix=""):
+    out = {}
+    for k, v in row.items():
+        if isinstance(v, dict):
+            out.update(_flatten(v, f"{prefix}{k}."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool) and k not in _KEYS:
+            out[prefix + k] = v
+    return out
+
+def _key(row):
+    return tuple((k, row[k]) for k in _KEYS if k in row)
+
+def main():
+    if len(sys.argv) != 3:
+        raise SystemExit(__doc__)
+    old, new = (json.load(open(p, encoding="utf-8")) for p in sys.argv[1:])
+    if old["benchmark"] != new["benchmark"]:
+        raise SystemExit(f"Different benchmarks: {old['benchmark']} vs {new['benchmark']}")
+    print(f"{old['benchmark']}: {(old['git']['commit'] or '?')[:10]} -> {(new['git']['commit'] or '?')[:10]}")
+    new_rows = {_key(r): r for r in new["results"]}
+    for row in old["results"]:
+        key = _key(row)
+        if key not in new_rows:
+            continue
+        print("  " + ", ".join(f"{k}={v}" for k, v in key))
+        before, after = _flatten(row), _flatten(new_rows[key])
+        for metric, a in before.items():
+            b = after.get(metric)
+            if b is None:
+                continue
+            change = f"{(b - a) / a * 100:+.1f}%" if a else "n/a"
+            print(f"    {metric:28s} {a:12.3f} -> {b:12.3f}  {change}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""
+Run the whole suite, each benchmark in its own process (app modules read their
+configuration at import time). --quick uses small sizes for a smoke run.
+
+    python -m benchmarks.run_all [--quick]
+"""
+import subprocess
+import sys
+
+SUITE = {
+    "bench_ingest": ([], ["--docs", "40"]),
+    "bench_search": ([], ["--sizes", "1000,10000"]),
+    "bench_rerank": ([], ["--top-k", "5,20", "--queries", "5"]),
+    "bench_query": ([], ["--docs", "40", "--concurrency", "1,4", "--requests", "20"]),
+}
+
+def main():
+    quick = "--quick" in sys.argv
+    failed = []
+    for module, (full_args, quick_args) in SUITE.items():
+        print(f"== {module}", flush=True)
+        cmd = [sys.executable, "-m", f"benchmarks.{module}", *(quick_args if quick else full_args)]
+        if subprocess.run(cmd).returncode != 0:
+            failed.append(module)
+    if failed:
+        raise SystemExit(f"Failed: {', '.join(failed)}")
+
+if __name__ == "__main__":
+    main()
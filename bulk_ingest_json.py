@@ -1,5 +1,7 @@
 """
-批量导入 JSON，并避免重复处理已经向量化过的文本（按 source 去重）。
+批量导入 JSON。服务端按 source 对比每个分块的内容哈希，只嵌入新增或修改的分块、
+删除（墓碑标记）消失的分块，因此每晚全量重发也只付出增量的代价。
+设置 SKIP_KNOWN_SOURCES = True 可恢复旧行为：跳过索引中已有的 source（不检测修改）。
 支持：单个对象包含 text/content，或数组中对象包含 text/content。
 """
 import asyncio
@@ -13,9 +15,11 @@ import httpx
 from app.config import FAISS_INDEX_PATH
 
 # 配置区域
-INGEST_URL = "http://localhost:8001/ingest"           # 服务地址
+INGEST_URL = "http://localhost:8001/ingest/batch"     # 服务地址（批量入库接口）
+BATCH_DOCS = 32                                       # 每个请求携带的文档数
 DATA_DIR = pathlib.Path("/Users/water/Desktop/docs")  # JSON 目录
 TEXT_KEYS = ("text", "content")                       # 文本字段名
+SKIP_KNOWN_SOURCES = False                            # True: 按 source 跳过已入库文档
 META_PATH = pathlib.Path(str(pathlib.Path(os.path.expanduser(FAISS_INDEX_PATH))) + ".meta.pkl")
 # -------------
 
@@ -38,30 +42,38 @@ def extract_payloads(obj, source_prefix: str) -> List[dict]:
     return payloads
 
 
-async def send_payloads(client: httpx.AsyncClient, payloads: Iterable[dict]) -> Tuple[int, int, list]:
+async def send_payloads(client: httpx.AsyncClient, payloads: List[dict]) -> Tuple[int, int, list]:
+    """按 BATCH_DOCS 分组发送到 /ingest/batch，由服务端合并嵌入批次并一次性提交。"""
     ok = fail = 0
     success_sources = []
-    for p in payloads:
+    for i in range(0, len(payloads), BATCH_DOCS):
+        group = payloads[i:i + BATCH_DOCS]
         try:
-            r = await client.post(INGEST_URL, json=p, timeout=30)
+            r = await client.post(INGEST_URL, json={"documents": group, "sync": True}, timeout=300)
             r.raise_for_status()
-            ok += 1
-            success_sources.append(p["source"])
         except Exception as e:
-            fail += 1
-            print(f"[FAIL] source={p.get('source')} error={e}")
+            fail += len(group)
+            print(f"[FAIL] sources={[p.get('source') for p in group]} error={e}")
+            continue
+        for res in r.json().get("results", []):
+            if res.get("status") == "failed":
+                fail += 1
+                print(f"[FAIL] source={res.get('source')} error={res.get('error')}")
+            else:
+                ok += 1
+                success_sources.append(res.get("source"))
     return ok, fail, success_sources
 
 
 async def ingest_directory():
     processed_sources = set()
     # 仅以已持久化的元数据作为“已处理”判定，避免只请求成功但向量化失败时误判
-    if META_PATH.exists():
+    if SKIP_KNOWN_SOURCES and META_PATH.exists():
         try:
             with META_PATH.open("rb") as f:
                 meta = pickle.load(f)
             for v in meta.values():
-                if isinstance(v, dict) and "source" in v:
+                if isinstance(v, dict) and "source" in v and not v.get("deleted"):
                     processed_sources.add(v["source"])
         except Exception as e:
             print(f"[WARN] 读取已存在元数据失败，无法用于去重：{e}")
@@ -102,17 +114,24 @@ async def ingest_directory():
     total_ok = total_fail = 0
     processed_count = 0
     async with httpx.AsyncClient() as client:
-        for path, payloads in staged:
-            ok, fail, success_sources = await send_payloads(client, payloads)
+        # 跨文件合并 payload，减少请求数与服务端的索引持久化次数
+        pending, pending_files = [], []
+        for n, (path, payloads) in enumerate(staged, 1):
+            pending.extend(payloads)
+            pending_files.append(path.name)
+            if len(pending) < BATCH_DOCS and n < len(staged):
+                continue
+            ok, fail, success_sources = await send_payloads(client, pending)
             total_ok += ok
             total_fail += fail
             processed_count += ok + fail
             remaining = max(total_todo - processed_count, 0)
-            print(f"[DONE] {path.name} sent={ok} failed={fail}")
+            print(f"[DONE] {len(pending_files)} files ({pending_files[0]} .. {pending_files[-1]}) sent={ok} failed={fail}")
             print(f"[PROGRESS] processed={processed_count}/{total_todo} remaining={remaining}")
 
             if ok > 0:
                 processed_sources.update(success_sources)
+            pending, pending_files = [], []
 
     print(f"Finished. sent={total_ok} failed={total_fail}")
 
@@ -9,6 +9,7 @@ from pathlib import Path
 DOCS_DIR = Path("/Users/water/Desktop/docs")
 TOTAL_FILES = 927
 BASE_URL = "http://localhost:8001"
+BATCH_DOCS = 32  # documents per /ingest/batch request
 
 def extract_text(obj) -> str:
     """Extract text from dict or list of dicts."""
@@ -65,43 +66,56 @@ def main():
         return
 
     print("4. Starting batch ingestion...")
-    # Process one by one, but wait for server to finish (sync=True)
-    # This effectively batches them because we wait for the previous one.
+    # Send BATCH_DOCS documents per request; the server pools their chunks into
+    # shared embedding batches and commits the index once per request.
     
     success_count = 0
     fail_count = 0
-    
-    for idx, file_path in enumerate(missing_files, 1):
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            
-            text = extract_text(data)
-            if not text.strip():
-                print(f"[{idx}/{len(missing_files)}] Skipping {file_path.name}: Empty text.")
-                continue
+    batch = []
 
-            payload = {
-                "text": text,
-                "source": file_path.name,
-                "sync": True  # Tell server to wait until done
-            }
-            
-            print(f"[{idx}/{len(missing_files)}] Ingesting {file_path.name}...", end="", flush=True)
-            
+    def send(batch):
+        nonlocal success_count, fail_count
+        names = [d["source"] for d in batch]
+        print(f"Ingesting {len(batch)} files ({names[0]} .. {names[-1]})...", end="", flush=True)
+        try:
             # Long timeout because embedding can take time
-            resp = httpx.post(f"{BASE_URL}/ingest", json=payload, timeout=120)
+            resp = httpx.post(f"{BASE_URL}/ingest/batch", json={"documents": batch, "sync": True}, timeout=600)
             resp.raise_for_status()
-            
-            print(f" Done. ({resp.json().get('ingested_chunks_count')} chunks)")
-            success_count += 1
-            
+            data = resp.json()
+            print(f" Done. ({data.get('ingested_chunks_count')} chunks)")
+            for res in data.get("results", []):
+                if res.get("status") == "failed":
+                    print(f"   Failed {res.get('source')}: {res.get('error')}")
+                    fail_count += 1
+                else:
+                    success_count += 1
         except Exception as e:
             print(f" Failed: {e}")
-            fail_count += 1
+            fail_count += len(batch)
             # Optional: sleep a bit on error
             time.sleep(1)
 
+    for idx, file_path in enumerate(missing_files, 1):
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"[{idx}/{len(missing_files)}] Failed to read {file_path.name}: {e}")
+            fail_count += 1
+            continue
+
+        text = extract_text(data)
+        if not text.strip():
+            print(f"[{idx}/{len(missing_files)}] Skipping {file_path.name}: Empty text.")
+            continue
+
+        batch.append({"text": text, "source": file_path.name})
+        if len(batch) >= BATCH_DOCS:
+            send(batch)
+            batch = []
+    if batch:
+        send(batch)
+
     print(f"\nJob complete. Success: {success_count}, Failed: {fail_count}")
 
 if __name__ == "__main__":
@@ -1,5 +1,10 @@
 import os
-from app.crawler.parser import NJUParser
+import time
+import chardet
+from app.crawler.parser import NJUParser, parse_list_bytes, parse_detail_bytes
+from app.crawler.utils import detect_charset
+
+LIST_URL = "https://is.nju.edu.cn/57162/list.htm"
 
 def test_parser():
     # Test List Page
@@ -10,7 +15,7 @@ def test_parser():
             html = f.read()
         
         print(f"Parsing list page (Length: {len(html)})...")
-        articles = NJUParser.parse_list_page(html, "https://is.nju.edu.cn/57162/list.htm")
+        articles = NJUParser.parse_list_page(html, LIST_URL)
         
         print(f"Found {len(articles)} articles.")
         if articles:
@@ -34,9 +39,58 @@ def test_parser():
         print("Detail page sample:")
         print(f"  Title: {detail['title']}")
         print(f"  Date (from meta): {detail['publish_date']}")
-        print(f"  Content Length: {len(detail['content_html'])}")
+        print(f"  Content Length: {len(detail['content'])}")
     else:
         print(f"{detail_file} not found.")
 
+def _bench(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+def test_parser_benchmark(iterations: int = 5):
+    """
+    Parser benchmark over the saved pages: bytes in, articles / clean text out,
+    which is exactly what a crawler parse worker runs per page.
+    """
+    pages = [f for f in ("list_page.html", "detail_page.html") if os.path.exists(f)]
+    if not pages:
+        print("No saved pages found, skipping benchmark.")
+        return
+    for name in pages:
+        with open(name, "rb") as f:
+            body = f.read()
+        if name.startswith("list"):
+            result = parse_list_bytes(body, LIST_URL)
+            assert result and all(a["url"] and a["title"] for a in result)
+            per_page = _bench(lambda: parse_list_bytes(body, LIST_URL), iterations)
+        else:
+            result = parse_detail_bytes(body)
+            assert result["title"] and result["content"]
+            assert "<" not in result["content"]
+            per_page = _bench(lambda: parse_detail_bytes(body), iterations)
+        assert detect_charset(body) == "utf-8"
+        charset = _bench(lambda: detect_charset(body), iterations)
+        chardet_full = _bench(lambda: chardet.detect(body), max(1, iterations // 5))
+        print(f"{name}: {len(body) / 1024:.0f} KB, parse {per_page * 1000:.1f} ms/page "
+              f"({1 / per_page:.0f} pages/s); charset {charset * 1e6:.0f} us "
+              f"vs chardet {chardet_full * 1000:.1f} ms")
+
+def test_parser_xml_declaration_and_empty_body():
+    body = ('<?xml version="1.0" encoding="utf-8"?>\n<html><body>'
+            '<div class="arti_title">标题</div><div class="arti_metas">发布时间：2024-05-01</div>'
+            '<div class="wp_articlecontent"><p>正文内容</p></div>'
+            '<ul class="news_list"><li><a href="/a.htm" title="通知">通知</a><span class="date">2024-05-01</span></li></ul>'
+            '</body></html>')
+    detail = parse_detail_bytes(body.encode("utf-8"))
+    assert detail["title"] == "标题" and detail["content"] == "正文内容" and detail["publish_date"] == "2024-05-01"
+    assert [a["title"] for a in parse_list_bytes(body.encode("utf-8"), LIST_URL)] == ["通知"]
+    for empty in (b"", b"  \n", b"<!-- nothing -->"):
+        assert parse_list_bytes(empty, LIST_URL) == []
+        assert parse_detail_bytes(empty)["content"] == ""
+
 if __name__ == "__main__":
     test_parser()
+    print()
+    test_parser_benchmark(iterations=100)
@@ -0,0 +1,90 @@
+import asyncio
+import time
+import aiohttp
+from aiohttp import web
+from app.crawler.scheduler import HostScheduler
+
+async def _start_stub(max_inflight: int, crawl_delay: float = 0.0):
+    """Local HTTP stub that answers 429 above max_inflight concurrent requests."""
+    stats = {"inflight": 0, "peak": 0, "ok": 0, "rejected": 0, "starts": []}
+
+    async def page(request):
+        stats["starts"].append(time.monotonic())
+        if stats["inflight"] >= max_inflight:
+            stats["rejected"] += 1
+            return web.Response(status=429, headers={"Retry-After": "0"})
+        stats["inflight"] += 1
+        stats["peak"] = max(stats["peak"], stats["inflight"])
+        try:
+            await asyncio.sleep(0.02)
+            stats["ok"] += 1
+            return web.Response(text="<html>ok</html>", content_type="text/html")
+        finally:
+            stats["inflight"] -= 1
+
+    async def robots(request):
+        lines = ["User-agent: *", "Disallow: /private/"]
+        if crawl_delay:
+            lines.append(f"Crawl-delay: {crawl_delay}")
+        return web.Response(text="\n".join(lines))
+
+    app = web.Application()
+    app.router.add_get("/robots.txt", robots)
+    app.router.add_get("/{name}", page)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}", stats
+
+async def _crawl(scheduler, session, urls):
+    async def fetch(url):
+        while True:
+            async with scheduler.slot(url) as outcome:
+                async with session.get(url) as resp:
+                    outcome["status"] = resp.status
+                    outcome["retry_after"] = resp.headers.get("Retry-After")
+                    if resp.status == 200:
+                        return await resp.text()
+    return await asyncio.gather(*(fetch(u) for u in urls))
+
+def test_scheduler_backs_off_on_429():
+    async def main():
+        runner, base, stats = await _start_stub(max_inflight=2)
+        scheduler = HostScheduler()
+        for state in [scheduler.host_state(base)]:
+            state.min_delay = state.delay = 0.0
+        try:
+            async with aiohttp.ClientSession() as session:
+                pages = await _crawl(scheduler, session, [f"{base}/p{i}" for i in range(60)])
+        finally:
+            await runner.cleanup()
+        host = scheduler.stats()[0]
+        print(f"peak={stats['peak']} rejected={stats['rejected']} host={host}")
+        assert len(pages) == 60 and stats["ok"] == 60
+        assert host["throttled"] == stats["rejected"]
+        # AIMD keeps probing, but settles around the server's limit
+        assert host["window"] <= 4
+        assert stats["rejected"] < 30
+    asyncio.run(main())
+
+def test_scheduler_respects_robots():
+    async def main():
+        runner, base, stats = await _start_stub(max_inflight=10, crawl_delay=0.1)
+        scheduler = HostScheduler()
+        try:
+            async with aiohttp.ClientSession() as session:
+                assert not await scheduler.allowed(session, f"{base}/private/x")
+                assert await scheduler.allowed(session, f"{base}/p0")
+                await _crawl(scheduler, session, [f"{base}/p{i}" for i in range(6)])
+        finally:
+            await runner.cleanup()
+        gaps = [b - a for a, b in zip(stats["starts"], stats["starts"][1:])]
+        assert scheduler.stats()[0]["min_delay"] == 0.1
+        assert min(gaps) >= 0.1 * 0.85
+    asyncio.run(main())
+
+if __name__ == "__main__":
+    test_scheduler_backs_off_on_429()
+    test_scheduler_respects_robots()